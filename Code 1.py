@@ -6,56 +6,116 @@ This script processes an HTSeq-count formatted RNA-seq file to:
 1. Compute log2CPM expression values
 2. Identify genes annotated with lipid-related GO Biological Process terms
 3. Export log2CPM values of lipid-related genes with nonzero expression
+
+Set COHORT_SOURCE to a directory or glob of HTSeq files to ingest a whole
+cohort at once: files are parsed in parallel into a memory-mapped
+genes x samples matrix (see htseq_ingest.py) and log2CPM is computed for all
+samples in one vectorized pass.
+
+GO:BP annotations are read from a local SQLite store (see go_annotation.py)
+loaded from a mygene dump file; only genes absent from the store are queried,
+concurrently and with retries, from mygene.info.
 """
 
 # 1. Install required library (if running in Colab)
-# !pip install mygene
+# !pip install pandas numpy
 
 # 2. Import libraries
+import os
+
 import pandas as pd
 import numpy as np
-from mygene import MyGeneInfo
-from google.colab import files
-
-# 3. Upload the HTSeq count file
-uploaded = files.upload()
-file_name = list(uploaded.keys())[0]
-
-# 4. Parse the HTSeq-formatted counts into a DataFrame
-with open(file_name, 'r') as f:
-    lines = f.readlines()
-
-split_rows = [line.strip().split() for line in lines if line.strip() and not line.startswith("__")]
-df = pd.DataFrame(split_rows, columns=["Gene_ID", "raw_count"])
-df["raw_count"] = pd.to_numeric(df["raw_count"], errors='coerce').fillna(0)
-
-# 5. Compute log2CPM values
-total = df["raw_count"].sum()
-df["CPM"] = df["raw_count"] / total * 1e6
-df["log2CPM"] = np.log2(df["CPM"] + 1)
-
-# 6. Clean Ensembl IDs by removing version suffix
-df["Gene_ID_clean"] = df["Gene_ID"].str.split(".").str[0]
-gene_ids = df["Gene_ID_clean"].tolist()
-
-# 7. Identify lipid-related genes using mygene.info (GO:BP)
-mg = MyGeneInfo()
-lipid_related = []
-for i in range(0, len(gene_ids), 100):  # batch query to avoid overload
-    batch = gene_ids[i:i+100]
-    res = mg.querymany(batch, scopes="ensembl.gene", fields="go.BP.term", species="human")
-    for r in res:
-        terms = r.get("go", {}).get("BP", [])
-        if isinstance(terms, dict): terms = [terms]
-        for t in terms:
-            if "lipid" in t["term"].lower():
-                lipid_related.append(r["query"])
-                break
-
-# 8. Filter for lipid-related genes with non-zero log2CPM
-filtered_df = df[df["Gene_ID_clean"].isin(lipid_related) & (df["log2CPM"] != 0)]
-
-# 9. Export result
-output_file = "lipid_related_log2cpm_nonzero.csv"
-filtered_df[["Gene_ID", "log2CPM"]].to_csv(output_file, index=False)
-files.download(output_file)
+
+from config import DATA_DIR
+from go_annotation import AnnotationClient, GOAnnotationStore, lipid_related_genes
+from instrumentation import step
+
+COHORT_SOURCE = os.environ.get("LIPID_COHORT_SOURCE")   # e.g. "/content/htseq/*.txt"; None = single uploaded file
+COHORT_DIR = f"{DATA_DIR}/cohort_matrix"
+
+if COHORT_SOURCE is None:
+    from google.colab import files
+
+    # 3. Upload the HTSeq count file
+    step("3. Upload the HTSeq count file")
+    uploaded = files.upload()
+    file_name = list(uploaded.keys())[0]
+
+    # 4. Parse the HTSeq-formatted counts into a DataFrame
+    step("4. Parse the HTSeq-formatted counts into a DataFrame")
+    with open(file_name, 'r') as f:
+        lines = f.readlines()
+
+    split_rows = [line.strip().split() for line in lines if line.strip() and not line.startswith("__")]
+    df = pd.DataFrame(split_rows, columns=["Gene_ID", "raw_count"])
+    df["raw_count"] = pd.to_numeric(df["raw_count"], errors='coerce').fillna(0)
+
+    # 5. Compute log2CPM values
+    step("5. Compute log2CPM values")
+    total = df["raw_count"].sum()
+    df["CPM"] = df["raw_count"] / total * 1e6
+    df["log2CPM"] = np.log2(df["CPM"] + 1)
+
+    # 6. Clean Ensembl IDs by removing version suffix
+    step("6. Clean Ensembl IDs by removing version suffix")
+    df["Gene_ID_clean"] = df["Gene_ID"].str.split(".").str[0]
+    gene_ids = df["Gene_ID_clean"].tolist()
+else:
+    from htseq_ingest import ingest_cohort
+
+    # 3-5. Parse all HTSeq files in parallel into one count matrix and compute log2CPM
+    step("3-5. Parse all HTSeq files in parallel into one count matrix and compute log2CPM")
+    cohort = ingest_cohort(COHORT_SOURCE, COHORT_DIR)
+    print(f"Ingested {len(cohort['samples'])} samples x {len(cohort['genes'])} genes into {COHORT_DIR}")
+
+    # 6. Clean Ensembl IDs by removing version suffix
+    step("6. Clean Ensembl IDs by removing version suffix")
+    gene_ids_raw = pd.Index(cohort["genes"])
+    gene_ids_clean = gene_ids_raw.str.split(".").str[0]
+    gene_ids = gene_ids_clean.unique().tolist()
+
+# 7. Identify lipid-related genes (GO:BP) from the local annotation store;
+#    only genes missing from the store are queried on mygene.info
+step("7. Identify lipid-related genes")
+ANNOTATION_DB = f"{DATA_DIR}/go_bp_annotation.sqlite"
+ANNOTATION_DUMP = f"{DATA_DIR}/go_bp_dump.jsonl"   # mygene hits, one JSON object per line
+ANNOTATION_VERSION = None                       # None = content hash of the dump file
+
+store = GOAnnotationStore(ANNOTATION_DB)
+if os.path.exists(ANNOTATION_DUMP):
+    store.refresh(ANNOTATION_DUMP, ANNOTATION_VERSION)
+
+# Concurrent, retrying batch queries; finished batches are cached in the store,
+# so a rerun only re-queries IDs that failed
+failed_ids = AnnotationClient(store, max_workers=4).annotate(gene_ids)
+if failed_ids:
+    print(f"Warning: {len(failed_ids)} genes could not be annotated; rerun to retry them.")
+
+lipid_related = lipid_related_genes(store, gene_ids, keyword="lipid")
+store.close()
+
+if COHORT_SOURCE is None:
+    # 8. Filter for lipid-related genes with non-zero log2CPM
+    step("8. Filter for lipid-related genes with non-zero log2CPM")
+    filtered_df = df[df["Gene_ID_clean"].isin(lipid_related) & (df["log2CPM"] != 0)]
+
+    # 9. Export result
+    step("9. Export result")
+    output_file = "lipid_related_log2cpm_nonzero.csv"
+    filtered_df[["Gene_ID", "log2CPM"]].to_csv(output_file, index=False)
+    files.download(output_file)
+else:
+    # 8. Keep lipid-related genes with non-zero log2CPM in at least one sample
+    step("8. Keep lipid-related genes with non-zero log2CPM in at least one sample")
+    log2cpm = cohort["log2cpm"]
+    rows = np.flatnonzero(gene_ids_clean.isin(lipid_related))
+    lipid_matrix = np.asarray(log2cpm[rows, :])
+    keep = (lipid_matrix != 0).any(axis=1)
+    filtered_df = pd.DataFrame(lipid_matrix[keep], index=gene_ids_raw[rows[keep]], columns=cohort["samples"])
+    filtered_df.index.name = "Gene_ID"
+
+    # 9. Export result (genes x samples)
+    step("9. Export result")
+    output_file = f"{COHORT_DIR}/lipid_related_log2cpm_matrix.csv"
+    filtered_df.to_csv(output_file)
+    print(f"Lipid-related log2CPM matrix saved to '{output_file}'.")
@@ -7,31 +7,58 @@ computes feature importance averaged over multiple runs.
 
 import pandas as pd
 import numpy as np
-import lightgbm as lgb
 from sklearn.preprocessing import StandardScaler
 
+from config import DATA_DIR
+from excel_cache import read_excel_cached
+from feature_screen import screen_features
+from instrumentation import section, step
+from lgbm_importance import ImportanceEngine, importance_summary
+
 # 1. Load gene expression data
-gen_expr_path = "/content/1213_gen.xlsx"
-gen_df = pd.read_excel(gen_expr_path, index_col=0)
+step("1. Load gene expression data")
+gen_expr_path = f"{DATA_DIR}/1213_gen.xlsx"
+gen_df = read_excel_cached(gen_expr_path, index_col=0)
 gen_df = gen_df.drop(index="grup", errors='ignore')  # 'grup' satırı varsa kaldır
 gen_df.columns = [str(col) for col in gen_df.columns]
 gen_df = gen_df.T  # Satırlar: örnekler, sütunlar: genler
 
+# Optional: pre-screen genes before training. Near-constant, rarely detected and
+# highly correlated genes (|r| >= PRESCREEN_MAX_CORR with a higher-variance gene)
+# are dropped; each dropped gene and its representative are listed in the CSV
+PRESCREEN = False
+PRESCREEN_MIN_VARIANCE = 1e-8
+PRESCREEN_MIN_DETECTION = 0.0     # minimum fraction of samples with expression > 0
+PRESCREEN_MAX_CORR = 0.95
+
+if PRESCREEN:
+    with section("Pre-screen genes"):
+        kept, dropped = screen_features(gen_df.values.T, gen_df.columns, min_variance=PRESCREEN_MIN_VARIANCE,
+                                        min_detection=PRESCREEN_MIN_DETECTION, max_corr=PRESCREEN_MAX_CORR)
+    print(f"Pre-screening kept {len(kept)} of {gen_df.shape[1]} genes")
+    dropped.to_csv(f"{DATA_DIR}/lgbm_prescreen_dropped_genes.csv")
+    gen_df = gen_df[kept]
+
 # 2. Load lipid accumulation and degradation scores
-lipid_accum_df = pd.read_excel("/content/lipid_birikim_zscore.xlsx", index_col=0)
-lipid_degrad_df = pd.read_excel("/content/lipid_catabolic_scores.xlsx", index_col=0)
+step("2. Load lipid accumulation and degradation scores")
+lipid_accum_df = read_excel_cached(f"{DATA_DIR}/lipid_birikim_zscore.xlsx", index_col=0)
+lipid_degrad_df = read_excel_cached(f"{DATA_DIR}/lipid_catabolic_scores.xlsx", index_col=0)
 
 # 3. Select common samples
+step("3. Select common samples")
 common_samples_accum = gen_df.index.intersection(lipid_accum_df.index)
 common_samples_degrad = gen_df.index.intersection(lipid_degrad_df.index)
 
 X_accum = gen_df.loc[common_samples_accum]
-y_accum = lipid_accum_df.loc[common_samples_accum].iloc[:, 0]
+accum_column = "Z_Score" if "Z_Score" in lipid_accum_df.columns else lipid_accum_df.columns[0]   # Code 6 output
+y_accum = lipid_accum_df.loc[common_samples_accum, accum_column]
 
 X_degrad = gen_df.loc[common_samples_degrad]
-y_degrad = lipid_degrad_df.loc[common_samples_degrad].iloc[:, 0]
+degrad_column = "Z_Score" if "Z_Score" in lipid_degrad_df.columns else lipid_degrad_df.columns[0]   # Code 7 output
+y_degrad = lipid_degrad_df.loc[common_samples_degrad, degrad_column]
 
 # 4. Standardize features
+step("4. Standardize features")
 scaler = StandardScaler()
 X_accum_scaled = pd.DataFrame(scaler.fit_transform(X_accum), index=X_accum.index, columns=X_accum.columns)
 X_degrad_scaled = pd.DataFrame(scaler.fit_transform(X_degrad), index=X_degrad.index, columns=X_degrad.columns)
@@ -63,31 +90,60 @@ params_degrad = {
     'metric': 'rmse'
 }
 
-# 6. Train models N times to average feature importance
+# 6. Train models N times to average feature importance. Each target is binned
+#    once into a LightGBM Dataset shared by all seed runs; the runs are spread
+#    over worker processes and their importances gathered as runs x genes arrays
+step("6. Train models N times to average feature importance")
 N = 30
 random_state = 42
-
-importance_accum = pd.Series(0, index=X_accum.columns, dtype=float)
-importance_degrad = pd.Series(0, index=X_degrad.columns, dtype=float)
-
-for i in range(N):
-    model_accum = lgb.LGBMRegressor(**params_accum, random_state=random_state + i)
-    model_accum.fit(X_accum_scaled, y_accum)
-    importance_accum += pd.Series(model_accum.feature_importances_, index=X_accum.columns)
-
-    model_degrad = lgb.LGBMRegressor(**params_degrad, random_state=random_state + i)
-    model_degrad.fit(X_degrad_scaled, y_degrad)
-    importance_degrad += pd.Series(model_degrad.feature_importances_, index=X_degrad.columns)
-
-importance_accum /= N
-importance_degrad /= N
+N_JOBS = None                                  # None = all cores
+WORK_DIR = f"{DATA_DIR}/lgbm_importance_run"      # binary LightGBM Datasets
+IMPORTANCE_TYPE = "split"                      # "split" (split counts), "gain" or "shap" (mean |TreeSHAP|)
+
+# Adaptive mode: add seeds in batches and stop once the top-50 genes of each
+# target agree between consecutive batches (at most N runs per target)
+ADAPTIVE = False
+STABILITY_CRITERION = "overlap"                # "overlap" (top-50 overlap) or "spearman"
+STABILITY_TOL = 0.95
+STABILITY_PATIENCE = 2                         # consecutive stable batches required
+STABILITY_BATCH = 4                            # seed runs per batch (independent of N_JOBS)
+
+with ImportanceEngine(WORK_DIR, n_jobs=N_JOBS) as engine:
+    with section("Bin datasets"):
+        engine.add_target("accumulation", X_accum_scaled, y_accum, params_accum)
+        engine.add_target("degradation", X_degrad_scaled, y_degrad, params_degrad)
+    runs = {}
+    for target in ("accumulation", "degradation"):
+        with section(f"Train {target} models"):
+            if ADAPTIVE:
+                runs[target] = engine.run_adaptive(target, first_seed=random_state, max_runs=N,
+                                                   importance=IMPORTANCE_TYPE, top_k=50,
+                                                   criterion=STABILITY_CRITERION, tol=STABILITY_TOL,
+                                                   patience=STABILITY_PATIENCE, batch_size=STABILITY_BATCH)
+                status = "converged" if runs[target]["converged"] else "not converged"
+                print(f"{target}: {len(runs[target]['seeds'])} runs ({status})")
+            else:
+                runs[target] = engine.run(target, range(random_state, random_state + N),
+                                          shap=IMPORTANCE_TYPE == "shap")
+runs_accum = runs["accumulation"]
+runs_degrad = runs["degradation"]
+
+# Per-gene mean importance, variance and rank stability across the runs
+summary_accum = importance_summary(runs_accum[IMPORTANCE_TYPE], X_accum.columns)
+summary_degrad = importance_summary(runs_degrad[IMPORTANCE_TYPE], X_degrad.columns)
+importance_accum = summary_accum["Importance"]
+importance_degrad = summary_degrad["Importance"]
 
 # 7. Select top 50 genes by importance
+step("7. Select top 50 genes by importance")
 top_50_accum = importance_accum.sort_values(ascending=False).head(50)
 top_50_degrad = importance_degrad.sort_values(ascending=False).head(50)
 
 # 8. Save results to Excel
-top_50_accum.to_frame(name="Importance").to_excel("/content/top_50_genes_lipid_accumulation.xlsx")
-top_50_degrad.to_frame(name="Importance").to_excel("/content/top_50_genes_lipid_degradation.xlsx")
+step("8. Save results to Excel")
+top_50_accum.to_frame(name="Importance").to_excel(f"{DATA_DIR}/top_50_genes_lipid_accumulation.xlsx")
+top_50_degrad.to_frame(name="Importance").to_excel(f"{DATA_DIR}/top_50_genes_lipid_degradation.xlsx")
+summary_accum.sort_values("Importance", ascending=False).to_csv(f"{DATA_DIR}/importance_stability_lipid_accumulation.csv")
+summary_degrad.sort_values("Importance", ascending=False).to_csv(f"{DATA_DIR}/importance_stability_lipid_degradation.csv")
 
 print("Top genes saved to Excel files.")
@@ -6,50 +6,114 @@ This script infers putative regulatory interactions among lipid-associated genes
 by fitting Lasso regression models to gene expression data (log2CPM matrix).
 """
 
+import os
+
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LassoCV
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from config import DATA_DIR
+from excel_cache import read_excel_cached
+from feature_screen import screen_features
+from instrumentation import section, step
+from lasso_network import all_nodes_lasso, infer_network, stability_selection
+from network_io import save_network, top_degree_genes
+
 # 1. Load pre-processed gene expression data (rows = genes, columns = samples)
-file_path = "/content/LOG2CPM Data.xlsx"
-df = pd.read_excel(file_path, index_col=0)
+#    (LIPID_EXPRESSION_FILE may point to another .xlsx or a .csv, e.g. the cohort
+#    matrix written by Code 1)
+step("1. Load pre-processed gene expression data")
+file_path = os.environ.get("LIPID_EXPRESSION_FILE", f"{DATA_DIR}/LOG2CPM Data.xlsx")
+if file_path.endswith(".csv"):
+    df = pd.read_csv(file_path, index_col=0)
+else:
+    df = read_excel_cached(file_path, index_col=0)   # parsed once, then read from the columnar cache
+
+# Optional: pre-screen genes before fitting. Near-constant, rarely detected and
+# highly correlated genes (|r| >= PRESCREEN_MAX_CORR with a higher-variance gene)
+# are dropped; each dropped gene and its representative are listed in the CSV
+PRESCREEN = False
+PRESCREEN_MIN_VARIANCE = 1e-8
+PRESCREEN_MIN_DETECTION = 0.0     # minimum fraction of samples with log2CPM > 0
+PRESCREEN_MAX_CORR = 0.95
+
+if PRESCREEN:
+    with section("Pre-screen genes"):
+        kept, dropped = screen_features(df.values, df.index, min_variance=PRESCREEN_MIN_VARIANCE,
+                                        min_detection=PRESCREEN_MIN_DETECTION, max_corr=PRESCREEN_MAX_CORR)
+    print(f"Pre-screening kept {len(kept)} of {len(df)} genes")
+    dropped.to_csv(f"{DATA_DIR}/lasso_prescreen_dropped_genes.csv")
+    df = df.loc[kept]
 
 # 2. Convert to NumPy array
+step("2. Convert to NumPy array")
 X = df.values
 genes = df.index.tolist()
 n_genes = X.shape[0]
 
-# 3. Initialize the interaction matrix
-interaction_matrix = np.zeros((n_genes, n_genes))
-
-# 4. Fit Lasso regression per gene
-for i in range(n_genes):
-    y = X[i, :]
-    X_other = np.delete(X, i, axis=0).T
+# 3. Parallel inference settings (N_JOBS = 1 reproduces the serial loop exactly)
+SOLVER = "lassocv"                              # "lassocv" = per-gene LassoCV, "gram" = all-nodes Gram solver
+N_JOBS = None                                   # None = all cores
+WORK_DIR = f"{DATA_DIR}/lasso_network_run"         # shared memmaps + completed rows (resumable)
+lasso_params = {"cv": 5, "random_state": 42, "max_iter": 5000}
 
-    model = LassoCV(cv=5, random_state=42, max_iter=5000)
-    model.fit(X_other, y)
-    coefs = model.coef_
-
-    # Insert coefficients (symmetric matrix)
-    interaction_matrix[i, :i] = coefs[:i]
-    interaction_matrix[i, i+1:] = coefs[i:]
+# 4. Fit Lasso regression per gene across a process pool; coefficient rows are
+#    written to the interaction matrix as they finish (see lasso_network.py).
+#    The "gram" solver shares the fold Gram matrices and alpha paths across all
+#    genes and matches LassoCV up to the solver tolerance.
+step("4. Fit Lasso regression per gene across a process pool")
+if SOLVER == "gram":
+    interaction_matrix, best_alphas = all_nodes_lasso(X, cv=lasso_params["cv"],
+                                                      max_iter=lasso_params["max_iter"], n_jobs=N_JOBS)
+else:
+    interaction_matrix = infer_network(X, WORK_DIR, n_jobs=N_JOBS, lasso_params=lasso_params)
 
 # 5. Convert to DataFrame for readability
+step("5. Convert to DataFrame for readability")
 interaction_df = pd.DataFrame(interaction_matrix, index=genes, columns=genes)
 
 # 6. Report number of non-zero interactions
+step("6. Report number of non-zero interactions")
 nonzero_count = (interaction_df != 0).sum().sum()
 print(f"Number of non-zero interactions: {nonzero_count}")
 
-# 7. Optional: visualize as heatmap
-plt.figure(figsize=(14, 12))
-sns.heatmap(interaction_df, cmap='coolwarm', center=0)
-plt.title("Gene–Gene Interaction Matrix Inferred by Lasso Regression")
-plt.tight_layout()
-plt.show()
+# 7. Optional: visualize as heatmap (restricted to the most connected genes)
+step("7. Optional: visualize as heatmap")
+PLOT_HEATMAP = True
+HEATMAP_MAX_GENES = 200
+
+if PLOT_HEATMAP:
+    shown = top_degree_genes(interaction_matrix, HEATMAP_MAX_GENES)
+    plt.figure(figsize=(14, 12))
+    sns.heatmap(interaction_df.iloc[shown, shown], cmap='coolwarm', center=0)
+    title = "Gene–Gene Interaction Matrix Inferred by Lasso Regression"
+    if len(shown) < n_genes:
+        title += f" (top {len(shown)} of {n_genes} genes by degree)"
+    plt.title(title)
+    plt.tight_layout()
+    plt.show()
+
+# 8. Export as sparse network (CSR .npz, read by Code 3 and Code 4);
+#    the dense CSV is only written on request
+step("8. Export as sparse network")
+EXPORT_DENSE_CSV = False
+
+save_network(f"{DATA_DIR}/lasso_genetic_network.npz", interaction_matrix, genes)
+if EXPORT_DENSE_CSV:
+    interaction_df.to_csv(f"{DATA_DIR}/lasso_genetic_network.csv")
+
+# 9. Optional: bootstrap/subsample stability selection for edge confidence.
+#    Resampled fits run across a process pool; only running selection counts are
+#    kept, so memory does not grow with the number of resamples.
+step("9. Optional: bootstrap/subsample stability selection for edge confidence")
+STABILITY_RESAMPLES = 0        # e.g. 100; 0 = skip
+STABILITY_THRESHOLD = 0.6      # minimum selection frequency of a consensus edge
 
-# 8. Export as CSV
-interaction_df.to_csv("/content/lasso_genetic_network.csv")
+if STABILITY_RESAMPLES:
+    stability = stability_selection(X, n_resamples=STABILITY_RESAMPLES, method="subsample",
+                                    threshold=STABILITY_THRESHOLD, solver=SOLVER,
+                                    lasso_params=lasso_params, n_jobs=N_JOBS)
+    print(f"Consensus edges (frequency >= {STABILITY_THRESHOLD}): {(stability['consensus'] != 0).sum()}")
+    save_network(f"{DATA_DIR}/lasso_edge_frequency.npz", stability["frequency"], genes)
+    save_network(f"{DATA_DIR}/lasso_consensus_network.npz", stability["consensus"], genes)
@@ -6,51 +6,67 @@ Simulates gene expression dynamics under continuous inhibition of each gene
 using an ODE model with sigmoid activation and passive decay.
 """
 
-import numpy as np
 import pandas as pd
 
-# 1. Load the gene–gene interaction matrix from Lasso regression
-interaction_df = pd.read_csv('/content/lasso_genetic_network.csv', index_col=0)
-W = interaction_df.values
-genes = interaction_df.index.tolist()
+from config import DATA_DIR
+from instrumentation import step
+from network_io import load_network
+from ode_simulation import prepare_network, record_steps, simulate_knockouts
+from trajectory_store import TrajectoryStore, TrajectoryWriter, unique_sheet_names
+
+# 1. Load the gene–gene interaction matrix from Lasso regression (sparse .npz
+#    written by Code 2; a dense .csv/.xlsx network is also accepted)
+step("1. Load the gene–gene interaction matrix from Lasso regression")
+W, genes = load_network(f'{DATA_DIR}/lasso_genetic_network.npz', as_sparse=True)
 n_genes = len(genes)
 
+# Sparse networks (density < 5%) are simulated with a CSR kernel; the structure
+# is built once here and reused by every run
+W = prepare_network(W)
+
 # 2. Define simulation parameters
 decay_rate = 1.0   # Decay rate λ in dx/dt = -λx + σ(Wx)
 dt = 0.1           # Time step for Euler integration
 time_steps = 100   # Number of time points to simulate
+SEED = 42          # Per-gene reproducible initial states (None = global NumPy RNG)
+CHUNK_SIZE = 256   # Knockouts advanced together in one state matrix
+RECORD_EVERY = 1   # Keep every k-th time step, or "final" for the final state only
+METHOD = "euler"   # "euler" (fixed step), "rk45" (adaptive) or "steady" (needs RECORD_EVERY = "final")
+STEADY_TOL = None  # e.g. 1e-6: stop a run once max |dx/dt| < STEADY_TOL
 
-# 3. Sigmoid activation function
-def sigmoid(z):
-    return 1 / (1 + np.exp(-z))
-
-# 4. ODE simulation function with continuous inhibition of a gene
-def simulate_ode(W, inhibited_idx):
-    x = np.random.rand(n_genes)       # Initial expression (random)
-    x[inhibited_idx] = 0.0            # Set inhibited gene expression to zero
-    traj = np.zeros((time_steps, n_genes))
-
-    for t in range(time_steps):
-        dxdt = -decay_rate * x + sigmoid(W @ x)
-        x = x + dxdt * dt
-        x[inhibited_idx] = 0.0        # Enforce inhibition at all time points
-        traj[t] = x
+# 3-4. Sigmoid activation and the ODE model with continuous inhibition are
+#      implemented in ode_simulation.py, which advances a whole chunk of
+#      knockouts with one W @ X product per time step
 
-    return traj
+# 5. Run simulation for each gene inhibition and write trajectories to a
+#    knockout x time x gene store as each chunk finishes
+step("5. Run simulation for each gene inhibition")
+output_dir = f'{DATA_DIR}/all_gen_inhibition_simulation'
+knockouts = [(i,) for i in range(n_genes)]
+steps = record_steps(time_steps, RECORD_EVERY)
 
-# 5. Run simulation for each gene inhibition and store trajectories
-all_results = {}
+with TrajectoryWriter(output_dir, genes, knockouts, steps, labels=genes,
+                      params={"decay_rate": decay_rate, "dt": dt, "time_steps": time_steps,
+                              "seed": SEED, "method": METHOD, "steady_tol": STEADY_TOL}) as store:
+    for chunk, trajs in simulate_knockouts(W, knockouts, decay_rate=decay_rate, dt=dt,
+                                           time_steps=time_steps, seed=SEED,
+                                           chunk_size=CHUNK_SIZE, steps=steps,
+                                           method=METHOD, steady_tol=STEADY_TOL):
+        store.write(chunk, trajs)
+        print(f"Simulated inhibition of genes {chunk[0][0] + 1}-{chunk[-1][0] + 1} of {n_genes}")
 
-for i, gene in enumerate(genes):
-    print(f"Simulating inhibition of gene: {gene}")
-    traj = simulate_ode(W, i)
-    all_results[gene] = traj
+print(f"Simulation complete. Results saved to '{output_dir}' "
+      "(read with trajectory_store.TrajectoryStore).")
 
-# 6. Export all results to Excel (one sheet per gene)
-with pd.ExcelWriter('/content/all_gen_inhibition_simulation.xlsx') as writer:
-    for gene, traj in all_results.items():
-        df = pd.DataFrame(traj, columns=genes)
-        df.index.name = 'TimeStep'
-        df.to_excel(writer, sheet_name=gene[:31])  # Excel sheet name limit: 31 chars
+# 6. Optional: export to Excel (one sheet per gene) for small networks
+step("6. Optional: export to Excel")
+EXPORT_EXCEL = False
 
-print("Simulation complete. Results saved to '/content/all_gen_inhibition_simulation.xlsx'")
+if EXPORT_EXCEL:
+    results = TrajectoryStore(output_dir)
+    with pd.ExcelWriter(f'{DATA_DIR}/all_gen_inhibition_simulation.xlsx') as writer:
+        for k, sheet in enumerate(unique_sheet_names(results.labels)):  # Excel sheet name limit: 31 chars
+            df = pd.DataFrame(results.knockout(k), index=results.steps, columns=genes)
+            df.index.name = 'TimeStep'
+            df.to_excel(writer, sheet_name=sheet)
+    print(f"Excel export saved to '{DATA_DIR}/all_gen_inhibition_simulation.xlsx'")
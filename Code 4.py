@@ -4,57 +4,64 @@ Simulation Sensitivity Analysis of Gene Expression Dynamics
 
 Performs multiple runs of the gene expression simulation without inhibition
 to assess stability and variability of gene expression trajectories.
+Replicates run as a streaming Monte Carlo ensemble (see sensitivity.py).
 """
 
-import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# 1. Load the Lasso interaction matrix (XLSX format)
-interaction_df = pd.read_excel('/content/lasso_genetic_network.xlsx', index_col=0, engine='openpyxl')
-W = interaction_df.values
-genes = interaction_df.index.tolist()
+from config import DATA_DIR
+from instrumentation import step
+from knockout_screen import KnockoutScreen
+from network_io import load_network
+from ode_simulation import prepare_network
+from sensitivity import SensitivityStudy, run_ensemble
+
+# 1. Load the Lasso interaction matrix (sparse .npz written by Code 2; a dense
+#    .xlsx/.csv network is also accepted)
+step("1. Load the Lasso interaction matrix")
+W, genes = load_network(f'{DATA_DIR}/lasso_genetic_network.npz', as_sparse=True)
 n_genes = len(genes)
 
+# Sparse networks (density < 5%) are simulated with a CSR kernel; the structure
+# is built once here and reused by every run
+W = prepare_network(W)
+
 # 2. Simulation parameters
 decay_rate = 1.0
 dt = 0.1
 time_steps = 100
+METHOD = "euler"       # "euler" (fixed step), "rk45" (adaptive) or "steady" (direct solve)
+STEADY_TOL = None      # e.g. 1e-6: stop a run once max |dx/dt| < STEADY_TOL
+
+# 3-4. Sigmoid activation and the ODE model (with optional inhibition) are
+#      implemented in ode_simulation.py
+
+# 5. Run simulation replicates without gene inhibition as a Monte Carlo
+#    ensemble: replicates are simulated in vectorized blocks across worker
+#    processes (independent random streams per block) and reduced on the fly
+#    into running per-gene statistics, so memory does not grow with N_REPLICATES
+step("5. Run simulation replicates without gene inhibition")
+N_REPLICATES = 10      # e.g. 10_000 for stable CV estimates
+BLOCK_SIZE = 1024      # replicates per state matrix
+N_JOBS = None          # None = all cores
+SEED = 42
+TRACK_TIME = False     # also keep running mean/std for every time point
 
-# 3. Sigmoid activation function
-def sigmoid(z):
-    return 1 / (1 + np.exp(-z))
-
-# 4. Simulation function with optional inhibition
-def simulate_ode(W, inhibited_idx=[], initial_state=None):
-    x = np.random.rand(n_genes) if initial_state is None else initial_state.copy()
-    for idx in inhibited_idx:
-        x[idx] = 0.0
-    traj = np.zeros((time_steps, n_genes))
-    for t in range(time_steps):
-        dxdt = -decay_rate * x + sigmoid(W @ x)
-        x = x + dxdt * dt
-        for idx in inhibited_idx:
-            x[idx] = 0.0
-        traj[t] = x
-    return traj
-
-# 5. Run 10 simulation replicates without gene inhibition
-all_final_states = []
-
-for run in range(10):
-    traj = simulate_ode(W, inhibited_idx=[])
-    all_final_states.append(traj[-1])  # last time point
-
-final_states_array = np.array(all_final_states)
+ensemble = run_ensemble(W, N_REPLICATES, block_size=BLOCK_SIZE, n_jobs=N_JOBS, seed=SEED,
+                        track_time=TRACK_TIME, decay_rate=decay_rate, dt=dt, time_steps=time_steps,
+                        method=METHOD, steady_tol=STEADY_TOL)
 
 # 6. Compute statistics: mean, std dev, coefficient of variation (CV)
-mean_exp = final_states_array.mean(axis=0)
-std_exp = final_states_array.std(axis=0)
-cv_exp = std_exp / mean_exp
+step("6. Compute statistics: mean, std dev, coefficient of variation")
+final_stats = ensemble["final"]
+mean_exp = final_stats.mean
+std_exp = final_stats.std()
+cv_exp = final_stats.cv()
 
 # 7. Create DataFrame summarizing gene expression variability
+step("7. Create DataFrame summarizing gene expression variability")
 stability_df = pd.DataFrame({
     'Gene': genes,
     'Mean Expression': mean_exp,
@@ -63,13 +70,64 @@ stability_df = pd.DataFrame({
 }).sort_values('CV', ascending=False)
 
 # 8. Display top 20 most sensitive genes
+step("8. Display top 20 most sensitive genes")
 print("\nTop 20 Most Sensitive Genes (Highest CV):")
 print(stability_df.head(20))
+stability_df.to_csv(f"{DATA_DIR}/gene_expression_stability.csv", index=False)
 
 # 9. Plot distribution of gene expression CV
+step("9. Plot distribution of gene expression CV")
 plt.figure(figsize=(12, 6))
 sns.histplot(stability_df['CV'], bins=30, kde=True)
 plt.title("Gene Expression Variability Across Simulations (Coefficient of Variation)")
 plt.xlabel("Coefficient of Variation (CV)")
 plt.ylabel("Number of Genes")
 plt.show()
+
+# 10. Optional: global sensitivity of the final states to the model parameters
+#     (decay rate, dt, multiplicative edge noise on W). Design points run across
+#     a process pool and are cached in GSA_CACHE_DIR, so increasing GSA_SAMPLES
+#     only simulates the new points.
+step("10. Optional: global sensitivity of the final states to the model parameters")
+GSA_METHOD = None      # None = skip, "morris" (elementary effects) or "sobol" (Saltelli design)
+GSA_SAMPLES = 64       # Morris trajectories, or Sobol base samples (rounded up to a power of two)
+GSA_BOUNDS = {"decay_rate": (0.5, 2.0), "dt": (0.05, 0.2), "edge_noise": (0.0, 0.5)}
+GSA_CACHE_DIR = f"{DATA_DIR}/gsa_cache"
+
+if GSA_METHOD:
+    study = SensitivityStudy(W, bounds=GSA_BOUNDS, cache_dir=GSA_CACHE_DIR, seed=SEED,
+                             time_steps=time_steps, method=METHOD, steady_tol=STEADY_TOL, n_jobs=N_JOBS)
+    if GSA_METHOD == "morris":
+        indices = study.morris(n_trajectories=GSA_SAMPLES, seed=SEED)
+    else:
+        indices = study.sobol(n_base=GSA_SAMPLES, seed=SEED)
+    gsa_df = pd.concat({name: pd.DataFrame(values.T, index=genes, columns=study.names)
+                        for name, values in indices.items()}, axis=1)
+    print(f"\nGlobal sensitivity ({GSA_METHOD}), mean over genes:")
+    print(gsa_df.mean().unstack())
+    gsa_df.to_csv(f"{DATA_DIR}/gsa_{GSA_METHOD}_indices.csv")
+
+# 11. Optional: combinatorial knockout screen. Pairs (and triples) of the genes
+#     with outgoing edges and the strongest single-knockout effects are simulated
+#     in batches from one shared initial state; synergy is the deviation of the
+#     combined effect from the sum of the single-knockout effects. Results are
+#     stored in SCREEN_DB and completed combinations are skipped on restart.
+step("11. Optional: combinatorial knockout screen")
+SCREEN_ORDER = 0       # 0 = skip, 2 = pairs, 3 = pairs and triples
+SCREEN_TOP_K = 200     # candidate genes ranked by single-knockout effect (None = all with out-edges)
+SCREEN_TRIPLE_TOP_K = 30
+SCREEN_DB = f"{DATA_DIR}/knockout_screen.sqlite"
+
+if SCREEN_ORDER:
+    with KnockoutScreen(W, SCREEN_DB, seed=SEED, chunk_size=BLOCK_SIZE, decay_rate=decay_rate, dt=dt,
+                        time_steps=time_steps, method=METHOD, steady_tol=STEADY_TOL) as screen:
+        candidates = screen.candidates(top_k=SCREEN_TOP_K)
+        screen.run(candidates, order=2)
+        if SCREEN_ORDER >= 3:
+            screen.run(screen.candidates(top_k=SCREEN_TRIPLE_TOP_K), order=3)
+        synergy_df = pd.DataFrame(
+            [("+".join(genes[g] for g in combo), effect, synergy)
+             for combo, effect, synergy in screen.top_synergies(20)],
+            columns=["Knockout", "Effect", "Synergy"])
+    print("\nTop 20 Synergistic Knockout Combinations:")
+    print(synergy_df)
@@ -2,44 +2,39 @@
 Calculation of Lipid Accumulation Scores from GSVA Results
 """
 
-import pandas as pd
-
-# Step 1: Load GSVA scores (pathways x samples)
-gsva_scores = pd.read_excel("gsva_results.xlsx", index_col=0)  # Dosya yolunu uygun şekilde değiştir
-
-# Step 2: Define lipid-related pathways and their direction (1 = accumulation, -1 = degradation/export)
-lipid_pathway_weights = {
-    "GOBP_LIPID_DROPLET_FORMATION": 1,
-    "GOBP_LIPID_DROPLET_DISASSEMBLY": -1,
-    "GOBP_LIPID_EXPORT_FROM_CELL": -1,
-    "GOBP_LIPID_HOMEOSTASIS": 1,
-    "GOBP_LIPID_IMPORT_INTO_CELL": 1,
-    "GOBP_LIPID_LOCALIZATION": 1,
-    "GOBP_LIPID_METABOLIC_PROCESS": 1,
-    "GOBP_LIPID_CATABOLIC_PROCESS": -1,
-    "GOBP_LIPID_BIOSYNTHETIC_PROCESS": 1,
-    "GOBP_LIPID_DROPLET_FUSION": 1,
-    "GOBP_LIPOPROTEIN_METABOLIC_PROCESS": 1,
-    "GOBP_NEGATIVE_REGULATION_OF_LIPID_STORAGE": -1,
-    "GOBP_POSITIVE_REGULATION_OF_LIPID_STORAGE": 1,
-    "GOBP_POSITIVE_REGULATION_OF_LIPID_CATABOLIC_PROCESS": -1,
-    "GOBP_POSITIVE_REGULATION_OF_MACROPHAGE_DERIVED_FOAM_CELL_DIFFERENTIATION": 1,
-    "GOBP_LIPOPHAGY": -1
-}
+import os
 
-# Step 3: Filter pathways present in GSVA results
-valid_pathways = [p for p in lipid_pathway_weights if p in gsva_scores.index]
-weights = pd.Series(lipid_pathway_weights).loc[valid_pathways]
-selected_scores = gsva_scores.loc[valid_pathways]
+import pandas as pd
 
-# Step 4: Compute lipid accumulation score per sample
-lipid_accumulation_scores = (selected_scores.T * weights).T.sum()
+from config import DATA_DIR
+from instrumentation import step
+from pathway_scores import DEFAULT_CONFIG, SCORE_TABLE, load_score_table
 
-# Step 5: Standardize scores (Z-score)
-z_scores = (lipid_accumulation_scores - lipid_accumulation_scores.mean()) / lipid_accumulation_scores.std()
+# Step 1-5: Load GSVA scores (pathways x samples) and the lipid-related pathways with their
+#           direction (1 = accumulation, -1 = degradation/export) from the score definitions
+#           (lipid_scores.json; add further scores there). The weighted sums over the pathways
+#           present in the GSVA results and their Z-scores are computed for all defined scores
+#           from one read of the GSVA table and kept in pathway_scores.csv, which Code 7 reuses
+#           (in pipeline.py the table is written by its own stage and only read here)
+step("1-5. Load GSVA scores and compute the weighted pathway scores")
+GSVA_FILE = f"{DATA_DIR}/gsva_results.xlsx"  # Dosya yolunu uygun şekilde değiştir
+SCORE_CONFIG = DEFAULT_CONFIG
+SCORE_NAME = "Lipid_Accumulation_Score"
+REFRESH_TABLE = os.environ.get("LIPID_SCORES_READ_ONLY", "") in ("", "0")
+scores, z = load_score_table(GSVA_FILE, f"{DATA_DIR}/{SCORE_TABLE}", SCORE_CONFIG, refresh=REFRESH_TABLE)
+lipid_accumulation_scores = scores[SCORE_NAME]
+z_scores = z[SCORE_NAME]
 
 # Output
 print("Lipid Accumulation Scores:")
 print(lipid_accumulation_scores)
 print("\nZ-scores of Lipid Accumulation:")
 print(z_scores)
+
+# Save results as Excel (read by Code 8 and Code 10)
+output_df = pd.DataFrame({
+    "Lipid_Accumulation_Score": lipid_accumulation_scores,
+    "Z_Score": z_scores
+})
+output_df.to_excel(f"{DATA_DIR}/lipid_birikim_zscore.xlsx")
+print(f"\nLipid accumulation scores saved to '{DATA_DIR}/lipid_birikim_zscore.xlsx'.")
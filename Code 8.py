@@ -5,18 +5,32 @@ Causal Inference Analysis between Lipid Accumulation Scores and Exhaustion Marke
 # Required: dowhy package
 # !pip install dowhy --quiet
 
+import os
+
 import pandas as pd
 import numpy as np
 from dowhy import CausalModel
 
+from causal_batch import backdoor_effects, dowhy_crosscheck
+from causal_robustness import bootstrap_effects, refutation_panel, robustness_summary
+from config import DATA_DIR
+from excel_cache import read_excel_cached
+from instrumentation import section, step
+from pathway_scores import SCORE_TABLE, read_score_table
+
 # 1. Load data
-lipid_accum = pd.read_excel("/content/lipid_birikim_zscore.xlsx", index_col=0)
-exhaustion = pd.read_excel("/content/merged_genes_log2cpm.xlsx", index_col=0)
+step("1. Load data")
+lipid_accum = read_excel_cached(f"{DATA_DIR}/lipid_birikim_zscore.xlsx", index_col=0)
+exhaustion = read_excel_cached(f"{DATA_DIR}/merged_genes_log2cpm.xlsx", index_col=0)
+if "Z_Score" in lipid_accum.columns:   # Code 6 output: raw score and Z-score per sample
+    lipid_accum = lipid_accum[["Z_Score"]]
 
 # 2. Transpose lipid accumulation scores to have samples as columns
+step("2. Transpose lipid accumulation scores to have samples as columns")
 lipid_accum = lipid_accum.T
 
 # 3. Normalize sample names
+step("3. Normalize sample names")
 def normalize_name(name):
     return str(name).strip().upper().replace("-", "").replace("_", "").replace(".", "")
 
@@ -24,6 +38,7 @@ lipid_accum.columns = [normalize_name(x) for x in lipid_accum.columns]
 exhaustion.columns = [normalize_name(x) for x in exhaustion.columns]
 
 # 4. Find common samples
+step("4. Find common samples")
 common_samples = list(set(lipid_accum.columns) & set(exhaustion.columns))
 print(f"Number of common samples: {len(common_samples)}")
 
@@ -31,6 +46,7 @@ lipid_accum = lipid_accum[common_samples]
 exhaustion = exhaustion[common_samples]
 
 # 5. Select exhaustion marker genes
+step("5. Select exhaustion marker genes")
 exhaustion_genes = ["TOX", "TIGIT", "PRDM1", "PDCD1", "NR4A1", "LAG3", "HAVCR2", "EOMES", "ENTPD1", "CTLA4", "BATF"]
 common_genes = [g for g in exhaustion_genes if g in exhaustion.index]
 if not common_genes:
@@ -39,22 +55,27 @@ if not common_genes:
 exhaustion_expr = exhaustion.loc[common_genes]
 
 # 6. Compute exhaustion score as mean expression of marker genes
+step("6. Compute exhaustion score as mean expression of marker genes")
 exhaustion_score = exhaustion_expr.mean(axis=0)
 
 # 7. Get lipid accumulation scores (samples aligned)
+step("7. Get lipid accumulation scores")
 lipid_scores = lipid_accum.iloc[0] if lipid_accum.shape[0] == 1 else lipid_accum.mean(axis=0)
 
 # 8. Align samples between scores
+step("8. Align samples between scores")
 common_samples_final = lipid_scores.index.intersection(exhaustion_score.index)
 lipid_scores_aligned = lipid_scores.loc[common_samples_final]
 exhaustion_scores_aligned = exhaustion_score.loc[common_samples_final]
 
 # 9. Generate synthetic confounders (age, sex)
+step("9. Generate synthetic confounders")
 np.random.seed(42)
 age = np.random.randint(30, 70, size=len(common_samples_final))
 sex = np.random.randint(0, 2, size=len(common_samples_final))
 
 # 10. Prepare dataframe for causal analysis
+step("10. Prepare dataframe for causal analysis")
 df = pd.DataFrame({
     "lipid_accum_zscore": lipid_scores_aligned,
     "exhaustion": exhaustion_scores_aligned,
@@ -63,6 +84,7 @@ df = pd.DataFrame({
 })
 
 # 11. Define and identify causal model
+step("11. Define and identify causal model")
 model = CausalModel(
     data=df,
     treatment="lipid_accum_zscore",
@@ -72,10 +94,12 @@ model = CausalModel(
 identified_model = model.identify_effect()
 
 # 12. Estimate Average Treatment Effect (ATE)
+step("12. Estimate Average Treatment Effect")
 estimate = model.estimate_effect(identified_model, method_name="backdoor.linear_regression")
 print("ATE (lipid accumulation → exhaustion):", estimate.value)
 
 # 13. Reverse causality check (optional)
+step("13. Reverse causality check")
 model_reverse = CausalModel(
     data=df,
     treatment="exhaustion",
@@ -86,6 +110,75 @@ identified_model_reverse = model_reverse.identify_effect()
 estimate_reverse = model_reverse.estimate_effect(identified_model_reverse, method_name="backdoor.linear_regression")
 print("ATE (exhaustion → lipid accumulation):", estimate_reverse.value)
 
+# 14. Batched backdoor estimates for every lipid score against every exhaustion
+#     marker and the exhaustion score (both directions), and against the
+#     pathway-level scores: the Z-scores of the other scores defined in
+#     lipid_scores.json (pathway_scores.csv, written with the GSVA scores of
+#     Code 6). All pairs share the confounder design, so they are solved with one
+#     QR factorization (see causal_batch.py); a few sampled pairs are
+#     re-estimated with DoWhy.
+step("14. Batched backdoor estimates")
+CROSSCHECK_PAIRS = 3
+SCORE_NAME = "Lipid_Accumulation_Score"
+
+lipid_table = df[["lipid_accum_zscore"]]
+if lipid_accum.shape[0] > 1:
+    lipid_table = lipid_table.join(lipid_accum.T.loc[common_samples_final].add_prefix("lipid_accum_"))
+marker_table = exhaustion_expr.T.loc[common_samples_final]
+pathway_table = pd.DataFrame(index=common_samples_final)
+if os.path.exists(f"{DATA_DIR}/{SCORE_TABLE}"):
+    _, pathway_z = read_score_table(f"{DATA_DIR}/{SCORE_TABLE}")
+    pathway_z.index = [normalize_name(x) for x in pathway_z.index]
+    pathway_table = pathway_z.drop(columns=SCORE_NAME).add_suffix("_Z").reindex(common_samples_final)
+batch_data = pd.concat([df, lipid_table.drop(columns="lipid_accum_zscore"), marker_table, pathway_table], axis=1)
+
+lipid_vars = lipid_table.columns.tolist()
+exhaustion_vars = marker_table.columns.tolist() + ["exhaustion"]
+pathway_vars = pathway_table.columns.tolist()
+effects = pd.concat([
+    backdoor_effects(batch_data, lipid_vars, exhaustion_vars + pathway_vars, ["age", "sex"]).assign(direction="lipid → exhaustion"),
+    backdoor_effects(batch_data, exhaustion_vars, lipid_vars, ["age", "sex"]).assign(direction="exhaustion → lipid"),
+], ignore_index=True)
+effects.loc[effects["outcome"].isin(pathway_vars), "direction"] = "lipid → pathway score"
+print("\nBatched backdoor estimates:")
+print(effects.to_string(index=False))
+if CROSSCHECK_PAIRS:
+    print("\nDoWhy cross-check:")
+    print(dowhy_crosscheck(batch_data, effects, ["age", "sex"], n_pairs=CROSSCHECK_PAIRS).to_string(index=False))
+
+# 15. Robustness: bootstrap confidence intervals for the batched estimates and
+#     DoWhy refuters (placebo treatment, random common cause, data subset) for
+#     the forward / reverse estimates above, reusing their identified estimands.
+#     Bootstrap blocks and refuters run across a process pool with per-task seeds.
+step("15. Robustness: bootstrap intervals and refutation panel")
+N_BOOTSTRAP = 1000        # 0 = skip
+REFUTE_SIMULATIONS = 100  # 0 = skip refuters
+N_JOBS = None             # None = all cores
+
+if N_BOOTSTRAP:
+    with section("Bootstrap intervals"):
+        effects = pd.concat([
+            bootstrap_effects(batch_data, lipid_vars, exhaustion_vars + pathway_vars, ["age", "sex"],
+                              n_boot=N_BOOTSTRAP, n_jobs=N_JOBS).assign(direction="lipid → exhaustion"),
+            bootstrap_effects(batch_data, exhaustion_vars, lipid_vars, ["age", "sex"], n_boot=N_BOOTSTRAP,
+                              n_jobs=N_JOBS).assign(direction="exhaustion → lipid"),
+        ], ignore_index=True)
+        effects.loc[effects["outcome"].isin(pathway_vars), "direction"] = "lipid → pathway score"
+    print(f"\nBootstrap 95% confidence intervals ({N_BOOTSTRAP} resamples):")
+    print(effects[["treatment", "outcome", "estimate", "ci_low", "ci_high"]].to_string(index=False))
+effects.to_csv(f"{DATA_DIR}/backdoor_effects_lipid_birikimi.csv", index=False)
+
+if REFUTE_SIMULATIONS:
+    with section("Refutation panel"):
+        refutations = refutation_panel({
+            "lipid accumulation → exhaustion": (model, identified_model, estimate),
+            "exhaustion → lipid accumulation": (model_reverse, identified_model_reverse, estimate_reverse),
+        }, num_simulations=REFUTE_SIMULATIONS, n_jobs=N_JOBS)
+    refutation_summary = robustness_summary(refutations)
+    print("\nRefutation summary:")
+    print(refutation_summary.T)
+    refutation_summary.to_csv(f"{DATA_DIR}/refutation_summary_lipid_birikimi.csv")
+
 # Save exhaustion scores
-exhaustion_scores_aligned.to_frame(name='EXHAUSTION_SCORE').to_csv("/content/exhaustion_scores_lipid_birikimi.csv")
-print("\nExhaustion scores saved to '/content/exhaustion_scores_lipid_birikimi.csv'.")
+exhaustion_scores_aligned.to_frame(name='EXHAUSTION_SCORE').to_csv(f"{DATA_DIR}/exhaustion_scores_lipid_birikimi.csv")
+print(f"\nExhaustion scores saved to '{DATA_DIR}/exhaustion_scores_lipid_birikimi.csv'.")
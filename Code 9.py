@@ -5,15 +5,27 @@ Causal Inference Analysis between Lipid Degradation Scores and Exhaustion Marker
 # Required: dowhy package
 # !pip install dowhy --quiet
 
+import os
+
 import pandas as pd
 import numpy as np
 from dowhy import CausalModel
 
+from causal_batch import backdoor_effects, dowhy_crosscheck
+from causal_robustness import bootstrap_effects, refutation_panel, robustness_summary
+from config import DATA_DIR
+from excel_cache import read_excel_cached
+from instrumentation import section, step
+from pathway_scores import SCORE_TABLE, read_score_table
+
 def normalize_name(name):
     return str(name).strip().upper().replace("-", "").replace("_", "").replace(".", "")
 
 # 1. Load lipid catabolic scores
-lipid_catabolic_df = pd.read_excel("/content/lipid_catabolic_scores.xlsx", index_col=0)
+step("1. Load lipid catabolic scores")
+lipid_catabolic_df = read_excel_cached(f"{DATA_DIR}/lipid_catabolic_scores.xlsx", index_col=0)
+if "Z_Score" in lipid_catabolic_df.columns:   # Code 7 output: raw score and Z-score per sample
+    lipid_catabolic_df = lipid_catabolic_df[["Z_Score"]]
 if lipid_catabolic_df.shape[0] == 1 and lipid_catabolic_df.shape[1] > 1:
     lipid_catabolic_scores = lipid_catabolic_df.T.iloc[:,0]
 elif lipid_catabolic_df.shape[1] == 1:
@@ -22,9 +34,11 @@ else:
     lipid_catabolic_scores = lipid_catabolic_df.mean(axis=1)
 
 # 2. Load gene expression for exhaustion score calculation
-merged_expr = pd.read_excel("/content/merged_genes_log2cpm.xlsx", index_col=0)
+step("2. Load gene expression for exhaustion score calculation")
+merged_expr = read_excel_cached(f"{DATA_DIR}/merged_genes_log2cpm.xlsx", index_col=0)
 
 # 3. Exhaustion marker genes
+step("3. Exhaustion marker genes")
 exhaustion_genes = ["TOX", "TIGIT", "PRDM1", "PDCD1", "NR4A1", "LAG3", "HAVCR2", "EOMES", "ENTPD1", "CTLA4", "BATF"]
 common_genes = [g for g in exhaustion_genes if g in merged_expr.index]
 if not common_genes:
@@ -33,13 +47,16 @@ if not common_genes:
 exhaustion_expr = merged_expr.loc[common_genes]
 
 # 4. Compute exhaustion score
+step("4. Compute exhaustion score")
 exhaustion_score = exhaustion_expr.mean(axis=0)
 
 # 5. Normalize sample names
+step("5. Normalize sample names")
 lipid_catabolic_scores.index = [normalize_name(x) for x in lipid_catabolic_scores.index]
 exhaustion_score.index = [normalize_name(x) for x in exhaustion_score.index]
 
 # 6. Identify common samples
+step("6. Identify common samples")
 common_samples = lipid_catabolic_scores.index.intersection(exhaustion_score.index)
 print(f"Number of common samples: {len(common_samples)}")
 
@@ -47,11 +64,13 @@ lipid_scores_aligned = lipid_catabolic_scores.loc[common_samples]
 exhaustion_scores_aligned = exhaustion_score.loc[common_samples]
 
 # 7. Synthetic confounders
+step("7. Synthetic confounders")
 np.random.seed(42)
 age = np.random.randint(30, 70, size=len(common_samples))
 sex = np.random.randint(0, 2, size=len(common_samples))
 
 # 8. Dataframe for causal analysis
+step("8. Dataframe for causal analysis")
 df = pd.DataFrame({
     "lipid_catabolic_zscore": lipid_scores_aligned,
     "exhaustion": exhaustion_scores_aligned,
@@ -60,6 +79,7 @@ df = pd.DataFrame({
 })
 
 # 9. Define and identify causal model
+step("9. Define and identify causal model")
 model = CausalModel(
     data=df,
     treatment="lipid_catabolic_zscore",
@@ -69,10 +89,12 @@ model = CausalModel(
 identified_model = model.identify_effect()
 
 # 10. Estimate ATE
+step("10. Estimate ATE")
 estimate = model.estimate_effect(identified_model, method_name="backdoor.linear_regression")
 print("ATE (lipid catabolic → exhaustion):", estimate.value)
 
 # 11. Reverse causality test
+step("11. Reverse causality test")
 model_reverse = CausalModel(
     data=df,
     treatment="exhaustion",
@@ -82,3 +104,76 @@ model_reverse = CausalModel(
 identified_model_reverse = model_reverse.identify_effect()
 estimate_reverse = model_reverse.estimate_effect(identified_model_reverse, method_name="backdoor.linear_regression")
 print("ATE (exhaustion → lipid catabolic):", estimate_reverse.value)
+
+# 12. Batched backdoor estimates for every lipid catabolic score against every
+#     exhaustion marker and the exhaustion score (both directions), and against
+#     the pathway-level scores: the Z-scores of the other scores defined in
+#     lipid_scores.json (pathway_scores.csv, written with the GSVA scores of
+#     Code 7). All pairs share the confounder design, so they are solved with one
+#     QR factorization (see causal_batch.py); a few sampled pairs are
+#     re-estimated with DoWhy.
+step("12. Batched backdoor estimates")
+CROSSCHECK_PAIRS = 3
+SCORE_NAME = "Lipid_Catabolic_Score"
+
+lipid_table = df[["lipid_catabolic_zscore"]]
+if lipid_catabolic_df.shape[0] > 1 and lipid_catabolic_df.shape[1] > 1:
+    extra = lipid_catabolic_df.copy()
+    extra.index = [normalize_name(x) for x in extra.index]
+    lipid_table = lipid_table.join(extra.loc[common_samples].add_prefix("lipid_catabolic_"))
+marker_table = exhaustion_expr.T
+marker_table.index = [normalize_name(x) for x in marker_table.index]
+marker_table = marker_table.loc[common_samples]
+pathway_table = pd.DataFrame(index=common_samples)
+if os.path.exists(f"{DATA_DIR}/{SCORE_TABLE}"):
+    _, pathway_z = read_score_table(f"{DATA_DIR}/{SCORE_TABLE}")
+    pathway_z.index = [normalize_name(x) for x in pathway_z.index]
+    pathway_table = pathway_z.drop(columns=SCORE_NAME).add_suffix("_Z").reindex(common_samples)
+batch_data = pd.concat([df, lipid_table.drop(columns="lipid_catabolic_zscore"), marker_table, pathway_table], axis=1)
+
+lipid_vars = lipid_table.columns.tolist()
+exhaustion_vars = marker_table.columns.tolist() + ["exhaustion"]
+pathway_vars = pathway_table.columns.tolist()
+effects = pd.concat([
+    backdoor_effects(batch_data, lipid_vars, exhaustion_vars + pathway_vars, ["age", "sex"]).assign(direction="lipid → exhaustion"),
+    backdoor_effects(batch_data, exhaustion_vars, lipid_vars, ["age", "sex"]).assign(direction="exhaustion → lipid"),
+], ignore_index=True)
+effects.loc[effects["outcome"].isin(pathway_vars), "direction"] = "lipid → pathway score"
+print("\nBatched backdoor estimates:")
+print(effects.to_string(index=False))
+if CROSSCHECK_PAIRS:
+    print("\nDoWhy cross-check:")
+    print(dowhy_crosscheck(batch_data, effects, ["age", "sex"], n_pairs=CROSSCHECK_PAIRS).to_string(index=False))
+
+# 13. Robustness: bootstrap confidence intervals for the batched estimates and
+#     DoWhy refuters (placebo treatment, random common cause, data subset) for
+#     the forward / reverse estimates above, reusing their identified estimands.
+#     Bootstrap blocks and refuters run across a process pool with per-task seeds.
+step("13. Robustness: bootstrap intervals and refutation panel")
+N_BOOTSTRAP = 1000        # 0 = skip
+REFUTE_SIMULATIONS = 100  # 0 = skip refuters
+N_JOBS = None             # None = all cores
+
+if N_BOOTSTRAP:
+    with section("Bootstrap intervals"):
+        effects = pd.concat([
+            bootstrap_effects(batch_data, lipid_vars, exhaustion_vars + pathway_vars, ["age", "sex"],
+                              n_boot=N_BOOTSTRAP, n_jobs=N_JOBS).assign(direction="lipid → exhaustion"),
+            bootstrap_effects(batch_data, exhaustion_vars, lipid_vars, ["age", "sex"], n_boot=N_BOOTSTRAP,
+                              n_jobs=N_JOBS).assign(direction="exhaustion → lipid"),
+        ], ignore_index=True)
+        effects.loc[effects["outcome"].isin(pathway_vars), "direction"] = "lipid → pathway score"
+    print(f"\nBootstrap 95% confidence intervals ({N_BOOTSTRAP} resamples):")
+    print(effects[["treatment", "outcome", "estimate", "ci_low", "ci_high"]].to_string(index=False))
+effects.to_csv(f"{DATA_DIR}/backdoor_effects_lipid_catabolic.csv", index=False)
+
+if REFUTE_SIMULATIONS:
+    with section("Refutation panel"):
+        refutations = refutation_panel({
+            "lipid catabolic → exhaustion": (model, identified_model, estimate),
+            "exhaustion → lipid catabolic": (model_reverse, identified_model_reverse, estimate_reverse),
+        }, num_simulations=REFUTE_SIMULATIONS, n_jobs=N_JOBS)
+    refutation_summary = robustness_summary(refutations)
+    print("\nRefutation summary:")
+    print(refutation_summary.T)
+    refutation_summary.to_csv(f"{DATA_DIR}/refutation_summary_lipid_catabolic.csv")
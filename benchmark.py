@@ -0,0 +1,407 @@
+"""
+Benchmark Suite with Scaling Curves
+
+Times and memory-profiles the computational stages of the pipeline on
+synthetic inputs (see synthetic_data.py) over grids of genes and samples:
+
+    ingest            HTSeq files -> count / log2CPM matrices (Code 1 cohort mode)
+    lasso_cv          per-gene LassoCV network inference (Code 2)
+    lasso_gram        all-nodes Gram-matrix Lasso (Code 2)
+    knockouts         every single-gene knockout, final state only (Code 3)
+    ensemble          Monte Carlo ensemble; samples = replicates (Code 4)
+    pathway_scoring   all lipid scores; genes = GSVA pathways (Code 6, 7)
+    causal            batched backdoor effects; genes = outcome markers (Code 8, 9)
+    causal_bootstrap  bootstrap intervals of the backdoor effects (Code 8, 9)
+    lgbm              repeated-seed LightGBM importances (Code 10)
+
+Each grid point runs in a fresh Python subprocess, so its peak RSS (of the
+process and of any worker processes) is not inflated by earlier points. Input
+generation is excluded from the timing. The stage is run `repeat` times (the
+fastest run is reported) and, unless disabled, once more under tracemalloc for
+the peak of Python-visible allocations (NumPy arrays included).
+
+Results are written as JSON (with machine information) and CSV, together
+with the log-log scaling exponent of the run time along each axis. A saved
+result file serves as a baseline: later runs on the same machine flag grid
+points whose time or memory grew by more than the tolerance, and the command
+exits with status 1 if any did.
+
+Usage:
+    python benchmark.py [--cases NAME ...] [--genes N ...] [--samples N ...] [--quick]
+                        [--repeat R] [--jobs N] [--timeout S] [--no-trace]
+                        [--output FILE] [--baseline FILE] [--save-baseline FILE] [--plot FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from synthetic_data import (count_matrix, exhaustion_table, expression_matrix, gsva_table, sparse_network,
+                            write_htseq_files)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GENE_GRID = (100, 1000, 10000)
+SAMPLE_GRID = (10, 100, 1000, 5000)
+QUICK_GENE_GRID = (100, 200)
+QUICK_SAMPLE_GRID = (20, 60)
+
+NETWORK_DEGREE = 20     # mean nonzero weights per gene of the synthetic networks
+LGBM_PARAMS = {          # Code 10 accumulation model, shortened to 100 rounds
+    "learning_rate": 0.1344, "num_leaves": 121, "max_depth": 30, "subsample": 0.828,
+    "colsample_bytree": 0.855, "reg_alpha": 0.0473, "reg_lambda": 3.667, "n_estimators": 100,
+    "objective": "regression", "metric": "rmse",
+}
+LGBM_SEEDS = 5
+N_BOOTSTRAP = 200
+
+
+class Case:
+    """
+    One benchmarked stage.
+
+    Parameters:
+        name: case name
+        setup: function (n_genes, n_samples, work_dir, n_jobs) -> zero-argument
+            callable running the stage once on freshly generated inputs
+        axes: grid axes the case depends on ("genes" and / or "samples")
+        max_genes, max_samples, max_cells: grid points beyond these limits
+            (cells = genes x samples) are skipped
+    """
+
+    def __init__(self, name, setup, axes=("genes", "samples"), max_genes=None, max_samples=None,
+                 max_cells=None):
+        self.name = name
+        self.setup = setup
+        self.axes = axes
+        self.max_genes = max_genes
+        self.max_samples = max_samples
+        self.max_cells = max_cells
+
+    def points(self, genes, samples):
+        """Grid points (n_genes, n_samples); an unused axis is None."""
+        genes = genes if "genes" in self.axes else [None]
+        samples = samples if "samples" in self.axes else [None]
+        return [(g, s) for g in genes for s in samples]
+
+    def skip_reason(self, n_genes, n_samples):
+        if self.max_genes and n_genes and n_genes > self.max_genes:
+            return f"genes > {self.max_genes}"
+        if self.max_samples and n_samples and n_samples > self.max_samples:
+            return f"samples > {self.max_samples}"
+        if self.max_cells and n_genes and n_samples and n_genes * n_samples > self.max_cells:
+            return f"genes x samples > {self.max_cells}"
+        return None
+
+
+def _fresh_dir(work_dir):
+    return tempfile.mkdtemp(dir=work_dir)
+
+
+def _network(n_genes):
+    from ode_simulation import prepare_network
+    return prepare_network(sparse_network(n_genes, density=min(0.04, NETWORK_DEGREE / n_genes)))
+
+
+def _setup_ingest(n_genes, n_samples, work_dir, n_jobs):
+    from htseq_ingest import ingest_cohort
+    source = os.path.join(work_dir, "htseq")
+    write_htseq_files(source, count_matrix(n_genes, n_samples))
+    return lambda: ingest_cohort(source, _fresh_dir(work_dir), n_workers=n_jobs)
+
+
+def _setup_lasso_cv(n_genes, n_samples, work_dir, n_jobs):
+    from lasso_network import infer_network
+    X = expression_matrix(n_genes, n_samples)
+    return lambda: infer_network(X, _fresh_dir(work_dir), n_jobs=n_jobs)
+
+
+def _setup_lasso_gram(n_genes, n_samples, work_dir, n_jobs):
+    from lasso_network import all_nodes_lasso
+    X = expression_matrix(n_genes, n_samples)
+    return lambda: all_nodes_lasso(X, n_jobs=n_jobs)
+
+
+def _setup_knockouts(n_genes, n_samples, work_dir, n_jobs):
+    from ode_simulation import TIME_STEPS, record_steps, simulate_knockouts
+    W = _network(n_genes)
+    steps = record_steps(TIME_STEPS, "final")
+
+    def run():
+        for _ in simulate_knockouts(W, range(n_genes), seed=0, steps=steps):
+            pass
+    return run
+
+
+def _setup_ensemble(n_genes, n_samples, work_dir, n_jobs):
+    from sensitivity import run_ensemble
+    W = _network(n_genes)
+    return lambda: run_ensemble(W, n_samples, n_jobs=n_jobs, seed=0)
+
+
+def _setup_pathway_scoring(n_genes, n_samples, work_dir, n_jobs):
+    from pathway_scores import load_score_definitions, score_pathways
+    definitions = load_score_definitions()
+    gsva = gsva_table(n_samples, n_pathways=n_genes)
+    return lambda: score_pathways(gsva, definitions)
+
+
+def _causal_inputs(n_genes, n_samples):
+    table = exhaustion_table(n_samples, n_markers=n_genes)
+    treatments = ["Lipid_Accumulation_Score", "Lipid_Catabolic_Score"]
+    outcomes = [c for c in table.columns if c not in treatments + ["age", "sex"]]
+    return table, treatments, outcomes
+
+
+def _setup_causal(n_genes, n_samples, work_dir, n_jobs):
+    from causal_batch import backdoor_effects
+    table, treatments, outcomes = _causal_inputs(n_genes, n_samples)
+    return lambda: backdoor_effects(table, treatments, outcomes, ["age", "sex"])
+
+
+def _setup_causal_bootstrap(n_genes, n_samples, work_dir, n_jobs):
+    from causal_robustness import bootstrap_effects
+    table, treatments, outcomes = _causal_inputs(n_genes, n_samples)
+    return lambda: bootstrap_effects(table, treatments, outcomes, ["age", "sex"], n_boot=N_BOOTSTRAP,
+                                     n_jobs=n_jobs, seed=0)
+
+
+def _setup_lgbm(n_genes, n_samples, work_dir, n_jobs):
+    from lgbm_importance import ImportanceEngine
+    X = pd.DataFrame(expression_matrix(n_genes, n_samples).T, columns=[f"G{i}" for i in range(n_genes)])
+    rng = np.random.default_rng(0)
+    beta = np.zeros(n_genes)
+    beta[rng.choice(n_genes, min(20, n_genes), replace=False)] = rng.normal(size=min(20, n_genes))
+    y = X.to_numpy() @ beta + rng.normal(size=n_samples)
+
+    def run():
+        with ImportanceEngine(_fresh_dir(work_dir), n_jobs=n_jobs) as engine:
+            engine.add_target("target", X, y, LGBM_PARAMS)
+            engine.run("target", range(LGBM_SEEDS))
+    return run
+
+
+CASES = {case.name: case for case in [
+    Case("ingest", _setup_ingest, max_cells=2 * 10 ** 7),
+    Case("lasso_cv", _setup_lasso_cv, max_genes=1000),
+    Case("lasso_gram", _setup_lasso_gram, max_genes=3000),
+    Case("knockouts", _setup_knockouts, axes=("genes",)),
+    Case("ensemble", _setup_ensemble),
+    Case("pathway_scoring", _setup_pathway_scoring),
+    Case("causal", _setup_causal),
+    Case("causal_bootstrap", _setup_causal_bootstrap, max_genes=1000),
+    Case("lgbm", _setup_lgbm),
+]}
+
+
+# Measurement (runs inside the per-point subprocess)
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024   # bytes on macOS, KiB on Linux
+
+
+def measure(name, n_genes, n_samples, work_dir, n_jobs=1, repeat=1, trace=True):
+    """
+    Run one grid point of a case in the current process.
+
+    Returns seconds (fastest of `repeat` runs), setup_seconds, peak_rss_mb
+    (this process), peak_child_rss_mb (largest worker process), setup_rss_mb
+    (peak after generating the inputs) and, with trace, traced_peak_mb.
+    """
+    start = time.perf_counter()
+    run = CASES[name].setup(n_genes, n_samples, work_dir, n_jobs)
+    result = {"setup_seconds": time.perf_counter() - start, "setup_rss_mb": _peak_rss_mb()}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    result.update(seconds=min(times), peak_rss_mb=_peak_rss_mb(),
+                  peak_child_rss_mb=_peak_rss_mb(resource.RUSAGE_CHILDREN))
+    if trace:
+        tracemalloc.start()
+        run()
+        result["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def run_point(name, n_genes, n_samples, n_jobs=1, repeat=1, trace=True, timeout=None, work_dir=None):
+    """Measure one grid point in a fresh subprocess; returns the result record."""
+    record = {"case": name, "n_genes": n_genes, "n_samples": n_samples}
+    reason = CASES[name].skip_reason(n_genes, n_samples)
+    if reason:
+        return dict(record, status="skipped", reason=reason)
+    env = dict(os.environ, MPLBACKEND="Agg",
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", name, str(n_genes or 0),
+               str(n_samples or 0), "--work-dir", tmp, "--jobs", str(n_jobs), "--repeat", str(repeat)]
+        if not trace:
+            cmd.append("--no-trace")
+        try:
+            proc = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return dict(record, status="timeout", reason=f"> {timeout}s")
+    if proc.returncode != 0:
+        return dict(record, status="failed", reason=(proc.stderr.strip().splitlines() or [""])[-1])
+    return dict(record, status="ok", **json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+# Analysis
+
+def scaling_exponents(results):
+    """
+    Log-log slope of the run time along each axis, per case and value of the
+    other axis (only where at least two successful points exist).
+    """
+    ok = pd.DataFrame([r for r in results if r["status"] == "ok"])
+    rows = []
+    if ok.empty:
+        return pd.DataFrame(rows, columns=["case", "axis", "fixed", "exponent", "points"])
+    for axis, other in (("n_genes", "n_samples"), ("n_samples", "n_genes")):
+        for (case, fixed), group in ok.groupby(["case", ok[other].fillna(-1)]):
+            group = group.dropna(subset=[axis])
+            if group[axis].nunique() < 2:
+                continue
+            slope = np.polyfit(np.log(group[axis].astype(float)), np.log(group["seconds"]), 1)[0]
+            rows.append((case, axis[2:], None if fixed == -1 else int(fixed), slope, len(group)))
+    table = pd.DataFrame(rows, columns=["case", "axis", "fixed", "exponent", "points"])
+    return table.astype({"fixed": "Int64"})
+
+
+def compare(results, baseline, time_tol=0.25, memory_tol=0.25, min_seconds=0.05):
+    """
+    Grid points that regressed against a baseline result list: run time above
+    (1 + time_tol) x baseline (and by more than min_seconds), a memory figure
+    above (1 + memory_tol) x baseline, or a point that no longer succeeds.
+    Returns a DataFrame with one row per regression.
+    """
+    key = lambda r: (r["case"], r["n_genes"], r["n_samples"])
+    previous = {key(r): r for r in baseline if r["status"] == "ok"}
+    rows = []
+    for r in results:
+        base = previous.get(key(r))
+        if base is None or r["status"] == "skipped":
+            continue
+        if r["status"] != "ok":
+            rows.append((*key(r), "status", base["seconds"], np.nan, np.nan))
+            continue
+        if r["seconds"] > base["seconds"] * (1 + time_tol) and r["seconds"] - base["seconds"] > min_seconds:
+            rows.append((*key(r), "seconds", base["seconds"], r["seconds"], r["seconds"] / base["seconds"]))
+        for metric in ("peak_rss_mb", "peak_child_rss_mb", "traced_peak_mb"):
+            if metric in r and base.get(metric) and r[metric] > base[metric] * (1 + memory_tol):
+                rows.append((*key(r), metric, base[metric], r[metric], r[metric] / base[metric]))
+    return pd.DataFrame(rows, columns=["case", "n_genes", "n_samples", "metric", "baseline", "current", "ratio"])
+
+
+def plot_scaling(results, path):
+    """Log-log run time curves, one panel per case."""
+    import matplotlib.pyplot as plt
+
+    ok = pd.DataFrame([r for r in results if r["status"] == "ok"])
+    cases = list(dict.fromkeys(ok["case"]))
+    fig, axes = plt.subplots(1, len(cases), figsize=(4 * len(cases), 3.5), squeeze=False)
+    for ax, case in zip(axes[0], cases):
+        group = ok[ok["case"] == case]
+        x, line = ("n_genes", "n_samples") if group["n_genes"].notna().any() else ("n_samples", "n_genes")
+        for value, curve in group.groupby(group[line].fillna(-1)):
+            curve = curve.sort_values(x)
+            label = None if value == -1 else f"{line[2:]}={int(value)}"
+            ax.loglog(curve[x], curve["seconds"], marker="o", label=label)
+        ax.set_title(case)
+        ax.set_xlabel(x[2:])
+        ax.set_ylabel("seconds")
+        if group[line].notna().any():
+            ax.legend(fontsize=7)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+
+
+def machine_info():
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "cpu_count": os.cpu_count(), "numpy": np.__version__}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--cases", nargs="*", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--genes", nargs="*", type=int, default=None)
+    parser.add_argument("--samples", nargs="*", type=int, default=None)
+    parser.add_argument("--quick", action="store_true", help="small grid for a smoke run")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per point (fastest is kept)")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes of the parallel stages")
+    parser.add_argument("--timeout", type=float, default=900, help="seconds per grid point")
+    parser.add_argument("--no-trace", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="result file to compare against")
+    parser.add_argument("--save-baseline", default=None, help="also write the results here")
+    parser.add_argument("--time-tol", type=float, default=0.25)
+    parser.add_argument("--memory-tol", type=float, default=0.25)
+    parser.add_argument("--plot", default=None, help="PNG file for the scaling curves")
+    parser.add_argument("--worker", nargs=3, metavar=("CASE", "GENES", "SAMPLES"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        name, n_genes, n_samples = args.worker
+        result = measure(name, int(n_genes) or None, int(n_samples) or None, args.work_dir,
+                         n_jobs=args.jobs, repeat=args.repeat, trace=not args.no_trace)
+        print(json.dumps(result))
+        return 0
+
+    genes = args.genes or (QUICK_GENE_GRID if args.quick else GENE_GRID)
+    samples = args.samples or (QUICK_SAMPLE_GRID if args.quick else SAMPLE_GRID)
+    results = []
+    for name in args.cases:
+        for n_genes, n_samples in CASES[name].points(genes, samples):
+            r = run_point(name, n_genes, n_samples, n_jobs=args.jobs, repeat=args.repeat,
+                          trace=not args.no_trace, timeout=args.timeout, work_dir=args.work_dir)
+            results.append(r)
+            detail = (f"{r['seconds']:.3f}s, peak RSS {r['peak_rss_mb']:.0f} MB"
+                      if r["status"] == "ok" else f"{r['status']}: {r.get('reason', '')}")
+            print(f"[{name}] genes={n_genes} samples={n_samples}: {detail}")
+
+    exponents = scaling_exponents(results)
+    if not exponents.empty:
+        print("\nScaling exponents (seconds ~ size^k):")
+        print(exponents.to_string(index=False, float_format="%.2f"))
+
+    report = {"machine": machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "settings": {"jobs": args.jobs, "repeat": args.repeat, "trace": not args.no_trace},
+              "results": results, "exponents": exponents.to_dict(orient="records")}
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+    pd.DataFrame(results).to_csv(os.path.splitext(args.output)[0] + ".csv", index=False)
+    if args.plot:
+        plot_scaling(results, args.plot)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["machine"] != report["machine"]:
+            print("Warning: baseline was recorded on a different machine / environment.")
+        regressions = compare(results, baseline["results"], args.time_tol, args.memory_tol)
+        if not regressions.empty:
+            print("\nRegressions against the baseline:")
+            print(regressions.to_string(index=False, float_format="%.3f"))
+            return 1
+        print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
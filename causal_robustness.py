@@ -0,0 +1,147 @@
+"""
+Bootstrap Confidence Intervals and Refutation Panel for the Causal Estimates
+
+Two robustness checks for the backdoor estimates of Code 8 and 9, both spread
+over a process pool with reproducible per-task random streams (spawned from
+one root seed, so results do not depend on the number of workers):
+
+    bootstrap_effects   B resamples of the samples, each re-estimating every
+                        treatment x outcome pair with the batched estimator
+                        (causal_batch.py); percentile confidence intervals.
+    refutation_panel    DoWhy refuters (placebo treatment, random common cause,
+                        data subset) for already-estimated models. Each
+                        (estimate, refuter) combination is one task that reuses
+                        the model, identified estimand and estimate built in
+                        the parent process instead of re-identifying it.
+"""
+
+import numpy as np
+import pandas as pd
+
+from causal_batch import adjusted_slopes, backdoor_effects
+from instrumentation import count
+from parallel import default_workers, process_pool
+
+DEFAULT_REFUTERS = ("placebo_treatment_refuter", "random_common_cause", "data_subset_refuter")
+
+
+# Bootstrap
+
+_boot_arrays = None
+
+
+def _init_boot_worker(arrays, single_thread=True):
+    global _boot_arrays
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _boot_arrays = arrays
+
+
+def _bootstrap_block(task):
+    seed_seq, n_resamples = task
+    Z, T, Y, keep = _boot_arrays
+    rng = np.random.default_rng(seed_seq)
+    n = len(Z)
+    estimates = np.empty((n_resamples, int(keep.sum())))
+    for b in range(n_resamples):
+        idx = rng.integers(0, n, n)
+        estimates[b] = adjusted_slopes(Z[idx], T[idx], Y[idx]).ravel()[keep]
+    return estimates
+
+
+def bootstrap_effects(data, treatments, outcomes, common_causes, n_boot=1000, block_size=50,
+                      alpha=0.05, n_jobs=None, seed=42):
+    """
+    Bootstrap the batched backdoor estimates.
+
+    Parameters:
+        data: samples x variables DataFrame
+        treatments, outcomes, common_causes: column names (see causal_batch.backdoor_effects)
+        n_boot: number of resamples
+        block_size: resamples per worker task
+        alpha: two-sided level of the percentile intervals
+
+    Returns the point-estimate table with boot_se, ci_low and ci_high columns.
+    """
+    data = data[list(dict.fromkeys([*treatments, *outcomes, *common_causes]))].dropna().reset_index(drop=True)
+    table = backdoor_effects(data, treatments, outcomes, common_causes)
+    Z = np.column_stack([np.ones(len(data)), data[list(common_causes)].to_numpy(dtype=np.float64)])
+    T = data[list(treatments)].to_numpy(dtype=np.float64)
+    Y = data[list(outcomes)].to_numpy(dtype=np.float64)
+    keep = (np.asarray(treatments, dtype=object)[:, None] != np.asarray(outcomes, dtype=object)[None, :]).ravel()
+    arrays = (Z, T, Y, keep)
+
+    sizes = [min(block_size, n_boot - start) for start in range(0, n_boot, block_size)]
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    n_jobs = n_jobs or default_workers(len(tasks))
+    if n_jobs == 1:
+        _init_boot_worker(arrays, single_thread=False)
+        blocks = [_bootstrap_block(task) for task in tasks]
+    else:
+        with process_pool(n_jobs, _init_boot_worker, (arrays,)) as pool:
+            blocks = list(pool.map(_bootstrap_block, tasks))
+    estimates = np.concatenate(blocks)                        # n_boot x pairs
+    count("bootstrap_resamples", n_boot)
+
+    table["boot_se"] = estimates.std(axis=0, ddof=1)
+    table["ci_low"] = np.quantile(estimates, alpha / 2, axis=0)
+    table["ci_high"] = np.quantile(estimates, 1 - alpha / 2, axis=0)
+    return table
+
+
+# Refutation
+
+_ref_models = None
+
+
+def _init_ref_worker(models, single_thread=True):
+    global _ref_models
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _ref_models = models
+
+
+def _refute(task):
+    label, refuter, num_simulations, seed = task
+    model, estimand, estimate = _ref_models[label]
+    result = model.refute_estimate(estimand, estimate, method_name=refuter,
+                                   num_simulations=num_simulations, random_seed=seed)
+    p_value = (result.refutation_result or {}).get("p_value", np.nan)
+    return label, refuter, float(estimate.value), float(result.new_effect), float(p_value)
+
+
+def refutation_panel(models, refuters=DEFAULT_REFUTERS, num_simulations=100, n_jobs=None, seed=42):
+    """
+    Run DoWhy refuters for estimated models.
+
+    Parameters:
+        models: {label: (CausalModel, identified estimand, estimate)}
+        refuters: DoWhy refuter method names
+        num_simulations: simulations per refuter
+
+    Returns a DataFrame with one row per (label, refuter): estimate,
+    new_effect and p_value.
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(len(models) * len(refuters))
+    tasks = [(label, refuter, num_simulations, int(seeds[k * len(refuters) + r]))
+             for k, label in enumerate(models) for r, refuter in enumerate(refuters)]
+    n_jobs = n_jobs or default_workers(len(tasks))
+    if n_jobs == 1:
+        _init_ref_worker(models, single_thread=False)
+        rows = [_refute(task) for task in tasks]
+    else:
+        with process_pool(n_jobs, _init_ref_worker, (models,)) as pool:
+            rows = list(pool.map(_refute, tasks))
+    count("refutations", len(tasks))
+    return pd.DataFrame(rows, columns=["label", "refuter", "estimate", "new_effect", "p_value"])
+
+
+def robustness_summary(refutations):
+    """One row per estimate with the new effect and p-value of each refuter side by side."""
+    wide = refutations.pivot(index="label", columns="refuter", values=["new_effect", "p_value"])
+    wide.columns = [f"{refuter}_{stat}" for stat, refuter in wide.columns]
+    estimates = refutations.groupby("label", sort=False)["estimate"].first()
+    return wide.reindex(estimates.index).assign(estimate=estimates)[
+        ["estimate", *sorted(wide.columns)]]
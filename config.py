@@ -0,0 +1,11 @@
+"""
+Shared Settings
+
+DATA_DIR is the directory through which the scripts exchange their input and
+output files. It is taken from the LIPID_DATA_DIR environment variable and
+defaults to /content, the Colab working directory.
+"""
+
+import os
+
+DATA_DIR = os.environ.get("LIPID_DATA_DIR", "/content")
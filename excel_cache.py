@@ -0,0 +1,187 @@
+"""
+Columnar Cache for Excel Inputs
+
+Parsing large workbooks is the main fixed cost of the pipeline, and several
+scripts read the same files. read_excel_cached parses a workbook once and
+stores the resulting DataFrame as an uncompressed Arrow IPC (Feather v2) file;
+later reads memory-map that file instead of parsing the workbook again.
+Frames that Arrow cannot store (e.g. non-string column labels) fall back to a
+pickle.
+
+Cache entries are keyed by the SHA-256 of the workbook contents plus the read
+options. The content hash of a file is remembered under its path, size and
+modification time, so unchanged files are not re-hashed. The cache is bounded
+in size and evicts the least recently used entries.
+
+Several scripts may read through the cache at the same time (e.g. concurrent
+pipeline stages): the index is only updated under an exclusive file lock,
+cached frames are written to a temporary name and renamed into place, and a
+cached frame that cannot be read (e.g. evicted by another process) counts as
+a miss. Reads that return several sheets (sheet_name=None or a list) are not
+cached.
+
+Environment variables:
+    LIPID_EXCEL_CACHE            cache directory (default ~/.cache/lipid_excel)
+    LIPID_EXCEL_CACHE_MAX_BYTES  size bound in bytes (default 5 GB)
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:                         # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+
+from instrumentation import count
+
+CACHE_DIR = os.environ.get("LIPID_EXCEL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "lipid_excel"))
+MAX_CACHE_BYTES = int(os.environ.get("LIPID_EXCEL_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@contextlib.contextmanager
+def _index_lock(cache_dir):
+    """Exclusive lock on the cache index, held across processes."""
+    with open(os.path.join(cache_dir, LOCK_FILE), "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"sources": {}, "entries": {}}
+
+
+def _save_index(cache_dir, index):
+    tmp = os.path.join(cache_dir, f"{INDEX_FILE}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(cache_dir, INDEX_FILE))
+
+
+def _write_frame(df, base):
+    """
+    Store df as Arrow IPC (base + '.arrow'), or as a pickle if Arrow cannot
+    hold it. The file is written under a temporary name and renamed into place.
+    """
+    tmp = f"{base}.{os.getpid()}.tmp"
+    try:
+        from pyarrow import feather
+        feather.write_feather(df, tmp, compression="uncompressed")
+        path = base + ".arrow"
+    except Exception:
+        # pyarrow missing, or labels/dtypes Arrow cannot represent
+        df.to_pickle(tmp)
+        path = base + ".pkl"
+    os.replace(tmp, path)
+    return path
+
+
+def _read_frame(path):
+    if path.endswith(".arrow"):
+        from pyarrow import feather
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_pickle(path)
+
+
+def _evict(cache_dir, index, max_bytes):
+    entries = index["entries"]
+    total = sum(e["bytes"] for e in entries.values())
+    for key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+        if total <= max_bytes:
+            break
+        total -= entries[key]["bytes"]
+        try:
+            os.remove(os.path.join(cache_dir, entries.pop(key)["file"]))
+        except FileNotFoundError:
+            pass
+    live = {key.split(":")[0] for key in entries}
+    index["sources"] = {src: digest for src, digest in index["sources"].items() if digest in live}
+
+
+def read_excel_cached(path, cache_dir=None, max_bytes=None, **read_kwargs):
+    """
+    pd.read_excel through the columnar cache.
+
+    Parameters:
+        path: workbook path
+        cache_dir: cache directory (default CACHE_DIR)
+        max_bytes: cache size bound (default MAX_CACHE_BYTES)
+        read_kwargs: passed to pd.read_excel (e.g. index_col=0, sheet_name=...)
+
+    Returns the DataFrame, identical to pd.read_excel(path, **read_kwargs).
+    Multi-sheet reads (sheet_name=None or a list) return pd.read_excel's dict
+    of DataFrames and bypass the cache.
+    """
+    sheet_name = read_kwargs.get("sheet_name", 0)
+    if sheet_name is None or isinstance(sheet_name, (list, tuple)):
+        count("excel_files_parsed")
+        return pd.read_excel(path, **read_kwargs)
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+    st = os.stat(path)
+    source = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    options = hashlib.sha256(json.dumps(read_kwargs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    with _index_lock(cache_dir):
+        index = _load_index(cache_dir)
+    digest = index["sources"].get(source) or file_hash(path)
+    key = f"{digest}:{options}"
+
+    df = None
+    entry = index["entries"].get(key)
+    if entry is not None:
+        try:
+            df = _read_frame(os.path.join(cache_dir, entry["file"]))
+            count("excel_cache_hits")
+        except Exception:
+            # Evicted or replaced by another process since the index was read: a miss
+            entry = None
+    if entry is None:
+        df = pd.read_excel(path, **read_kwargs)
+        count("excel_files_parsed")
+        stored = _write_frame(df, os.path.join(cache_dir, f"{digest[:32]}-{options}"))
+        entry = {"file": os.path.basename(stored), "bytes": os.path.getsize(stored)}
+
+    # Merge into the current index; other processes may have updated it meanwhile
+    with _index_lock(cache_dir):
+        index = _load_index(cache_dir)
+        prefix = source.rsplit("|", 2)[0] + "|"
+        index["sources"] = {src: d for src, d in index["sources"].items() if not src.startswith(prefix)}
+        index["sources"][source] = digest
+        if os.path.exists(os.path.join(cache_dir, entry["file"])):
+            index["entries"].setdefault(key, entry)["last_used"] = time.time()
+        _evict(cache_dir, index, max_bytes)
+        _save_index(cache_dir, index)
+    return df
@@ -0,0 +1,124 @@
+"""
+Feature Pre-Screening
+
+Reduces the gene set before model fitting (Lasso in Code 2, LightGBM in
+Code 10). Genes are removed in three stages, each a chunked, vectorized pass
+over a genes x samples matrix (an ndarray or a memory-mapped .npy file):
+
+    low_variance    sample variance below min_variance
+    low_detection   fraction of samples with expression > detection_threshold
+                    below min_detection
+    correlated      |Pearson r| >= max_corr with a gene already kept; genes are
+                    visited in order of decreasing variance, so each redundant
+                    gene maps to the highest-variance member of its cluster
+
+Standardized rows are written to a scratch memmap, so only one chunk of genes
+and one chunk of kept representatives are in memory at a time. The result is
+the list of kept genes and a table mapping every dropped gene to the reason
+and, for correlated genes, to the gene that represents it.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def _open_matrix(X):
+    if isinstance(X, (str, os.PathLike)):
+        return np.load(X, mmap_mode="r")
+    return X
+
+
+def screen_features(X, genes, min_variance=1e-8, min_detection=0.0, detection_threshold=0.0,
+                    max_corr=0.95, chunk_size=1024, work_dir=None):
+    """
+    Select a reduced, non-redundant gene set.
+
+    Parameters:
+        X: genes x samples matrix, or the path of a .npy file (memory-mapped)
+        genes: gene names (rows of X)
+        min_variance: minimum sample variance (ddof=1)
+        min_detection: minimum fraction of samples above detection_threshold
+        max_corr: correlation threshold for deduplication (None = keep all)
+        chunk_size: genes per vectorized block
+        work_dir: directory for the standardized scratch memmap (default: temp dir)
+
+    Returns (kept, dropped): kept gene names in original order, and a DataFrame
+    indexed by dropped gene with columns reason, representative and correlation.
+    """
+    X = _open_matrix(X)
+    n_genes, n_samples = X.shape
+    genes = list(genes)
+    variance = np.empty(n_genes)
+    detection = np.empty(n_genes)
+
+    # Pass 1: per-gene variance and detection rate
+    for start in range(0, n_genes, chunk_size):
+        block = np.asarray(X[start:start + chunk_size], dtype=np.float64)
+        variance[start:start + len(block)] = block.var(axis=1, ddof=1)
+        detection[start:start + len(block)] = (block > detection_threshold).mean(axis=1)
+
+    reason = np.full(n_genes, "", dtype=object)
+    reason[detection < min_detection] = "low_detection"
+    reason[variance < min_variance] = "low_variance"
+    representative = np.full(n_genes, None, dtype=object)
+    correlation = np.full(n_genes, np.nan)
+    candidates = np.flatnonzero(reason == "")
+
+    if max_corr is not None and len(candidates):
+        order = candidates[np.argsort(-variance[candidates], kind="stable")]
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+            # Pass 2: standardized rows (unit norm), in visiting order
+            Z = np.lib.format.open_memmap(os.path.join(tmp, "standardized.npy"), mode="w+",
+                                          dtype=np.float64, shape=(len(order), n_samples))
+            for start in range(0, len(order), chunk_size):
+                rows = order[start:start + chunk_size]
+                block = np.asarray(X[np.sort(rows)], dtype=np.float64)[np.argsort(np.argsort(rows))]
+                block -= block.mean(axis=1, keepdims=True)
+                norm = np.linalg.norm(block, axis=1, keepdims=True)
+                block /= np.where(norm > 0, norm, 1.0)
+                Z[start:start + len(rows)] = block
+
+            # Pass 3: greedy deduplication against the genes kept so far
+            kept_pos = []                                  # positions in `order`
+            for start in range(0, len(order), chunk_size):
+                block = np.asarray(Z[start:start + chunk_size])
+                best = np.zeros(len(block))
+                best_rep = np.full(len(block), -1)
+                for k0 in range(0, len(kept_pos), chunk_size):
+                    reps = kept_pos[k0:k0 + chunk_size]
+                    r = np.abs(block @ np.asarray(Z[reps]).T)
+                    j = r.argmax(axis=1)
+                    better = r[np.arange(len(block)), j] > best
+                    best[better] = r[np.arange(len(block)), j][better]
+                    best_rep[better] = np.asarray(reps)[j[better]]
+                within = np.abs(block @ block.T)
+                kept_here = []
+                for i in range(len(block)):
+                    if kept_here:
+                        r = within[i, kept_here]
+                        j = int(r.argmax())
+                        if r[j] > best[i]:
+                            best[i], best_rep[i] = r[j], start + kept_here[j]
+                    if best[i] >= max_corr:
+                        gene = order[start + i]
+                        reason[gene] = "correlated"
+                        representative[gene] = genes[order[best_rep[i]]]
+                        correlation[gene] = best[i]
+                    else:
+                        kept_here.append(i)
+                kept_pos.extend(start + i for i in kept_here)
+            del Z
+
+    dropped_idx = np.flatnonzero(reason != "")
+    kept = [genes[i] for i in np.flatnonzero(reason == "")]
+    dropped = pd.DataFrame({
+        "reason": reason[dropped_idx],
+        "representative": representative[dropped_idx],
+        "correlation": correlation[dropped_idx],
+        "variance": variance[dropped_idx],
+        "detection_rate": detection[dropped_idx],
+    }, index=pd.Index([genes[i] for i in dropped_idx], name="gene"))
+    return kept, dropped
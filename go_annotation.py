@@ -0,0 +1,358 @@
+"""
+Offline GO Biological Process Annotation Store
+
+Local SQLite cache of mygene.info GO:BP annotations keyed by the cleaned
+(version-less) Ensembl gene ID, used by Code 1 to select lipid-related genes
+without querying the annotation service on every run.
+
+The store is filled from a local dump file (JSON lines or a JSON array of
+mygene hits as returned by `MyGeneInfo.querymany(..., fields="go.BP.term")`)
+and keeps a precomputed inverted index from term keyword (e.g. "lipid") to
+gene set, so gene selection is an indexed lookup. Every gene row carries the
+annotation version it was loaded from; loading a new version and evicting the
+old one is done with `refresh`.
+
+Genes missing from the store are fetched with `AnnotationClient`, which sends
+deduplicated batches to the mygene.info query endpoint over a bounded thread
+pool, retries failed batches with exponential backoff (splitting them and
+shrinking the batch size) and writes every finished batch into the store.
+"""
+
+import gzip
+import hashlib
+import http.client
+import json
+import random
+import sqlite3
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS genes (
+    ensembl_id TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    found INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term_id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gene_terms (
+    ensembl_id TEXT NOT NULL,
+    term_id INTEGER NOT NULL,
+    PRIMARY KEY (ensembl_id, term_id)
+);
+CREATE INDEX IF NOT EXISTS gene_terms_by_term ON gene_terms (term_id);
+CREATE TABLE IF NOT EXISTS keyword_index (
+    keyword TEXT NOT NULL,
+    ensembl_id TEXT NOT NULL,
+    PRIMARY KEY (keyword, ensembl_id)
+);
+CREATE TABLE IF NOT EXISTS indexed_keywords (
+    keyword TEXT PRIMARY KEY
+);
+"""
+
+DEFAULT_KEYWORDS = ("lipid",)
+
+
+def clean_ensembl_id(gene_id):
+    """Remove the version suffix from an Ensembl ID (ENSG00000123456.7 -> ENSG00000123456)."""
+    return str(gene_id).split(".")[0]
+
+
+def bp_terms(hit):
+    """GO:BP term names of one mygene hit (handles the single-term dict form)."""
+    terms = hit.get("go", {}).get("BP", [])
+    if isinstance(terms, dict):
+        terms = [terms]
+    return [t["term"] for t in terms if "term" in t]
+
+
+def read_dump(path):
+    """Yield mygene hits from a JSON-lines or JSON-array dump (optionally gzipped)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            for hit in json.loads(first + f.read()):
+                yield hit
+            return
+        line = first + f.readline()
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = f.readline()
+
+
+def dump_version(path):
+    """Content hash of a dump file, used as its version when none is given."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+class GOAnnotationStore:
+    """SQLite-backed GO:BP annotation cache with a keyword -> gene inverted index."""
+
+    def __init__(self, path, keywords=DEFAULT_KEYWORDS):
+        self.path = path
+        self.keywords = tuple(k.lower() for k in keywords)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Versioning
+
+    @property
+    def version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def _set_version(self, version):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+
+    # Loading
+
+    def add_hits(self, hits, version=None):
+        """
+        Insert mygene hits (replacing earlier annotations of the same genes).
+
+        Hits without a "query" field are ignored; "notfound" hits are recorded
+        so the gene is not queried again for this version.
+        """
+        version = version or self.version
+        if version is None:
+            raise ValueError("An annotation version is required for an empty store")
+        with self.conn:
+            if self.version is None:
+                self._set_version(version)
+            return self._insert_hits(hits, version)
+
+    def _insert_hits(self, hits, version):
+        """Write hits under `version` within the caller's transaction; returns the number of genes."""
+        genes = {}
+        for hit in hits:
+            if "query" not in hit:
+                continue
+            gene = clean_ensembl_id(hit["query"])
+            terms = genes.setdefault(gene, [False, set()])
+            if not hit.get("notfound"):
+                terms[0] = True
+                terms[1].update(bp_terms(hit))
+
+        ids = [(g,) for g in genes]
+        self.conn.executemany("DELETE FROM gene_terms WHERE ensembl_id = ?", ids)
+        self.conn.executemany("DELETE FROM keyword_index WHERE ensembl_id = ?", ids)
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO genes (ensembl_id, version, found) VALUES (?, ?, ?)",
+            [(g, version, int(found)) for g, (found, _) in genes.items()])
+        all_terms = {t for _, terms in genes.values() for t in terms}
+        self.conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)",
+                              [(t,) for t in all_terms])
+        term_ids = dict(self.conn.execute("SELECT term, term_id FROM terms"))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO gene_terms (ensembl_id, term_id) VALUES (?, ?)",
+            [(g, term_ids[t]) for g, (_, terms) in genes.items() for t in terms])
+        indexed = [k for (k,) in self.conn.execute("SELECT keyword FROM indexed_keywords")]
+        for keyword in set(indexed) | set(self.keywords):
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO keyword_index (keyword, ensembl_id) VALUES (?, ?)",
+                [(keyword, g) for g, (_, terms) in genes.items()
+                 if any(keyword in t.lower() for t in terms)])
+            self.conn.execute("INSERT OR IGNORE INTO indexed_keywords (keyword) VALUES (?)",
+                              (keyword,))
+        return len(genes)
+
+    def load_dump(self, path, version=None):
+        """Load a local dump file; the version defaults to the dump's content hash."""
+        return self.add_hits(read_dump(path), version or dump_version(path))
+
+    def refresh(self, path, version=None):
+        """
+        Make `version` the current annotation version, loading it from the dump
+        and evicting genes annotated under any other version. No-op if the store
+        is already at that version. Loading, the version switch and the eviction
+        are one transaction: if the dump cannot be read, the store is unchanged.
+        """
+        version = version or dump_version(path)
+        if self.version == version:
+            return 0
+        with self.conn:
+            n = self._insert_hits(read_dump(path), version)
+            self._set_version(version)
+            self._evict(version)
+        return n
+
+    def evict(self, version=None):
+        """Drop all genes whose annotation version differs from `version` (default: current)."""
+        version = version or self.version
+        with self.conn:
+            return self._evict(version)
+
+    def _evict(self, version):
+        stale = "SELECT ensembl_id FROM genes WHERE version != ?"
+        self.conn.execute(f"DELETE FROM gene_terms WHERE ensembl_id IN ({stale})", (version,))
+        self.conn.execute(f"DELETE FROM keyword_index WHERE ensembl_id IN ({stale})", (version,))
+        n = self.conn.execute("DELETE FROM genes WHERE version != ?", (version,)).rowcount
+        self.conn.execute(
+            "DELETE FROM terms WHERE term_id NOT IN (SELECT DISTINCT term_id FROM gene_terms)")
+        return n
+
+    # Lookups
+
+    def missing(self, gene_ids):
+        """Cleaned IDs from `gene_ids` with no annotation at the current version (input order kept)."""
+        version = self.version
+        known = {g for (g,) in self.conn.execute(
+            "SELECT ensembl_id FROM genes WHERE version = ?", (version,))}
+        seen = set()
+        out = []
+        for g in gene_ids:
+            g = clean_ensembl_id(g)
+            if g not in known and g not in seen:
+                seen.add(g)
+                out.append(g)
+        return out
+
+    def _build_keyword(self, keyword):
+        with self.conn:
+            self.conn.execute(
+                """INSERT OR IGNORE INTO keyword_index (keyword, ensembl_id)
+                   SELECT DISTINCT ?, gt.ensembl_id FROM gene_terms gt
+                   JOIN terms t ON t.term_id = gt.term_id
+                   WHERE instr(lower(t.term), ?) > 0""", (keyword, keyword))
+            self.conn.execute("INSERT OR IGNORE INTO indexed_keywords (keyword) VALUES (?)",
+                              (keyword,))
+
+    def genes_with_keyword(self, keyword):
+        """
+        Set of cleaned Ensembl IDs with at least one GO:BP term containing
+        `keyword` (case-insensitive substring, as in the original Code 1 loop).
+        """
+        keyword = keyword.lower()
+        if not self.conn.execute("SELECT 1 FROM indexed_keywords WHERE keyword = ?",
+                                 (keyword,)).fetchone():
+            self._build_keyword(keyword)
+        return {g for (g,) in self.conn.execute(
+            "SELECT ensembl_id FROM keyword_index WHERE keyword = ?", (keyword,))}
+
+    def terms_for(self, gene_id):
+        return [t for (t,) in self.conn.execute(
+            """SELECT t.term FROM gene_terms gt JOIN terms t ON t.term_id = gt.term_id
+               WHERE gt.ensembl_id = ? ORDER BY t.term""", (clean_ensembl_id(gene_id),))]
+
+
+def lipid_related_genes(store, gene_ids, keyword="lipid"):
+    """Cleaned IDs among `gene_ids` annotated with a GO:BP term containing `keyword`."""
+    hits = store.genes_with_keyword(keyword)
+    return [g for g in dict.fromkeys(clean_ensembl_id(x) for x in gene_ids) if g in hits]
+
+
+class AnnotationClient:
+    """
+    Concurrent, retrying batch client for the mygene.info `/query` endpoint.
+
+    Parameters:
+        store: GOAnnotationStore receiving the results (written from the calling thread)
+        base_url: service root, e.g. a local stand-in server in tests
+        max_workers: number of batch requests in flight
+        batch_size: initial IDs per request; grows back to max_batch_size after
+            successes and is halved after failures (never below min_batch_size)
+        max_retries: attempts per ID before it is reported as failed
+        backoff: base delay in seconds, doubled per attempt with jitter
+    """
+
+    def __init__(self, store, base_url="https://mygene.info/v3", max_workers=4,
+                 batch_size=500, min_batch_size=25, max_batch_size=1000,
+                 max_retries=5, backoff=1.0, timeout=60, species="human",
+                 scopes="ensembl.gene", fields="go.BP.term"):
+        self.store = store
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.species = species
+        self.scopes = scopes
+        self.fields = fields
+
+    def query_batch(self, ids, attempt=0):
+        """POST one batch of IDs; sleeps for the backoff delay first when retrying."""
+        if attempt:
+            delay = self.backoff * 2 ** (attempt - 1)
+            time.sleep(delay * (0.5 + random.random()))
+        data = urllib.parse.urlencode({
+            "q": ",".join(ids),
+            "scopes": self.scopes,
+            "fields": self.fields,
+            "species": self.species,
+        }).encode()
+        req = urllib.request.Request(f"{self.base_url}/query", data=data, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            hits = json.loads(resp.read().decode())
+        if not isinstance(hits, list):
+            raise ValueError(f"Unexpected response from annotation service: {str(hits)[:200]}")
+        return hits
+
+    def annotate(self, gene_ids):
+        """
+        Fetch every ID from `gene_ids` (cleaned, deduplicated) that the store does
+        not already hold and write the results into the store.
+
+        Returns the list of IDs that still failed after all retries; rerunning
+        only re-queries those.
+        """
+        version = self.store.version or "mygene-live"
+        pending = deque((g, 0) for g in self.store.missing(gene_ids))
+        failed = []
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or in_flight:
+                while pending and len(in_flight) < self.max_workers:
+                    attempt = pending[0][1]
+                    batch = []
+                    while pending and pending[0][1] == attempt and len(batch) < self.batch_size:
+                        batch.append(pending.popleft()[0])
+                    in_flight[pool.submit(self.query_batch, batch, attempt)] = (batch, attempt)
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, attempt = in_flight.pop(future)
+                    try:
+                        hits = future.result()
+                    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+                        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                        if attempt + 1 >= self.max_retries:
+                            print(f"Annotation batch of {len(batch)} IDs failed after "
+                                  f"{attempt + 1} attempts: {e}")
+                            failed.extend(batch)
+                        else:
+                            pending.extend((g, attempt + 1) for g in batch)
+                        continue
+                    self.store.add_hits(hits, version)
+                    self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        return failed
@@ -0,0 +1,180 @@
+"""
+Cohort-Level HTSeq Ingest
+
+Parses a directory (or glob) of HTSeq-count files in parallel with streaming
+readers and writes one genes x samples count matrix to a memory-mapped .npy
+file. CPM / log2CPM values are then computed for all samples in one vectorized
+pass over the matrix.
+
+Output directory layout:
+    counts.npy    raw counts, genes x samples (float64, column-major memmap)
+    log2cpm.npy   log2(CPM + 1), same shape and layout
+    genes.txt     one gene ID per line (row order)
+    samples.txt   one sample name per line (column order)
+"""
+
+import glob
+import os
+
+import numpy as np
+
+from instrumentation import count
+from parallel import default_workers, process_pool
+
+
+def list_htseq_files(source):
+    """Resolve a directory or glob pattern into a sorted list of HTSeq files."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, f) for f in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    paths = sorted(p for p in paths if os.path.isfile(p))
+    if not paths:
+        raise ValueError(f"No HTSeq count files found for: {source}")
+    return paths
+
+
+def sample_name(path):
+    """Sample name derived from the file name (extension stripped)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def iter_htseq(path):
+    """Stream (gene_id, count) pairs from an HTSeq file, skipping '__' summary rows."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("__"):
+                continue
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                n_reads = float(parts[1])
+            except (IndexError, ValueError):
+                n_reads = 0.0  # same as pd.to_numeric(errors='coerce').fillna(0)
+            yield parts[0], 0.0 if n_reads != n_reads else n_reads
+
+
+def read_gene_ids(path):
+    return [gene for gene, _ in iter_htseq(path)]
+
+
+# Worker state, set once per process by the pool initializer
+_matrix_path = None
+_gene_index = None
+_genes = None
+
+
+def _init_worker(matrix_path, genes):
+    global _matrix_path, _gene_index, _genes
+    _matrix_path = matrix_path
+    _genes = genes
+    _gene_index = None
+
+
+def _ingest_one(task):
+    """Parse one file straight into its column of the shared count matrix."""
+    global _gene_index
+    col, path = task
+    counts = np.lib.format.open_memmap(_matrix_path, mode="r+")
+    column = counts[:, col]
+    row = 0
+    for gene, n_reads in iter_htseq(path):
+        # Files from the same annotation share the gene order; fall back to a
+        # lookup only when the order differs.
+        if row < len(_genes) and _genes[row] == gene:
+            column[row] = n_reads
+        else:
+            if _gene_index is None:
+                _gene_index = {g: i for i, g in enumerate(_genes)}
+            if gene not in _gene_index:
+                raise ValueError(f"{path}: gene '{gene}' not present in the reference gene list")
+            column[_gene_index[gene]] = n_reads
+        row += 1
+    counts.flush()
+    del counts
+    return col
+
+
+def compute_log2cpm(counts_path, out_path, block_size=256):
+    """
+    Write log2(CPM + 1) for every sample of a memory-mapped count matrix.
+
+    Library sizes are computed in one pass; CPM/log2CPM is then evaluated on
+    contiguous blocks of samples so memory stays bounded by the block.
+    """
+    counts = np.load(counts_path, mmap_mode="r")
+    n_genes, n_samples = counts.shape
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float64,
+                                    shape=(n_genes, n_samples), fortran_order=True)
+    for start in range(0, n_samples, block_size):
+        block = np.asarray(counts[:, start:start + block_size])
+        lib_size = block.sum(axis=0)
+        lib_size[lib_size == 0] = 1.0  # empty libraries stay at log2CPM = 0
+        out[:, start:start + block_size] = np.log2(block / lib_size * 1e6 + 1)
+    out.flush()
+    return out
+
+
+def ingest_cohort(source, out_dir, n_workers=None):
+    """
+    Build the genes x samples count and log2CPM matrices for a cohort.
+
+    Parameters:
+        source: directory or glob of HTSeq-count files (one file per sample)
+        out_dir: directory receiving counts.npy, log2cpm.npy, genes.txt, samples.txt
+        n_workers: number of parser processes (default: all cores)
+
+    Returns a dict with the gene IDs, sample names and the memory-mapped matrices.
+    """
+    paths = list_htseq_files(source)
+    samples = [sample_name(p) for p in paths]
+    if len(set(samples)) != len(samples):
+        raise ValueError("Duplicate sample names in cohort; file names must be unique")
+
+    os.makedirs(out_dir, exist_ok=True)
+    genes = read_gene_ids(paths[0])
+    counts_path = os.path.join(out_dir, "counts.npy")
+    counts = np.lib.format.open_memmap(counts_path, mode="w+", dtype=np.float64,
+                                       shape=(len(genes), len(paths)), fortran_order=True)
+    del counts
+
+    n_workers = n_workers or default_workers(len(paths))
+    tasks = list(enumerate(paths))
+    if n_workers == 1:
+        _init_worker(counts_path, genes)
+        for task in tasks:
+            _ingest_one(task)
+            count("htseq_files_parsed")
+    else:
+        with process_pool(n_workers, _init_worker, (counts_path, genes)) as pool:
+            for _ in pool.map(_ingest_one, tasks, chunksize=max(1, len(tasks) // (4 * n_workers))):
+                count("htseq_files_parsed")
+
+    log2cpm = compute_log2cpm(counts_path, os.path.join(out_dir, "log2cpm.npy"))
+
+    with open(os.path.join(out_dir, "genes.txt"), "w") as f:
+        f.write("\n".join(genes) + "\n")
+    with open(os.path.join(out_dir, "samples.txt"), "w") as f:
+        f.write("\n".join(samples) + "\n")
+
+    return {
+        "genes": genes,
+        "samples": samples,
+        "counts": np.load(counts_path, mmap_mode="r"),
+        "log2cpm": log2cpm,
+    }
+
+
+def load_cohort(out_dir):
+    """Re-open a previously ingested cohort without re-parsing any file."""
+    with open(os.path.join(out_dir, "genes.txt")) as f:
+        genes = f.read().splitlines()
+    with open(os.path.join(out_dir, "samples.txt")) as f:
+        samples = f.read().splitlines()
+    return {
+        "genes": genes,
+        "samples": samples,
+        "counts": np.load(os.path.join(out_dir, "counts.npy"), mmap_mode="r"),
+        "log2cpm": np.load(os.path.join(out_dir, "log2cpm.npy"), mmap_mode="r"),
+    }
@@ -0,0 +1,241 @@
+"""
+Run Instrumentation
+
+Timers, memory figures and counters for the scripts and their hot loops.
+Instrumentation is off unless the LIPID_INSTRUMENT environment variable is
+set (to anything but "" or "0"); when off, every call below returns after a
+single check of a module global, so the calls can stay in the hot loops.
+
+    step("5. Run simulation")   marks the start of a numbered script step (the
+                                previous step ends there; the last one ends
+                                at exit)
+    section("Excel export")     context manager for a nested block
+    count("ode_run_steps", n)   adds n to a per-iteration counter
+
+Every step and section records its wall and CPU time, the resident set size
+at its end, the process peak RSS (high-water mark; on Windows only with
+psutil installed) and how much the step raised it, and the counters incremented while it ran, with their rates per
+second (e.g. genes fitted, ODE run-steps, models trained per second).
+Counters are incremented in the parent process, where results of worker
+pools arrive.
+
+Further options:
+    LIPID_INSTRUMENT_DIR    report directory (default: DATA_DIR/instrumentation)
+    LIPID_INSTRUMENT_ALLOC  "1": also trace Python allocations with tracemalloc
+                            and report the allocation peak per step (slower)
+    LIPID_PROFILE           "1": profile the whole run with cProfile and dump
+                            <report>.prof (view with snakeviz, or render a
+                            flame graph with flameprof / gprof2dot)
+
+At exit the report is written as <script>_<timestamp>.json (run summary,
+counter totals and steps) and .csv (one row per step).
+"""
+
+import atexit
+import cProfile
+import csv
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:                         # Windows
+    resource = None
+
+from config import DATA_DIR
+
+
+def _enabled(var):
+    return os.environ.get(var, "") not in ("", "0")
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size (high-water mark) of this process in MB; without the
+    resource module (Windows) the peak working set from psutil, if installed,
+    otherwise None.
+    """
+    if resource is None:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        peak = getattr(psutil.Process().memory_info(), "peak_wset", None)
+        return None if peak is None else peak / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024   # bytes on macOS, KiB on Linux
+
+
+class Recorder:
+    """
+    Collects the steps and counters of one run and writes the report.
+
+    Parameters:
+        report_dir: directory of the JSON / CSV report
+        trace_alloc: trace allocations with tracemalloc
+        profile: profile the run with cProfile
+    """
+
+    def __init__(self, report_dir, trace_alloc=False, profile=False):
+        self.report_dir = report_dir
+        self.trace_alloc = trace_alloc
+        self.pid = os.getpid()
+        self.counters = {}
+        self.steps = []
+        self.open = []                      # stack of running steps / sections
+        self.started = time.time()
+        self.wall0, self.cpu0 = time.perf_counter(), time.process_time()
+        if trace_alloc:
+            tracemalloc.start()
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            self.profiler.enable()
+        self._push("(startup)")
+
+    def _push(self, name):
+        if self.trace_alloc:
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            for rec in self.open:               # keep the enclosing steps' peaks before resetting
+                rec["alloc_peak"] = max(rec["alloc_peak"], traced_peak)
+            tracemalloc.reset_peak()
+        self.open.append({"name": " / ".join([r["name"] for r in self.open] + [name]),
+                          "depth": len(self.open), "wall": time.perf_counter(), "cpu": time.process_time(),
+                          "peak_rss": peak_rss_mb(), "counters": dict(self.counters), "alloc_peak": 0})
+
+    def _pop(self):
+        rec = self.open.pop()
+        seconds = time.perf_counter() - rec["wall"]
+        peak = peak_rss_mb()
+        counts = {k: v - rec["counters"].get(k, 0) for k, v in self.counters.items()
+                  if v != rec["counters"].get(k, 0)}
+        row = {"step": rec["name"], "depth": rec["depth"], "seconds": seconds,
+               "cpu_seconds": time.process_time() - rec["cpu"], "rss_mb": current_rss_mb(),
+               "peak_rss_mb": peak, "peak_rss_growth_mb": None if peak is None else peak - rec["peak_rss"],
+               "counters": counts,
+               "rates": {k: v / seconds for k, v in counts.items() if seconds > 0}}
+        if self.trace_alloc:
+            alloc_peak = max(rec["alloc_peak"], tracemalloc.get_traced_memory()[1])
+            row["alloc_peak_mb"] = alloc_peak / 2 ** 20
+            for parent in self.open:
+                parent["alloc_peak"] = max(parent["alloc_peak"], alloc_peak)
+        self.steps.append(row)
+
+    def step(self, name):
+        while self.open:
+            self._pop()
+        self._push(name)
+
+    def report(self, path=None):
+        """Close all steps and write the JSON / CSV report (and the profile). Returns the JSON path."""
+        while self.open:
+            self._pop()
+        if path is None:
+            script = os.path.splitext(os.path.basename(sys.argv[0]))[0].replace(" ", "_").lstrip("-") or "python"
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+            path = os.path.join(self.report_dir, f"{script}_{stamp}_{self.pid}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        base = os.path.splitext(path)[0]
+        summary = {
+            "script": sys.argv[0], "argv": sys.argv[1:],
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self.wall0, "cpu_seconds": time.process_time() - self.cpu0,
+            "peak_rss_mb": peak_rss_mb(), "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "counters": self.counters, "steps": self.steps,
+        }
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(base + ".prof")
+            summary["profile"] = base + ".prof"
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=1)
+
+        names = sorted({k for row in self.steps for k in row["counters"]})
+        with open(base + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            fixed = [k for k in self.steps[0] if k not in ("counters", "rates")] if self.steps else []
+            writer.writerow(fixed + [f"count_{k}" for k in names] + [f"rate_{k}" for k in names])
+            for row in self.steps:
+                writer.writerow([row[k] for k in fixed] + [row["counters"].get(k, "") for k in names]
+                                + [row["rates"].get(k, "") for k in names])
+        return path
+
+    def _at_exit(self):
+        if os.getpid() == self.pid:         # forked pool workers inherit the recorder
+            self.report()
+
+
+_recorder = None
+
+
+def enable(report_dir=None, trace_alloc=None, profile=None):
+    """Start recording (called at import when LIPID_INSTRUMENT is set); the report is written at exit."""
+    global _recorder
+    if _recorder is None:
+        report_dir = report_dir or os.environ.get("LIPID_INSTRUMENT_DIR") or os.path.join(DATA_DIR,
+                                                                                         "instrumentation")
+        trace_alloc = _enabled("LIPID_INSTRUMENT_ALLOC") if trace_alloc is None else trace_alloc
+        profile = _enabled("LIPID_PROFILE") if profile is None else profile
+        _recorder = Recorder(report_dir, trace_alloc, profile)
+        atexit.register(_recorder._at_exit)
+    return _recorder
+
+
+def step(name):
+    """Start a top-level step; the previous step ends here."""
+    if _recorder is not None:
+        _recorder.step(name)
+
+
+class _Section:
+    __slots__ = ("recorder", "name")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.recorder._push(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if self.recorder.open:
+            self.recorder._pop()
+
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_SECTION = _NullSection()
+
+
+def section(name):
+    """Context manager timing a block nested in the current step."""
+    return _NULL_SECTION if _recorder is None else _Section(_recorder, name)
+
+
+def count(name, n=1):
+    """Add n to a counter."""
+    if _recorder is not None:
+        _recorder.counters[name] = _recorder.counters.get(name, 0) + n
+
+
+if _enabled("LIPID_INSTRUMENT"):
+    enable()
@@ -0,0 +1,456 @@
+"""
+Parallel Lasso Network Inference
+
+Process-parallel version of the per-gene LassoCV loop of Code 2. The expression
+matrix is written once to a memory-mapped .npy file that every worker opens
+read-only, so it is shared through the page cache instead of being pickled to
+each process.
+
+Each worker handles a contiguous block of genes and keeps a single
+samples x (genes - 1) design buffer: moving from gene i to gene i + 1 only
+column i of the buffer changes, so each regression's design matrix is built
+with one column copy instead of `np.delete(X, i, axis=0).T`.
+
+Coefficient rows are written into a memory-mapped interaction matrix as soon
+as they are fitted and flushed in groups of FLUSH_EVERY genes, after which
+their per-row completion flags are set. Re-running with the same work
+directory resumes from the completed rows. Every fit uses the
+same LassoCV settings as the serial loop, so results match it exactly.
+
+`all_nodes_lasso` is a faster alternative for the same problem: because every
+regression uses the same samples, the centered data (and, when there are at
+least as many samples as genes, the Gram matrix) of each CV fold is computed
+once and each gene's problem is read from it (target column removed by zeroing
+it in a per-process copy), then solved by coordinate descent with warm starts along the alpha path.
+The final refit is a single fit at the selected alpha, started from the mean
+of the fold solutions at that alpha. It reproduces LassoCV's alpha grid, fold
+MSE and alpha selection, so coefficients agree with the per-gene loop up to
+the solver tolerance.
+
+`stability_selection` repeats the inference on B bootstrap or subsample draws
+of the samples across a process pool. Each worker keeps running edge-selection
+counts and coefficient sums for its share of the draws, so memory stays at
+O(genes^2) per worker regardless of B, and the thresholded selection
+frequencies give a consensus network.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from sklearn.linear_model import LassoCV, lasso_path
+from sklearn.model_selection import KFold
+
+from instrumentation import count
+from parallel import default_workers, process_pool
+
+DEFAULT_LASSO_PARAMS = {"cv": 5, "random_state": 42, "max_iter": 5000}
+FLUSH_EVERY = 64       # genes fitted between flushes of the interaction memmap
+
+
+def fit_gene(design, y, lasso_params):
+    """Fit one LassoCV model and return its coefficients."""
+    model = LassoCV(**lasso_params)
+    model.fit(design, y)
+    return model.coef_
+
+
+def fill_design(design, XT, i):
+    """Fill the design buffer with every column of XT except column i."""
+    design[:, :i] = XT[:, :i]
+    design[:, i:] = XT[:, i + 1:]
+
+
+def insert_row(interaction, i, coefs):
+    interaction[i, :i] = coefs[:i]
+    interaction[i, i + 1:] = coefs[i:]
+
+
+def lassocv_network(X, lasso_params=None, count_fits=True):
+    """
+    In-memory serial version of the per-gene LassoCV loop (genes x samples input).
+    count_fits: add each fitted gene to the genes_fitted counter.
+    """
+    lasso_params = DEFAULT_LASSO_PARAMS if lasso_params is None else lasso_params
+    XT = np.asfortranarray(np.asarray(X, dtype=np.float64).T)
+    n_genes = XT.shape[1]
+    design = np.empty((XT.shape[0], n_genes - 1), dtype=np.float64, order="F")
+    interaction = np.zeros((n_genes, n_genes))
+    for i in range(n_genes):
+        if i == 0:
+            fill_design(design, XT, 0)
+        else:
+            design[:, i - 1] = XT[:, i - 1]
+        insert_row(interaction, i, fit_gene(design, XT[:, i], lasso_params))
+        if count_fits:
+            count("genes_fitted")
+    return interaction
+
+
+# Worker state, set once per process by the pool initializer
+_XT = None
+_interaction = None
+_done = None
+_lasso_params = None
+
+
+def _init_worker(expr_path, matrix_path, done_path, lasso_params, single_thread=True):
+    global _XT, _interaction, _done, _lasso_params
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)  # one BLAS thread per worker process
+    _XT = np.load(expr_path, mmap_mode="r")
+    _interaction = np.load(matrix_path, mmap_mode="r+")
+    _done = np.load(done_path, mmap_mode="r+")
+    _lasso_params = lasso_params
+
+
+def _mark_done(fitted):
+    """Flush the fitted rows, then flag them as done (so a flag never precedes its row on disk)."""
+    _interaction.flush()
+    _done[fitted] = True
+    _done.flush()
+    fitted.clear()
+
+
+def _fit_block(genes_idx):
+    """
+    Fit a run of consecutive genes, updating the design buffer one column at a
+    time. Rows are flushed and flagged done every FLUSH_EVERY genes and at the
+    end of the block, since each flush writes back the whole interaction memmap.
+    """
+    design = np.empty((_XT.shape[0], _XT.shape[1] - 1), dtype=_XT.dtype, order="F")
+    prev = None
+    fitted = []
+    for i in genes_idx:
+        if prev is not None and i == prev + 1:
+            design[:, prev] = _XT[:, prev]
+        else:
+            fill_design(design, _XT, i)
+        prev = i
+        coefs = fit_gene(design, np.asarray(_XT[:, i]), _lasso_params)
+        insert_row(_interaction, i, coefs)
+        fitted.append(i)
+        if len(fitted) >= FLUSH_EVERY:
+            _mark_done(fitted)
+    if fitted:
+        _mark_done(fitted)
+    return len(genes_idx)
+
+
+def _run_key(XT, lasso_params):
+    h = hashlib.sha256()
+    h.update(np.asfortranarray(XT).tobytes())
+    h.update(str(XT.shape).encode())
+    h.update(json.dumps(lasso_params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _blocks(pending, n_blocks):
+    """Split the pending gene indices into about n_blocks runs of consecutive genes."""
+    if len(pending) == 0:
+        return []
+    size = max(1, -(-len(pending) // n_blocks))
+    blocks = []
+    for run in np.split(pending, np.flatnonzero(np.diff(pending) != 1) + 1):
+        for start in range(0, len(run), size):
+            blocks.append(run[start:start + size].tolist())
+    return blocks
+
+
+def infer_network(X, work_dir, n_jobs=None, lasso_params=None, blocks_per_worker=4):
+    """
+    Infer the gene-gene interaction matrix with one LassoCV model per gene.
+
+    Parameters:
+        X: expression matrix, genes x samples
+        work_dir: directory for the shared expression memmap, the interaction
+            matrix and its completion flags (reused to resume interrupted runs)
+        n_jobs: worker processes (1 = in-process serial run)
+        lasso_params: LassoCV keyword arguments (default: cv=5, random_state=42, max_iter=5000)
+
+    Returns the genes x genes interaction matrix (row i = coefficients of the
+    model predicting gene i; the diagonal is zero).
+    """
+    lasso_params = dict(DEFAULT_LASSO_PARAMS if lasso_params is None else lasso_params)
+    XT = np.asfortranarray(np.asarray(X, dtype=np.float64).T)  # samples x genes, gene columns contiguous
+    n_genes = XT.shape[1]
+    os.makedirs(work_dir, exist_ok=True)
+
+    expr_path = os.path.join(work_dir, "expression_T.npy")
+    matrix_path = os.path.join(work_dir, "interaction.npy")
+    done_path = os.path.join(work_dir, "done.npy")
+    meta_path = os.path.join(work_dir, "run.json")
+
+    key = _run_key(XT, lasso_params)
+    resume = False
+    if os.path.exists(meta_path) and os.path.exists(matrix_path) and os.path.exists(done_path):
+        with open(meta_path) as f:
+            resume = json.load(f).get("key") == key
+
+    if not resume:
+        np.save(expr_path, XT)
+        np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.float64,
+                                  shape=(n_genes, n_genes)).flush()
+        np.lib.format.open_memmap(done_path, mode="w+", dtype=np.bool_, shape=(n_genes,)).flush()
+        with open(meta_path, "w") as f:
+            json.dump({"key": key, "n_genes": n_genes, "lasso_params": lasso_params}, f)
+
+    pending = np.flatnonzero(~np.load(done_path))
+    if resume and len(pending) < n_genes:
+        print(f"Resuming network inference: {n_genes - len(pending)}/{n_genes} genes already fitted")
+
+    n_jobs = n_jobs or default_workers(len(pending))
+    if n_jobs == 1:
+        _init_worker(expr_path, matrix_path, done_path, lasso_params, single_thread=False)
+        count("genes_fitted", _fit_block(pending.tolist()))
+    elif len(pending):
+        blocks = _blocks(pending, n_jobs * blocks_per_worker)
+        with process_pool(n_jobs, _init_worker,
+                          (expr_path, matrix_path, done_path, lasso_params)) as pool:
+            for n_fitted in pool.map(_fit_block, blocks):
+                count("genes_fitted", n_fitted)
+
+    return np.array(np.load(matrix_path, mmap_mode="r"))
+
+
+def alpha_grid(Xy, n_samples, n_alphas=100, eps=1e-3):
+    """LassoCV's alpha grid for one target from its centered cross-products."""
+    alpha_max = np.max(np.abs(Xy)) / n_samples
+    if alpha_max <= np.finfo(np.float64).resolution:
+        return np.full(n_alphas, np.finfo(np.float64).resolution)
+    return np.geomspace(alpha_max, alpha_max * eps, num=n_alphas)
+
+
+class _FoldGram:
+    """
+    Centered data of one set of samples, shared by all genes, and its Gram
+    matrix if `gram` is True (otherwise the solver works on the data directly).
+    """
+
+    def __init__(self, XT, gram=True):
+        self.mean = XT.mean(axis=0)
+        self.Xc = np.asfortranarray(XT - self.mean)
+        self.G = np.ascontiguousarray(self.Xc.T @ self.Xc) if gram else None
+
+    def xy(self, j):
+        """Centered cross-products of gene j with every gene."""
+        return self.G[j].copy() if self.G is not None else self.Xc.T @ self.Xc[:, j]
+
+    def path(self, j, alphas, max_iter, tol, coef_init=None, buffers=None):
+        """
+        Lasso path of gene j on all other genes. The solver runs on a copy of
+        the Gram matrix (or of the data) with gene j's row and column (or data
+        column) zeroed, which makes it skip gene j. The copy is made into a
+        reused buffer from `buffers` (a dict owned by the caller), so the shared
+        arrays are only read and forked workers never duplicate them.
+        """
+        buffers = {} if buffers is None else buffers
+        y = self.Xc[:, j].copy()
+        if self.G is None:
+            Xc = _scratch(buffers, self.Xc)
+            Xc[:, j] = 0.0
+            _, coefs, _ = lasso_path(Xc, y, alphas=alphas, precompute=False, copy_X=False,
+                                     check_input=False, max_iter=max_iter, tol=tol, coef_init=coef_init)
+            return coefs  # n_genes x n_alphas, row j is zero
+        G = _scratch(buffers, self.G)
+        Xy = self.G[j].copy()
+        Xy[j] = 0.0
+        G[j, :] = 0.0
+        G[:, j] = 0.0
+        _, coefs, _ = lasso_path(self.Xc, y, alphas=alphas, precompute=G, Xy=Xy, copy_X=False,
+                                 check_input=False, max_iter=max_iter, tol=tol, coef_init=coef_init)
+        return coefs  # n_genes x n_alphas, row j is zero
+
+
+def _scratch(buffers, a):
+    """Copy of `a` in a buffer of the same shape and memory layout, reused across calls."""
+    buffer = buffers.get(a.shape)
+    if buffer is None:
+        buffer = buffers[a.shape] = np.empty_like(a)
+    np.copyto(buffer, a)
+    return buffer
+
+
+# Fold Gram matrices shared with the workers of all_nodes_lasso (inherited on
+# fork and only read), and each process's own scratch buffers
+_gram_state = None
+_buffers = {}
+
+
+def _init_gram_worker(state, single_thread=True):
+    global _gram_state, _buffers
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _gram_state = state
+    _buffers = {}
+
+
+def _fit_gene_gram(j):
+    """Fold MSE path, alpha selection and warm-started refit for gene j."""
+    full, folds, n_alphas, eps, max_iter, tol = _gram_state
+    n_samples = full.Xc.shape[0]
+    alphas = alpha_grid(np.delete(full.xy(j), j), n_samples, n_alphas, eps)
+
+    mse = np.zeros(n_alphas)
+    fold_coefs = []
+    for fold, Xt in folds:
+        coefs = fold.path(j, alphas, max_iter, tol, buffers=_buffers)
+        residues = Xt @ coefs - Xt[:, [j]]
+        mse += (residues ** 2).mean(axis=0)
+        fold_coefs.append(coefs)
+
+    best = int(np.argmin(mse))
+    start = np.asfortranarray(np.mean([c[:, best] for c in fold_coefs], axis=0))
+    coefs = full.path(j, alphas[best:best + 1], max_iter, tol, coef_init=start, buffers=_buffers)[:, 0]
+    return j, coefs, alphas[best]
+
+
+def all_nodes_lasso(X, cv=5, n_alphas=100, eps=1e-3, max_iter=5000, tol=1e-4, n_jobs=1, gram="auto",
+                    count_fits=True):
+    """
+    All-genes Lasso network with the same model selection as
+    `LassoCV(cv=cv, max_iter=max_iter)` fitted per gene.
+
+    The centered data of every CV fold and of the full data is computed once
+    and shared by all genes; with n_jobs > 1 genes are distributed over a
+    process pool.
+
+    Parameters:
+        X: expression matrix, genes x samples
+        gram: solve on the fold Gram matrices (memory: (cv + 1) x genes^2
+            floats); "auto" uses them only when there are at least as many
+            samples as genes, since otherwise a coordinate update on the Gram
+            matrix costs more than one on the data
+        count_fits: add each fitted gene to the genes_fitted counter
+
+    Returns the genes x genes interaction matrix and the selected alpha per gene.
+    """
+    XT = np.asarray(X, dtype=np.float64).T  # samples x genes
+    n_genes = XT.shape[1]
+    if gram == "auto":
+        gram = XT.shape[0] >= n_genes
+
+    full = _FoldGram(XT, gram)
+    folds = []
+    for train, test in KFold(n_splits=cv).split(XT):
+        fold = _FoldGram(XT[train], gram)
+        folds.append((fold, XT[test] - fold.mean))
+    state = (full, folds, n_alphas, eps, max_iter, tol)
+
+    interaction = np.zeros((n_genes, n_genes))
+    best_alpha = np.empty(n_genes)
+    n_jobs = n_jobs or default_workers(n_genes)
+    if n_jobs == 1:
+        _init_gram_worker(state, single_thread=False)
+        for j in range(n_genes):
+            _, interaction[j], best_alpha[j] = _fit_gene_gram(j)
+            if count_fits:
+                count("genes_fitted")
+    else:
+        with process_pool(n_jobs, _init_gram_worker, (state,)) as pool:
+            chunksize = max(1, n_genes // (4 * n_jobs))
+            for j, coefs, alpha in pool.map(_fit_gene_gram, range(n_genes), chunksize=chunksize):
+                interaction[j] = coefs
+                best_alpha[j] = alpha
+                if count_fits:
+                    count("genes_fitted")
+    return interaction, best_alpha
+
+
+def compare_networks(a, b, atol=1e-6):
+    """Agreement between two interaction matrices (max abs difference, edge-set overlap)."""
+    a = np.asarray(a)
+    b = np.asarray(b)
+    sa = np.abs(a) > atol
+    sb = np.abs(b) > atol
+    union = np.logical_or(sa, sb).sum()
+    return {
+        "max_abs_diff": float(np.max(np.abs(a - b))),
+        "edges_a": int(sa.sum()),
+        "edges_b": int(sb.sum()),
+        "edge_jaccard": float(np.logical_and(sa, sb).sum() / union) if union else 1.0,
+    }
+
+
+def _stability_chunk(task):
+    """
+    Fit the networks of a share of the resamples and return running counts/sums.
+    The fits are not added to genes_fitted; stability_selection counts
+    stability_resamples instead.
+    """
+    X, seeds, method, sample_fraction, solver, lasso_params = task
+    from threadpoolctl import threadpool_limits
+    n_genes, n_samples = X.shape
+    counts = np.zeros((n_genes, n_genes), dtype=np.int32)
+    coef_sum = np.zeros((n_genes, n_genes))
+    with threadpool_limits(1):
+        for seed in seeds:
+            rng = np.random.default_rng(seed)
+            if method == "bootstrap":
+                idx = rng.integers(0, n_samples, size=n_samples)
+            else:
+                idx = np.sort(rng.choice(n_samples, size=int(round(sample_fraction * n_samples)),
+                                         replace=False))
+            if solver == "gram":
+                W, _ = all_nodes_lasso(X[:, idx], cv=lasso_params.get("cv", 5),
+                                       max_iter=lasso_params.get("max_iter", 5000), n_jobs=1, count_fits=False)
+            else:
+                W = lassocv_network(X[:, idx], lasso_params, count_fits=False)
+            selected = W != 0
+            counts += selected
+            coef_sum += W
+    return counts, coef_sum
+
+
+def stability_selection(X, n_resamples=100, method="subsample", sample_fraction=0.5,
+                        threshold=0.6, solver="gram", lasso_params=None, n_jobs=None, seed=42):
+    """
+    Bootstrap / subsample stability selection of the Lasso network.
+
+    Parameters:
+        X: expression matrix, genes x samples
+        n_resamples: number of resampled network fits (B)
+        method: "subsample" (without replacement, `sample_fraction` of the samples)
+            or "bootstrap" (n samples with replacement)
+        threshold: minimum selection frequency of a consensus edge
+        solver: "gram" (all_nodes_lasso) or "lassocv" (per-gene LassoCV)
+        seed: root seed; resample b always uses the b-th spawned stream, so
+            results do not depend on n_jobs
+
+    Returns a dict with the edge selection frequencies, the consensus network
+    (mean coefficient over the fits that selected the edge, zero below the
+    threshold) and the number of resamples.
+    """
+    if method not in ("subsample", "bootstrap"):
+        raise ValueError("method must be 'subsample' or 'bootstrap'")
+    lasso_params = dict(DEFAULT_LASSO_PARAMS if lasso_params is None else lasso_params)
+    X = np.asarray(X, dtype=np.float64)
+    n_genes = X.shape[0]
+    seeds = np.random.SeedSequence(seed).spawn(n_resamples)
+
+    n_jobs = n_jobs or default_workers(n_resamples)
+    chunks = [seeds[k::n_jobs] for k in range(n_jobs) if seeds[k::n_jobs]]
+    tasks = [(X, chunk, method, sample_fraction, solver, lasso_params) for chunk in chunks]
+
+    counts = np.zeros((n_genes, n_genes), dtype=np.int64)
+    coef_sum = np.zeros((n_genes, n_genes))
+    if len(tasks) == 1:
+        for chunk, (chunk_counts, chunk_sums) in zip(chunks, map(_stability_chunk, tasks)):
+            counts += chunk_counts
+            coef_sum += chunk_sums
+            count("stability_resamples", len(chunk))
+    else:
+        with process_pool(len(tasks)) as pool:
+            for chunk, (chunk_counts, chunk_sums) in zip(chunks, pool.map(_stability_chunk, tasks)):
+                counts += chunk_counts
+                coef_sum += chunk_sums
+                count("stability_resamples", len(chunk))
+
+    frequency = counts / n_resamples
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_coef = np.where(counts > 0, coef_sum / np.maximum(counts, 1), 0.0)
+    consensus = np.where(frequency >= threshold, mean_coef, 0.0)
+    return {"frequency": frequency, "consensus": consensus, "n_resamples": n_resamples}
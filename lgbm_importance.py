@@ -0,0 +1,249 @@
+"""
+Repeated-Seed LightGBM Feature Importance
+
+Code 10 averages feature importances over many LightGBM fits that differ only
+in the random seed. Every sklearn LGBMRegressor.fit re-bins the same matrix;
+here the binned Dataset of each target is built once, saved in LightGBM's
+binary format and loaded by the worker processes, which train the seed runs
+with the native API and a fixed number of threads per model. Importances are
+collected into runs x genes arrays, from which per-gene mean, variance and
+rank stability follow directly.
+
+Besides split counts, each run can report total gain and mean absolute
+TreeSHAP contributions (LightGBM's built-in predict(pred_contrib=True), one
+batched call over all samples). In adaptive mode seed runs are added in
+batches until the top-k genes of the running mean importance stop changing
+(top-k overlap or Spearman correlation between consecutive batches).
+
+The binned Datasets are built inside a worker process: LightGBM's OpenMP
+runtime is not fork-safe, so the parent (which forks the workers) never runs
+LightGBM code itself.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from instrumentation import count
+from parallel import default_workers, process_pool
+
+# sklearn-API parameter names -> native LightGBM names
+SKLEARN_TO_NATIVE = {
+    "subsample": "bagging_fraction",
+    "subsample_freq": "bagging_freq",
+    "colsample_bytree": "feature_fraction",
+    "reg_alpha": "lambda_l1",
+    "reg_lambda": "lambda_l2",
+    "min_child_samples": "min_data_in_leaf",
+    "min_child_weight": "min_sum_hessian_in_leaf",
+    "min_split_gain": "min_gain_to_split",
+    "subsample_for_bin": "bin_construct_sample_cnt",
+    "random_state": "seed",
+    "n_jobs": "num_threads",
+}
+
+
+def to_native_params(params):
+    """
+    Translate LGBMRegressor keyword arguments to lgb.train parameters.
+
+    Returns (native params, num_boost_round). n_estimators becomes the number
+    of boosting rounds; unknown keys are passed through unchanged.
+    """
+    native = {"verbose": -1}
+    num_boost_round = 100
+    for key, value in params.items():
+        if key == "n_estimators":
+            num_boost_round = int(value)
+        else:
+            native[SKLEARN_TO_NATIVE.get(key, key)] = value
+    return native, num_boost_round
+
+
+# Worker state: loaded Datasets by (file, content digest), so a target
+# re-registered under the same name is never served its previous Dataset
+_datasets = {}
+
+
+def _build_dataset(task):
+    """Bin X once and save the Dataset in LightGBM's binary format."""
+    import lightgbm as lgb
+    path, X, y, params = task
+    if os.path.exists(path):
+        os.remove(path)
+    lgb.Dataset(X, label=y, params=params, free_raw_data=True).construct().save_binary(path)
+    return path
+
+
+def _train_seed(task):
+    """Train one seed run on a cached binary Dataset; returns {importance type: per-gene values}."""
+    import lightgbm as lgb
+    path, digest, params, num_boost_round, seed, x_path = task
+    if (path, digest) not in _datasets:
+        _datasets[path, digest] = lgb.Dataset(path, params=params)
+    booster = lgb.train(dict(params, seed=seed), _datasets[path, digest], num_boost_round=num_boost_round)
+    out = {"split": booster.feature_importance(importance_type="split").astype(np.float64),
+           "gain": booster.feature_importance(importance_type="gain")}
+    if x_path is not None:
+        contrib = booster.predict(np.load(x_path, mmap_mode="r"), pred_contrib=True)
+        out["shap"] = np.abs(contrib[:, :-1]).mean(axis=0)   # last column is the expected value
+    return out
+
+
+class ImportanceEngine:
+    """
+    Seed runs of LightGBM regressions on shared binned Datasets.
+
+    Parameters:
+        work_dir: directory for the binary Dataset files
+        n_jobs: worker processes (1 = in-process)
+        num_threads: LightGBM threads per model (default: cores / n_jobs)
+    """
+
+    def __init__(self, work_dir, n_jobs=None, num_threads=None):
+        os.makedirs(work_dir, exist_ok=True)
+        self.work_dir = work_dir
+        self.n_jobs = n_jobs or default_workers()
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // self.n_jobs)
+        self.pool = process_pool(self.n_jobs) if self.n_jobs > 1 else None
+        self.targets = {}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _map(self, fn, tasks):
+        if self.pool is None:
+            return list(map(fn, tasks))
+        return list(self.pool.map(fn, tasks))
+
+    def add_target(self, name, X, y, params):
+        """
+        Register a regression target.
+
+        Parameters:
+            name: target label
+            X: samples x genes DataFrame (column names are kept as gene names)
+            y: target values
+            params: LGBMRegressor keyword arguments (see to_native_params)
+        """
+        native, num_boost_round = to_native_params(params)
+        native.pop("seed", None)
+        native["num_threads"] = self.num_threads
+        path = os.path.join(self.work_dir, f"{name}.bin")
+        x_path = os.path.join(self.work_dir, f"{name}_X.npy")
+        genes = list(X.columns)
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.ascontiguousarray(y, dtype=np.float64)
+        h = hashlib.sha256(X.tobytes())
+        h.update(str(X.shape).encode())
+        h.update(y.tobytes())
+        h.update(json.dumps(native, sort_keys=True, default=str).encode())
+        np.save(x_path, X)                             # raw features for TreeSHAP
+        self._map(_build_dataset, [(path, X, y, native)])
+        self.targets[name] = {"path": path, "digest": h.hexdigest(), "x_path": x_path, "params": native,
+                              "num_boost_round": num_boost_round, "genes": genes}
+
+    def run(self, name, seeds, shap=False):
+        """
+        Train one model per seed for a registered target.
+
+        Returns {"split": runs x genes, "gain": runs x genes, ["shap": runs x genes,]
+        "seeds": seeds, "genes": genes}; "shap" is the mean |TreeSHAP| value per
+        gene and is only computed when `shap` is True.
+        """
+        target = self.targets[name]
+        x_path = target["x_path"] if shap else None
+        tasks = [(target["path"], target["digest"], target["params"], target["num_boost_round"], int(seed),
+                  x_path) for seed in seeds]
+        results = self._map(_train_seed, tasks)
+        count("models_trained", len(tasks))
+        n_genes = len(target["genes"])
+        runs = {kind: np.array([r[kind] for r in results]).reshape(len(tasks), n_genes)
+                for kind in (("split", "gain", "shap") if shap else ("split", "gain"))}
+        runs.update(seeds=list(seeds), genes=target["genes"])
+        return runs
+
+    def run_adaptive(self, name, first_seed=42, max_runs=30, batch_size=4, importance="split",
+                     top_k=50, criterion="overlap", tol=0.95, patience=2):
+        """
+        Add seed runs in batches until the top-k ranking has stabilized.
+
+        After each batch the genes are ranked by the mean `importance` over all
+        runs so far and compared with the ranking after the previous batch:
+        "overlap" is the fraction of shared top-k genes, "spearman" the rank
+        correlation of the mean importances over the union of both top-k sets.
+        Stops once the criterion is >= tol for `patience` consecutive batches,
+        or after max_runs runs. batch_size (seed runs per batch) is fixed rather
+        than tied to n_jobs, so the number of runs until the ranking counts as
+        stable does not depend on the core count.
+
+        Returns the run() dict plus "converged" and "history" (criterion per batch).
+        """
+        runs, previous, history, stable = None, None, [], 0
+        seed = first_seed
+        while runs is None or len(runs["seeds"]) < max_runs:
+            n = min(batch_size, max_runs - (0 if runs is None else len(runs["seeds"])))
+            batch = self.run(name, range(seed, seed + n), shap=importance == "shap")
+            seed += n
+            if runs is None:
+                runs = batch
+            else:
+                for kind in ("split", "gain", "shap"):
+                    if kind in batch:
+                        runs[kind] = np.concatenate([runs[kind], batch[kind]])
+                runs["seeds"] += batch["seeds"]
+            mean = runs[importance].mean(axis=0)
+            if previous is not None:
+                score = ranking_agreement(previous, mean, top_k, criterion)
+                history.append(score)
+                stable = stable + 1 if score >= tol else 0
+                if stable >= patience:
+                    break
+            previous = mean
+        runs.update(converged=stable >= patience, history=history)
+        return runs
+
+
+def ranking_agreement(a, b, top_k=50, criterion="overlap"):
+    """Agreement between the top-k genes of two importance vectors (see run_adaptive)."""
+    top_a = np.argsort(-a, kind="stable")[:top_k]
+    top_b = np.argsort(-b, kind="stable")[:top_k]
+    if criterion == "overlap":
+        return len(np.intersect1d(top_a, top_b)) / len(top_a)
+    if criterion == "spearman":
+        union = np.union1d(top_a, top_b)
+        return stats.spearmanr(a[union], b[union])[0]
+    raise ValueError("criterion must be 'overlap' or 'spearman'")
+
+
+def rank_matrix(importances):
+    """runs x genes ranks (1 = most important; ties share the average rank)."""
+    return pd.DataFrame(importances).rank(axis=1, ascending=False, method="average").to_numpy()
+
+
+def importance_summary(importances, genes, top_k=50):
+    """
+    Per-gene summary of a runs x genes importance array: mean, variance,
+    mean and standard deviation of the rank across runs, and the fraction of
+    runs in which the gene is among the top_k.
+    """
+    ranks = rank_matrix(importances)
+    return pd.DataFrame({
+        "Importance": importances.mean(axis=0),
+        "Variance": importances.var(axis=0, ddof=1) if len(importances) > 1 else 0.0,
+        "Mean_Rank": ranks.mean(axis=0),
+        "Rank_Std": ranks.std(axis=0),
+        f"Top{top_k}_Frequency": (ranks <= top_k).mean(axis=0),
+    }, index=genes)
@@ -0,0 +1,64 @@
+"""
+Sparse Interaction-Network Format
+
+Lasso leaves most entries of the genes x genes interaction matrix at zero, so
+networks are stored as CSR arrays in a single uncompressed .npz file:
+
+    data, indices, indptr   CSR arrays (row i = model predicting gene i)
+    shape                   (n_genes, n_genes)
+    genes                   gene names in row/column order
+
+Loading is a plain np.load of these arrays (no text parsing). Dense CSV/XLSX
+networks written by earlier versions of Code 2 are still accepted.
+"""
+
+import os
+
+import numpy as np
+from scipy import sparse
+
+
+def save_network(path, W, genes):
+    """Write an interaction matrix (dense array or scipy.sparse) and its gene names."""
+    W = sparse.csr_matrix(W)
+    W.eliminate_zeros()
+    genes = np.asarray([str(g) for g in genes])
+    if W.shape != (len(genes), len(genes)):
+        raise ValueError(f"Network shape {W.shape} does not match {len(genes)} genes")
+    np.savez(path, data=W.data, indices=W.indices, indptr=W.indptr,
+             shape=np.asarray(W.shape), genes=genes)
+
+
+def load_network(path, as_sparse=False):
+    """
+    Load an interaction network.
+
+    Returns (W, genes) where W is a dense ndarray, or a scipy.sparse CSR matrix
+    when `as_sparse` is True. Accepts the .npz format above as well as dense
+    .csv / .xlsx matrices with gene names as index and columns.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        with np.load(path, allow_pickle=False) as f:
+            W = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            genes = f["genes"].tolist()
+        return (W if as_sparse else W.toarray()), genes
+
+    import pandas as pd
+    if ext in (".xlsx", ".xls"):
+        from excel_cache import read_excel_cached
+        df = read_excel_cached(path, index_col=0)
+    else:
+        df = pd.read_csv(path, index_col=0)
+    W = df.values
+    return (sparse.csr_matrix(W) if as_sparse else W), df.index.tolist()
+
+
+def top_degree_genes(W, max_genes):
+    """Indices of the `max_genes` genes with the most nonzero edges (in + out), in original order."""
+    W = sparse.csr_matrix(W)
+    nz = W != 0
+    degree = np.asarray(nz.sum(axis=0)).ravel() + np.asarray(nz.sum(axis=1)).ravel()
+    if len(degree) <= max_genes:
+        return np.arange(len(degree))
+    return np.sort(np.argsort(-degree, kind="stable")[:max_genes])
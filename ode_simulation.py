@@ -0,0 +1,338 @@
+"""
+Batched Gene Expression ODE Simulation
+
+Shared simulation engine for the Lasso-network ODE model of Code 3 and Code 4:
+
+    dx/dt = -λx + σ(Wx)
+
+integrated while inhibited genes are held at zero. Instead of one mat-vec per
+run and time step, many runs (e.g. every single-gene knockout) are stacked as
+the columns of one genes x batch state matrix and advanced together with a
+single W @ X mat-mat per step.
+
+Three integration backends are available: fixed-step Euler (the original
+scheme, default), adaptive Dormand-Prince RK45 with error control, and a direct
+fixed-point/Newton steady-state solver. With `steady_tol` set, each run is
+dropped from the state matrix once it has converged, so settled runs stop
+costing work.
+
+Lasso networks are mostly zeros; `prepare_network` converts W once to a
+scipy.sparse CSR matrix when its density is below a threshold, and the same
+structure is reused for every W @ X of every knockout and replicate, so each
+step costs O(edges x batch) instead of O(genes^2 x batch).
+
+Initial states are drawn from a per-run random stream derived from
+(seed, run key), where the run key is the knocked-out gene index, so a gene's
+trajectory does not depend on which chunk it was simulated in. With seed=None
+the global NumPy RNG is used, as in the original scripts.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import gmres, spsolve
+
+from instrumentation import count
+
+DECAY_RATE = 1.0   # Decay rate λ in dx/dt = -λx + σ(Wx)
+DT = 0.1           # Time step for Euler integration
+TIME_STEPS = 100   # Number of time points to simulate
+
+
+SPARSE_DENSITY = 0.05   # Use the CSR kernel below this fraction of nonzero weights
+
+
+def sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+def prepare_network(W, density_threshold=SPARSE_DENSITY):
+    """
+    Interaction matrix in the representation used for simulation: CSR (with
+    canonical, sorted structure) if its density is below `density_threshold`,
+    otherwise a dense float64 array. Call once per network and reuse the result.
+    """
+    if sparse.issparse(W):
+        nnz = W.count_nonzero()
+    else:
+        W = np.asarray(W, dtype=np.float64)
+        nnz = np.count_nonzero(W)
+    density = nnz / max(1, W.shape[0] * W.shape[1])
+    if density < density_threshold:
+        W = sparse.csr_matrix(W, dtype=np.float64)
+        W.eliminate_zeros()
+        W.sum_duplicates()
+        W.sort_indices()
+        return W
+    return W.toarray() if sparse.issparse(W) else W
+
+
+def as_knockout_sets(targets):
+    """Normalize knockout targets to a list of index tuples (int -> single-gene knockout)."""
+    sets = []
+    for t in targets:
+        if np.ndim(t) == 0:
+            sets.append((int(t),))
+        else:
+            sets.append(tuple(int(i) for i in t))
+    return sets
+
+
+def initial_states(n_genes, keys, seed=None):
+    """genes x batch matrix of random initial states, one column per run key."""
+    if seed is None:
+        return np.random.rand(len(keys), n_genes).T.copy()
+    X0 = np.empty((n_genes, len(keys)))
+    for b, key in enumerate(keys):
+        X0[:, b] = np.random.default_rng([seed, *key]).random(n_genes)
+    return X0
+
+
+def inhibition_index(knockout_sets):
+    """(rows, cols) coordinates of the inhibited entries of a genes x batch state matrix."""
+    rows = [i for ko in knockout_sets for i in ko]
+    cols = [b for b, ko in enumerate(knockout_sets) for _ in ko]
+    return np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)
+
+
+def record_steps(time_steps, every=1):
+    """
+    Indices of the time steps kept in a trajectory: every `every`-th step, or
+    only the final state with every="final". The final step is always kept.
+    """
+    if every == "final":
+        return np.array([time_steps - 1])
+    steps = np.arange(every - 1, time_steps, every)
+    if len(steps) == 0 or steps[-1] != time_steps - 1:
+        steps = np.append(steps, time_steps - 1)
+    return steps
+
+
+def _derivative(W, X, rows, cols, decay_rate):
+    dXdt = -decay_rate * X + sigmoid(W @ X)
+    dXdt[rows, cols] = 0.0
+    return dXdt
+
+
+class _ActiveSet:
+    """
+    Columns of a batch that are still being integrated. Converged columns are
+    dropped from the state matrix so later steps only pay for active runs.
+    """
+
+    def __init__(self, X, rows, cols):
+        self.X = X
+        self.rows = rows
+        self.cols = cols
+        self.index = np.arange(X.shape[1])   # original column of each active column
+
+    def drop(self, done):
+        """Remove the active columns flagged in `done`; returns their original indices."""
+        keep = ~done
+        dropped = self.index[done]
+        remap = np.cumsum(keep) - 1
+        sel = keep[self.cols]
+        self.rows = self.rows[sel]
+        self.cols = remap[self.cols[sel]]
+        self.X = self.X[:, keep]
+        self.index = self.index[keep]
+        return dropped
+
+
+def _dopri_step(W, X, rows, cols, decay_rate, h):
+    """One Dormand-Prince 5(4) step; returns the 5th-order state and the error estimate."""
+    f = lambda Y: _derivative(W, Y, rows, cols, decay_rate)
+    k1 = f(X)
+    k2 = f(X + h * (1 / 5 * k1))
+    k3 = f(X + h * (3 / 40 * k1 + 9 / 40 * k2))
+    k4 = f(X + h * (44 / 45 * k1 - 56 / 15 * k2 + 32 / 9 * k3))
+    k5 = f(X + h * (19372 / 6561 * k1 - 25360 / 2187 * k2 + 64448 / 6561 * k3 - 212 / 729 * k4))
+    k6 = f(X + h * (9017 / 3168 * k1 - 355 / 33 * k2 + 46732 / 5247 * k3 + 49 / 176 * k4
+                    - 5103 / 18656 * k5))
+    X5 = X + h * (35 / 384 * k1 + 500 / 1113 * k3 + 125 / 192 * k4 - 2187 / 6784 * k5
+                  + 11 / 84 * k6)
+    k7 = f(X5)
+    err = h * (71 / 57600 * k1 - 71 / 16695 * k3 + 71 / 1920 * k4 - 17253 / 339200 * k5
+               + 22 / 525 * k6 - 1 / 40 * k7)
+    return X5, err, k7
+
+
+def steady_state(W, X0, knockout_sets, decay_rate=DECAY_RATE, tol=1e-8, max_iter=500,
+                 newton_iter=50):
+    """
+    Steady states x* = σ(Wx*) / λ (inhibited genes fixed at zero) for a batch
+    of runs: vectorized fixed-point iteration, then Newton's method on the
+    columns that have not converged. For a sparse W the Newton systems are
+    solved iteratively (GMRES) on the sparse Jacobian, with a sparse direct
+    solve as fallback; W is never densified (and LU factors of random
+    networks fill in badly).
+
+    Returns the genes x batch steady states and a boolean convergence flag per column.
+    """
+    X = np.array(X0, dtype=np.float64)
+    rows, cols = inhibition_index(knockout_sets)
+    X[rows, cols] = 0.0
+    out = X.copy()
+    converged = np.zeros(X.shape[1], dtype=bool)
+
+    active = _ActiveSet(X, rows, cols)
+    for _ in range(max_iter):
+        F = _derivative(W, active.X, active.rows, active.cols, decay_rate)
+        done = np.abs(F).max(axis=0) < tol
+        if done.any():
+            idx = active.index[done]
+            out[:, idx] = active.X[:, done]
+            converged[idx] = True
+            active.drop(done)
+            F = F[:, ~done]
+        if active.X.shape[1] == 0:
+            return out, converged
+        active.X = active.X + F / decay_rate
+
+    is_sparse = sparse.issparse(W)
+    W = W if is_sparse else np.asarray(W)
+    n_genes = X.shape[0]
+    for k, b in enumerate(active.index):
+        x = active.X[:, k].copy()
+        free = np.ones(n_genes, dtype=bool)
+        free[list(knockout_sets[b])] = False
+        for _ in range(newton_iter):
+            s = sigmoid(W @ x)
+            F = -decay_rate * x + s
+            F[~free] = 0.0
+            if np.abs(F).max() < tol:
+                converged[b] = True
+                break
+            if is_sparse:
+                J = (sparse.diags(s * (1 - s)) @ W - decay_rate * sparse.identity(n_genes)).tocsr()
+                J = J[free][:, free]
+                delta, info = gmres(J, F[free], rtol=1e-10, atol=0.0, restart=50)
+                x[free] -= delta if info == 0 else spsolve(J.tocsc(), F[free])
+            else:
+                J = (s * (1 - s))[:, None] * W
+                J[np.diag_indices(n_genes)] -= decay_rate
+                x[free] -= np.linalg.solve(J[np.ix_(free, free)], F[free])
+        out[:, b] = x
+    return out, converged
+
+
+def simulate_batch(W, X0, knockout_sets, decay_rate=DECAY_RATE, dt=DT, time_steps=TIME_STEPS,
+                   steps=None, method="euler", steady_tol=None, rtol=1e-6, atol=1e-9,
+                   return_converged=False):
+    """
+    Advance a batch of runs together.
+
+    Parameters:
+        W: genes x genes interaction matrix
+        X0: genes x batch initial states (copied)
+        knockout_sets: one tuple of inhibited gene indices per column (may be empty)
+        steps: time-step indices to record (default: all, see record_steps)
+        method: integration backend
+            "euler"  fixed-step explicit Euler (the original scheme)
+            "rk45"   adaptive Dormand-Prince 5(4) with error control (rtol/atol);
+                     states are reported on the same time grid t = (k + 1) * dt
+            "steady" direct steady-state solve (see steady_state); only the
+                     final state can be recorded and it is the t -> inf limit
+        steady_tol: stop integrating a run once max |dx/dt| falls below this
+            value; its remaining recorded states repeat the converged state.
+            None (default) integrates every run for all time steps.
+        return_converged: also return one boolean flag per column, True if the
+            run met the steady-state tolerance (for "euler" / "rk45" only with
+            steady_tol set). Runs the "steady" backend could not solve are
+            reported on stdout either way.
+
+    Returns the trajectories as a batch x len(steps) x genes array; entry t of
+    the full trajectory holds the state after step t + 1, as in the original
+    simulate_ode.
+    """
+    steps = np.arange(time_steps) if steps is None else np.asarray(steps)
+    n_genes, batch = np.shape(X0)
+    traj = np.empty((batch, len(steps), n_genes))
+
+    if method == "steady":
+        if len(steps) != 1 or steps[0] != time_steps - 1:
+            raise ValueError("The steady backend only records the final state (steps='final')")
+        X, converged = steady_state(W, X0, knockout_sets, decay_rate, tol=steady_tol or 1e-8)
+        traj[:, 0, :] = X.T
+        if not converged.all():
+            failed = np.flatnonzero(~converged)
+            shown = ", ".join(str(knockout_sets[b]) for b in failed[:5]) + (", ..." if len(failed) > 5 else "")
+            print(f"Steady-state solve did not converge for {len(failed)} of {batch} runs "
+                  f"(knockouts {shown}); their last iterate is reported")
+        return (traj, converged) if return_converged else traj
+    if method not in ("euler", "rk45"):
+        raise ValueError(f"Unknown integration method: {method}")
+
+    X = np.array(X0, dtype=np.float64)
+    rows, cols = inhibition_index(knockout_sets)
+    X[rows, cols] = 0.0
+    slot = np.full(time_steps, -1)
+    slot[steps] = np.arange(len(steps))
+    conv_step = np.full(batch, time_steps)
+    final = np.empty((n_genes, batch))
+
+    active = _ActiveSet(X, rows, cols)
+    h = dt
+    for t in range(time_steps):
+        if method == "euler":
+            dXdt = -decay_rate * active.X + sigmoid(W @ active.X)
+            active.X = active.X + dXdt * dt
+            active.X[active.rows, active.cols] = 0.0   # Enforce inhibition at all time points
+            if steady_tol is not None:
+                dXdt[active.rows, active.cols] = 0.0
+        else:
+            remaining = dt
+            while remaining > 1e-12 * dt:
+                h_try = min(h, remaining)
+                X_new, err, dXdt = _dopri_step(W, active.X, active.rows, active.cols,
+                                               decay_rate, h_try)
+                scale = atol + rtol * np.maximum(np.abs(active.X), np.abs(X_new))
+                err_norm = np.sqrt(np.mean((err / scale) ** 2, axis=0)).max()
+                if err_norm <= 1.0:
+                    active.X = X_new
+                    remaining -= h_try
+                factor = 5.0 if err_norm == 0 else min(5.0, max(0.2, 0.9 * err_norm ** -0.2))
+                h = h_try * factor
+        count("ode_run_steps", active.X.shape[1])
+        if slot[t] >= 0:
+            traj[active.index, slot[t], :] = active.X.T
+        if steady_tol is not None:
+            done = np.abs(dXdt).max(axis=0) < steady_tol
+            if done.any():
+                final[:, active.index[done]] = active.X[:, done]
+                conv_step[active.index[done]] = t
+                active.drop(done)
+                if active.X.shape[1] == 0:
+                    break
+
+    # Converged runs keep their steady state for the rest of the trajectory
+    for k, step in enumerate(steps):
+        late = np.flatnonzero(conv_step < step)
+        if len(late):
+            traj[late, k, :] = final[:, late].T
+    return (traj, conv_step < time_steps) if return_converged else traj
+
+
+def simulate_knockouts(W, targets, decay_rate=DECAY_RATE, dt=DT, time_steps=TIME_STEPS,
+                       seed=None, chunk_size=256, steps=None, method="euler", steady_tol=None):
+    """
+    Simulate knockout runs in chunks of `chunk_size` columns.
+
+    Parameters:
+        W: genes x genes interaction matrix
+        targets: gene indices (single knockouts) and/or sequences of indices
+            (combined knockouts); an empty sequence is an uninhibited run
+        steps: time-step indices to record (default: all, see record_steps)
+        method, steady_tol: integration backend and convergence detection (see simulate_batch)
+
+    Yields (knockout_sets, trajectories) per chunk, with trajectories shaped
+    chunk x recorded steps x genes, so callers can store results as they arrive.
+    """
+    n_genes = W.shape[0]
+    sets = as_knockout_sets(targets)
+    for start in range(0, len(sets), chunk_size):
+        chunk = sets[start:start + chunk_size]
+        X0 = initial_states(n_genes, chunk, seed)
+        trajectories = simulate_batch(W, X0, chunk, decay_rate, dt, time_steps, steps,
+                                      method=method, steady_tol=steady_tol)
+        count("knockouts_simulated", len(chunk))
+        yield chunk, trajectories
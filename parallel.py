@@ -0,0 +1,30 @@
+"""
+Shared process-pool helper for the parallel pipeline stages.
+
+The supplementary scripts are plain top-level scripts without a
+``if __name__ == "__main__":`` guard, so worker processes must not re-import
+the calling script. On platforms that support it the pool is therefore created
+with the "fork" start method; elsewhere the interpreter default is used.
+"""
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers(n_tasks=None):
+    """Number of worker processes to use (all cores, capped by the task count)."""
+    n = os.cpu_count() or 1
+    if n_tasks is not None:
+        n = max(1, min(n, n_tasks))
+    return n
+
+
+def process_pool(max_workers=None, initializer=None, initargs=()):
+    """Create a ProcessPoolExecutor that is safe to use from the top-level scripts."""
+    if "fork" in mp.get_all_start_methods():
+        ctx = mp.get_context("fork")
+    else:
+        ctx = mp.get_context()
+    return ProcessPoolExecutor(max_workers=max_workers or default_workers(),
+                               mp_context=ctx, initializer=initializer, initargs=initargs)
@@ -0,0 +1,146 @@
+"""
+Matrix-Based Pathway Scoring
+
+Weighted sums of GSVA pathway scores (Code 6 and 7). Score definitions are
+read from a JSON file mapping each score name to its {pathway: weight} dict
+(see lipid_scores.json) and assembled into one sparse scores x pathways weight
+matrix, so every score for every sample comes out of a single sparse-dense
+product with the GSVA matrix:
+
+    scores (n_scores x samples) = weights (n_scores x pathways) @ GSVA (pathways x samples)
+
+Pathways missing from the GSVA table are left out of their score (as in the
+original scripts) and reported per score. Missing values count as zero.
+
+write_score_table reads the GSVA results once and writes every defined score
+and its Z-score to one table (SCORE_TABLE in the data directory), from which
+Code 6, Code 7 and any further score take their column. Run as a script, this
+module writes that table (the "scores" stage of pipeline.py, which is then the
+only writer; Code 6 and 7 just read it):
+
+    python pathway_scores.py
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from config import DATA_DIR
+from excel_cache import read_excel_cached
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lipid_scores.json")
+GSVA_FILE = "gsva_results.xlsx"
+SCORE_TABLE = "pathway_scores.csv"
+
+
+def load_score_definitions(path=DEFAULT_CONFIG):
+    """{score name: {pathway: weight}} from a JSON score-definition file."""
+    with open(path) as f:
+        definitions = json.load(f)
+    for name, weights in definitions.items():
+        if not isinstance(weights, dict) or not weights:
+            raise ValueError(f"Score '{name}' must map pathways to weights")
+    return definitions
+
+
+def weight_matrix(definitions, pathways):
+    """
+    Sparse scores x pathways weight matrix over the rows of a GSVA table.
+
+    Returns (W, rows, missing): W has one column per used pathway, `rows` are
+    the positions of those pathways in `pathways`, and `missing` maps each
+    score to the pathways absent from `pathways`.
+    """
+    position = {p: i for i, p in enumerate(pathways)}
+    used = {}
+    data, row_idx, col_idx = [], [], []
+    missing = {}
+    for s, (name, weights) in enumerate(definitions.items()):
+        missing[name] = [p for p in weights if p not in position]
+        for pathway, w in weights.items():
+            if pathway in position:
+                col = used.setdefault(position[pathway], len(used))
+                row_idx.append(s)
+                col_idx.append(col)
+                data.append(float(w))
+    W = sparse.csr_matrix((data, (row_idx, col_idx)), shape=(len(definitions), len(used)))
+    return W, np.fromiter(used, dtype=np.intp, count=len(used)), missing
+
+
+def score_pathways(gsva_scores, definitions):
+    """
+    Compute every defined score and its z-score.
+
+    Parameters:
+        gsva_scores: DataFrame of GSVA results (pathways x samples)
+        definitions: {score name: {pathway: weight}} (see load_score_definitions)
+
+    Returns (scores, z_scores, missing): samples x scores DataFrames and the
+    per-score lists of pathways not found in the GSVA table.
+    """
+    W, rows, missing = weight_matrix(definitions, gsva_scores.index)
+    selected = np.asarray(gsva_scores.values[rows], dtype=np.float64)
+    np.nan_to_num(selected, copy=False, nan=0.0)
+    values = np.asarray(W @ selected)                      # n_scores x samples
+    z = (values - values.mean(axis=1, keepdims=True)) / values.std(axis=1, ddof=1, keepdims=True)
+    names = list(definitions)
+    scores = pd.DataFrame(values.T, index=gsva_scores.columns, columns=names)
+    z_scores = pd.DataFrame(z.T, index=gsva_scores.columns, columns=names)
+    return scores, z_scores, missing
+
+
+def report_missing(missing):
+    """Print the pathways of each score that were not found in the GSVA table."""
+    for name, pathways in missing.items():
+        if pathways:
+            print(f"{name}: {len(pathways)} pathway(s) not in GSVA results: {', '.join(pathways)}")
+
+
+def write_score_table(gsva_path, out_path, config=DEFAULT_CONFIG):
+    """
+    Read the GSVA results once and write every score defined in `config`.
+
+    The CSV table has one row per sample and, per score, the columns
+    '<score>' (weighted sum) and '<score>_Z' (Z-score). It is written to a
+    temporary file next to out_path and renamed into place, so concurrent
+    readers never see a partial table. Missing pathways are reported.
+    Returns (scores, z_scores) as in score_pathways.
+    """
+    gsva_scores = read_excel_cached(gsva_path, index_col=0)
+    scores, z_scores, missing = score_pathways(gsva_scores, load_score_definitions(config))
+    report_missing(missing)
+    table = pd.concat([scores, z_scores.add_suffix("_Z")], axis=1)
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    table[[c for name in scores.columns for c in (name, f"{name}_Z")]].to_csv(tmp)
+    os.replace(tmp, out_path)
+    return scores, z_scores
+
+
+def read_score_table(path):
+    """(scores, z_scores) samples x scores DataFrames from a table written by write_score_table."""
+    table = pd.read_csv(path, index_col=0, float_precision="round_trip")
+    names = [c for c in table.columns if not c.endswith("_Z")]
+    return table[names], table[[f"{name}_Z" for name in names]].set_axis(names, axis=1)
+
+
+def load_score_table(gsva_path, out_path, config=DEFAULT_CONFIG, refresh=True):
+    """
+    Scores and Z-scores of every defined score (see write_score_table).
+
+    The table at out_path is reused when it is newer than both the GSVA
+    results and the score definitions; otherwise it is (re)written first.
+    With refresh=False the table is only read (the pipeline keeps it current
+    in its own stage, so the stages reading it never write it).
+    """
+    if not refresh or (os.path.exists(out_path) and os.path.getmtime(out_path)
+                       >= max(os.path.getmtime(gsva_path), os.path.getmtime(config))):
+        return read_score_table(out_path)
+    return write_score_table(gsva_path, out_path, config)
+
+
+if __name__ == "__main__":
+    write_score_table(os.path.join(DATA_DIR, GSVA_FILE), os.path.join(DATA_DIR, SCORE_TABLE))
+    print(f"Pathway scores saved to '{os.path.join(DATA_DIR, SCORE_TABLE)}'.")
@@ -0,0 +1,326 @@
+"""
+Pipeline Runner for the Supplementary Scripts
+
+The scripts exchange files through one data directory (DATA_DIR, taken from
+the LIPID_DATA_DIR environment variable; /content on Colab). This runner
+declares each script as a stage with its input and output artifacts and runs
+the resulting graph locally:
+
+    Code 1 ─> Code 2 ─> Code 3, Code 4
+    pathway_scores ─> Code 6, Code 7 ─> Code 8, Code 9, Code 10
+
+A stage's key is the SHA-256 of its script, the local modules it imports and
+the repository data files they name (e.g. lipid_scores.json), the contents of
+its inputs, of the files matched by its external sources (e.g. the HTSeq
+cohort) and of its optional inputs (e.g. the GO annotation cache), and its
+parameters (environment overrides). After a
+successful run its outputs are copied into a content-addressed object store
+under DATA_DIR/.pipeline; a stage whose key is already recorded is skipped
+(its outputs are restored from the store if they were changed or deleted).
+Stages whose inputs are ready run concurrently, each in its own Python
+subprocess, so independent branches (Code 6 / 7, Code 8 / 9 / 10, Code 3 / 4)
+proceed in parallel.
+
+Usage:
+    python pipeline.py [--data-dir DIR] [--jobs N] [--force STAGE ...] [--dry-run] [STAGE ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import DATA_DIR
+from htseq_ingest import list_htseq_files
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stage:
+    """
+    One script of the pipeline.
+
+    Parameters:
+        name: stage name
+        script: script file in the repository
+        inputs: artifact paths relative to the data directory
+        outputs: artifact paths relative to the data directory (files or directories)
+        env: parameters passed to the script as environment variables
+        sources: directories or glob patterns of files read from outside the
+            data directory; the matched files are hashed
+        optional_inputs: artifact paths relative to the data directory that are
+            read if present (caches); hashed, but not required
+    """
+
+    def __init__(self, name, script, inputs=(), outputs=(), env=None, sources=(), optional_inputs=()):
+        self.name = name
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.env = dict(env or {})
+        self.sources = list(sources)
+        self.optional_inputs = list(optional_inputs)
+
+
+def default_stages(cohort_source=None):
+    """
+    The stage graph of the supplementary scripts.
+
+    With a cohort_source (directory or glob of HTSeq files) Code 1 runs in
+    cohort mode and its lipid-gene matrix becomes the input of Code 2;
+    otherwise Code 2 reads the prepared 'LOG2CPM Data.xlsx'.
+    """
+    stages = []
+    expression = "LOG2CPM Data.xlsx"
+    if cohort_source is not None:
+        expression = "cohort_matrix/lipid_related_log2cpm_matrix.csv"
+        stages.append(Stage("code1", "Code 1.py", outputs=[expression],
+                            env={"LIPID_COHORT_SOURCE": cohort_source}, sources=[cohort_source],
+                            optional_inputs=["go_bp_dump.jsonl", "go_bp_annotation.sqlite"]))
+    stages += [
+        Stage("code2", "Code 2.py", inputs=[expression], outputs=["lasso_genetic_network.npz"],
+              env={"LIPID_EXPRESSION_FILE": os.path.join("{data_dir}", expression)}),
+        Stage("code3", "Code 3.py", inputs=["lasso_genetic_network.npz"],
+              outputs=["all_gen_inhibition_simulation"]),
+        Stage("code4", "Code 4.py", inputs=["lasso_genetic_network.npz"],
+              outputs=["gene_expression_stability.csv"]),
+        Stage("scores", "pathway_scores.py", inputs=["gsva_results.xlsx"], outputs=["pathway_scores.csv"]),
+        Stage("code6", "Code 6.py", inputs=["gsva_results.xlsx", "pathway_scores.csv"],
+              outputs=["lipid_birikim_zscore.xlsx"], env={"LIPID_SCORES_READ_ONLY": "1"}),
+        Stage("code7", "Code 7.py", inputs=["gsva_results.xlsx", "pathway_scores.csv"],
+              outputs=["lipid_catabolic_scores.xlsx"], env={"LIPID_SCORES_READ_ONLY": "1"}),
+        Stage("code8", "Code 8.py",
+              inputs=["lipid_birikim_zscore.xlsx", "merged_genes_log2cpm.xlsx", "pathway_scores.csv"],
+              outputs=["backdoor_effects_lipid_birikimi.csv", "exhaustion_scores_lipid_birikimi.csv"]),
+        Stage("code9", "Code 9.py",
+              inputs=["lipid_catabolic_scores.xlsx", "merged_genes_log2cpm.xlsx", "pathway_scores.csv"],
+              outputs=["backdoor_effects_lipid_catabolic.csv"]),
+        Stage("code10", "Code 10.py",
+              inputs=["1213_gen.xlsx", "lipid_birikim_zscore.xlsx", "lipid_catabolic_scores.xlsx"],
+              outputs=["top_50_genes_lipid_accumulation.xlsx", "top_50_genes_lipid_degradation.xlsx"]),
+    ]
+    return stages
+
+
+# Content hashing
+
+def _hash_file(path, h):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+
+def artifact_hash(path):
+    """SHA-256 of a file, or of a directory tree (relative names and file contents)."""
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                h.update(os.path.relpath(full, path).encode() + b"\0")
+                _hash_file(full, h)
+    else:
+        _hash_file(path, h)
+    return h.hexdigest()
+
+
+def local_dependencies(script_path, seen=None):
+    """
+    Repository files a script depends on: the modules it imports
+    (transitively) and the data files they name as string literals
+    (e.g. "lipid_scores.json").
+    """
+    seen = set() if seen is None else seen
+    with open(script_path, encoding="utf-8") as f:
+        source = f.read()
+    names = [m + ".py" for m in re.findall(r"^\s*(?:from|import)\s+(\w+)", source, flags=re.M)]
+    names += re.findall(r"[\"']([\w.-]+\.(?:json|csv|tsv|txt))[\"']", source)
+    for name in names:
+        path = os.path.join(REPO_DIR, name)
+        if name not in seen and os.path.isfile(path):
+            seen.add(name)
+            if name.endswith(".py"):
+                local_dependencies(path, seen)
+    return seen
+
+
+class Pipeline:
+    """
+    Content-addressed runner for a list of stages.
+
+    Parameters:
+        stages: Stage objects (see default_stages)
+        data_dir: data directory shared by all stages
+        jobs: maximum number of stages running at the same time
+    """
+
+    def __init__(self, stages, data_dir=DATA_DIR, jobs=None):
+        self.stages = {s.name: s for s in stages}
+        self.data_dir = os.path.abspath(data_dir)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.state_dir = os.path.join(self.data_dir, ".pipeline")
+        self.objects = os.path.join(self.state_dir, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(os.path.join(self.state_dir, "logs"), exist_ok=True)
+        self.index_path = os.path.join(self.state_dir, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+        producers = {}
+        for stage in stages:
+            for out in stage.outputs:
+                producers[out] = stage.name
+        self.deps = {s.name: sorted({producers[i] for i in s.inputs if i in producers}) for s in stages}
+
+    def _path(self, artifact):
+        return os.path.join(self.data_dir, artifact)
+
+    def _env(self, stage):
+        return {k: v.format(data_dir=self.data_dir) for k, v in stage.env.items()}
+
+    def stage_key(self, stage):
+        h = hashlib.sha256()
+        script = os.path.join(REPO_DIR, stage.script)
+        _hash_file(script, h)
+        for name in sorted(local_dependencies(script)):
+            h.update(name.encode())
+            _hash_file(os.path.join(REPO_DIR, name), h)
+        for artifact in stage.inputs:
+            h.update(artifact.encode() + artifact_hash(self._path(artifact)).encode())
+        for source in stage.sources:
+            for path in list_htseq_files(source):
+                h.update(os.path.abspath(path).encode() + artifact_hash(path).encode())
+        for artifact in stage.optional_inputs:
+            path = self._path(artifact)
+            h.update(artifact.encode() + (artifact_hash(path) if os.path.exists(path) else "absent").encode())
+        h.update(json.dumps(stage.env, sort_keys=True).encode())
+        h.update(json.dumps(stage.outputs).encode())
+        return h.hexdigest()
+
+    def _store(self, stage, key):
+        stored = {}
+        for artifact in stage.outputs:
+            path = self._path(artifact)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Stage {stage.name} did not produce '{artifact}'")
+            digest = artifact_hash(path)
+            target = os.path.join(self.objects, digest)
+            if not os.path.exists(target):
+                (shutil.copytree if os.path.isdir(path) else shutil.copy2)(path, target)
+            stored[artifact] = digest
+        self.index[stage.name] = {"key": key, "outputs": stored}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def _restore(self, stage):
+        """Bring the recorded outputs of a cached stage back into the data directory."""
+        for artifact, digest in self.index[stage.name]["outputs"].items():
+            path = self._path(artifact)
+            if os.path.exists(path) and artifact_hash(path) == digest:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            source = os.path.join(self.objects, digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            (shutil.copytree if os.path.isdir(source) else shutil.copy2)(source, path)
+
+    def _run_script(self, stage):
+        env = dict(os.environ, LIPID_DATA_DIR=self.data_dir, MPLBACKEND="Agg",
+                   PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+        env.update(self._env(stage))
+        log_path = os.path.join(self.state_dir, "logs", f"{stage.name}.log")
+        with open(log_path, "w") as log:
+            result = subprocess.run([sys.executable, os.path.join(REPO_DIR, stage.script)],
+                                    cwd=self.data_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"Stage {stage.name} failed (exit {result.returncode}); see {log_path}")
+
+    def _selected(self, targets):
+        """Requested stages plus everything upstream of them."""
+        if not targets:
+            return set(self.stages)
+        selected, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage '{name}'")
+            if name not in selected:
+                selected.add(name)
+                todo.extend(self.deps[name])
+        return selected
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """
+        Run the selected stages (default: all) in dependency order.
+
+        Stages whose key is unchanged are skipped; stages in `force` always run.
+        Returns {stage: "cached" | "ran" | "pending"} ("pending" only in dry runs).
+        """
+        selected = self._selected(targets)
+        status = {}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            while len(status) < len(selected):
+                for name in sorted(selected - set(status) - set(running)):
+                    if any(d in selected and status.get(d) not in ("cached", "ran", "pending")
+                           for d in self.deps[name]):
+                        continue
+                    stage = self.stages[name]
+                    missing = [a for a in stage.inputs if not os.path.exists(self._path(a))]
+                    if dry_run and (missing or any(status.get(d) == "pending" for d in self.deps[name])):
+                        status[name] = "pending"
+                        print(f"[{name}] would run")
+                        continue
+                    if missing:
+                        raise FileNotFoundError(f"Stage {name} is missing inputs: {missing}")
+                    key = self.stage_key(stage)
+                    if name not in force and self.index.get(name, {}).get("key") == key:
+                        self._restore(stage)
+                        status[name] = "cached"
+                        print(f"[{name}] up to date")
+                    elif dry_run:
+                        status[name] = "pending"
+                        print(f"[{name}] would run")
+                    else:
+                        print(f"[{name}] running {stage.script}")
+                        running[name] = (pool.submit(self._run_script, stage), key, time.time())
+                if not running:
+                    continue
+                done, _ = wait([f for f, _, _ in running.values()], return_when=FIRST_COMPLETED)
+                for name in [n for n, (f, _, _) in running.items() if f in done]:
+                    future, _, start = running.pop(name)
+                    future.result()
+                    # Recompute the key: a stage may update its optional inputs (caches)
+                    self._store(self.stages[name], self.stage_key(self.stages[name]))
+                    status[name] = "ran"
+                    print(f"[{name}] finished in {time.time() - start:.1f}s")
+        return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the supplementary scripts as a cached stage graph.")
+    parser.add_argument("stages", nargs="*", help="stages to bring up to date (default: all)")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cohort-source", default=None,
+                        help="HTSeq directory or glob; runs Code 1 in cohort mode as the first stage")
+    parser.add_argument("--jobs", type=int, default=None, help="stages running concurrently")
+    parser.add_argument("--force", nargs="*", default=(), help="stages to rerun even if cached")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+    pipeline = Pipeline(default_stages(args.cohort_source), data_dir=args.data_dir, jobs=args.jobs)
+    pipeline.run(args.stages, force=set(args.force), dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
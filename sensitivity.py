@@ -0,0 +1,365 @@
+"""
+Sensitivity Analysis of the Gene Expression ODE Model
+
+Monte Carlo ensemble used by Code 4: replicates with random initial states are
+simulated in vectorized blocks (one state matrix per block, see
+ode_simulation.py) and reduced on the fly into per-gene running mean/variance
+accumulators (Welford updates, merged across blocks with Chan's formula).
+Memory is constant in the number of replicates. Blocks are spread over worker
+processes, each with its own random stream spawned from one root seed, so
+results do not depend on the number of workers.
+
+Global sensitivity analysis varies the model parameters themselves: the decay
+rate λ, the Euler step dt and the scale of multiplicative log-normal noise on
+the edges of W. Morris (elementary effects) or Saltelli (Sobol first- and
+total-order) designs are evaluated with the batched simulator across a process
+pool; each design point's output (per-gene mean final state over a fixed set of
+initial states) is cached on disk under a hash of the point and the study
+settings, so enlarging a study only evaluates the new points.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+from scipy.stats import qmc
+
+from instrumentation import count
+from ode_simulation import DECAY_RATE, DT, TIME_STEPS, prepare_network, record_steps, simulate_batch
+from parallel import default_workers, process_pool
+
+
+class RunningStats:
+    """Streaming mean / variance over the first axis of incoming batches."""
+
+    def __init__(self, shape):
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values):
+        """Add a batch of observations (batch along axis 0)."""
+        values = np.asarray(values, dtype=np.float64)
+        n_b = values.shape[0]
+        if n_b == 0:
+            return
+        mean_b = values.mean(axis=0)
+        m2_b = ((values - mean_b) ** 2).sum(axis=0)
+        self._combine(n_b, mean_b, m2_b)
+
+    def merge(self, other):
+        """Fold another accumulator into this one."""
+        if other.n:
+            self._combine(other.n, other.mean, other.m2)
+        return self
+
+    def _combine(self, n_b, mean_b, m2_b):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (n_b / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (self.n * n_b / n)
+        self.n = n
+
+    def variance(self, ddof=0):
+        return self.m2 / max(self.n - ddof, 1)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    def cv(self, ddof=0):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.std(ddof) / self.mean
+
+
+# Worker state, set once per process by the pool initializer
+_W = None
+_sim_params = None
+
+
+def _init_worker(W, sim_params, single_thread=True):
+    global _W, _sim_params
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _W = W
+    _sim_params = sim_params
+
+
+def _ensemble_block(task):
+    """Simulate one block of replicates and return its running statistics."""
+    n_reps, seed_seq, track_time, max_block_bytes = task
+    params = _sim_params
+    n_genes = _W.shape[0]
+    time_steps = params["time_steps"]
+    steps = np.arange(time_steps) if track_time else record_steps(time_steps, "final")
+
+    # Sub-blocks keep the recorded trajectories within the memory budget
+    sub = max(1, min(n_reps, max_block_bytes // (8 * len(steps) * n_genes)))
+    rng = np.random.default_rng(seed_seq)
+    final = RunningStats(n_genes)
+    over_time = RunningStats((len(steps), n_genes)) if track_time else None
+    done = 0
+    while done < n_reps:
+        b = min(sub, n_reps - done)
+        X0 = rng.random((n_genes, b))
+        traj = simulate_batch(_W, X0, [()] * b, decay_rate=params["decay_rate"], dt=params["dt"],
+                              time_steps=time_steps, steps=steps, method=params["method"],
+                              steady_tol=params["steady_tol"])
+        final.update(traj[:, -1, :])
+        if track_time:
+            over_time.update(traj)
+        done += b
+    return final, over_time
+
+
+def run_ensemble(W, n_replicates, block_size=1024, n_jobs=None, seed=42, track_time=False,
+                 decay_rate=DECAY_RATE, dt=DT, time_steps=TIME_STEPS, method="euler",
+                 steady_tol=None, max_block_bytes=256 * 2 ** 20):
+    """
+    Monte Carlo ensemble of uninhibited runs from uniform random initial states.
+
+    Parameters:
+        W: interaction matrix (dense or prepared CSR, see ode_simulation.prepare_network)
+        n_replicates: number of replicates
+        block_size: replicates per task (simulated as one state matrix)
+        n_jobs: worker processes (1 = in-process)
+        seed: root seed; block k uses the k-th spawned stream
+        track_time: also keep running statistics for every time step
+            (time_steps x genes) instead of the final state only
+
+    Returns a dict with RunningStats for the final state ("final") and, if
+    requested, per time point ("over_time").
+    """
+    sim_params = {"decay_rate": decay_rate, "dt": dt, "time_steps": time_steps,
+                  "method": method, "steady_tol": steady_tol}
+    sizes = [min(block_size, n_replicates - s) for s in range(0, n_replicates, block_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(n, s, track_time, max_block_bytes) for n, s in zip(sizes, seeds)]
+
+    final = RunningStats(W.shape[0])
+    over_time = RunningStats((time_steps, W.shape[0])) if track_time else None
+
+    def collect(results):
+        for block_final, block_time in results:
+            final.merge(block_final)
+            count("replicates_simulated", block_final.n)
+            if track_time:
+                over_time.merge(block_time)
+
+    n_jobs = n_jobs or default_workers(len(tasks))
+    if n_jobs == 1 or len(tasks) == 1:
+        _init_worker(W, sim_params, single_thread=False)
+        collect(map(_ensemble_block, tasks))
+    else:
+        with process_pool(n_jobs, _init_worker, (W, sim_params)) as pool:
+            collect(pool.map(_ensemble_block, tasks))
+
+    out = {"final": final}
+    if track_time:
+        out["over_time"] = over_time
+    return out
+
+
+# Global sensitivity analysis
+
+DEFAULT_BOUNDS = {
+    "decay_rate": (0.5, 2.0),
+    "dt": (0.05, 0.2),
+    "edge_noise": (0.0, 0.5),   # σ of the log-normal multiplicative noise on each edge of W
+}
+
+
+def network_hash(W):
+    h = hashlib.sha256()
+    if sparse.issparse(W):
+        W = sparse.csr_matrix(W)
+        for a in (W.indptr, W.indices, W.data):
+            h.update(np.ascontiguousarray(a).tobytes())
+    else:
+        h.update(np.ascontiguousarray(W, dtype=np.float64).tobytes())
+    h.update(str(W.shape).encode())
+    return h.hexdigest()
+
+
+def morris_design(n_params, n_trajectories, levels=4, seed=42):
+    """
+    Morris one-at-a-time trajectories in the unit cube.
+
+    Returns an array of shape (n_trajectories, n_params + 1, n_params) and the
+    step delta. Trajectory r is drawn from its own stream (seed, r), so adding
+    trajectories keeps the earlier ones unchanged.
+    """
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels // 2) / (levels - 1)     # start values that leave room for +delta
+    design = np.empty((n_trajectories, n_params + 1, n_params))
+    for r in range(n_trajectories):
+        rng = np.random.default_rng([seed, r])
+        x = rng.choice(grid, size=n_params)
+        design[r, 0] = x
+        for step, i in enumerate(rng.permutation(n_params)):
+            x = x.copy()
+            x[i] += delta
+            design[r, step + 1] = x
+    return design, delta
+
+
+def saltelli_design(n_params, n_base, seed=42):
+    """
+    Saltelli matrices A, B and AB_i (A with column i taken from B) from a
+    scrambled Sobol sequence. n_base is rounded up to a power of two; the
+    sequence is deterministic for a seed, so larger studies extend smaller ones.
+    """
+    m = int(np.ceil(np.log2(max(n_base, 2))))
+    base = qmc.Sobol(d=2 * n_params, scramble=True, seed=seed).random_base2(m)
+    A = base[:, :n_params]
+    B = base[:, n_params:]
+    AB = np.repeat(A[None], n_params, axis=0)
+    for i in range(n_params):
+        AB[i, :, i] = B[:, i]
+    return A, B, AB
+
+
+class SensitivityStudy:
+    """
+    Global sensitivity study of the ODE model around one network.
+
+    Parameters:
+        W: interaction matrix (dense or CSR)
+        bounds: {parameter: (low, high)} for "decay_rate", "dt" and "edge_noise"
+        cache_dir: directory for cached design-point outputs (None = no cache)
+        n_initial: number of random initial states averaged per design point
+            (the same states, drawn from `seed`, are used for every point)
+        time_steps, method, steady_tol: simulation settings (see ode_simulation)
+    """
+
+    def __init__(self, W, bounds=None, cache_dir=None, n_initial=64, seed=42,
+                 time_steps=TIME_STEPS, method="euler", steady_tol=None, n_jobs=None):
+        self.W = sparse.csr_matrix(W) if sparse.issparse(W) else np.asarray(W, dtype=np.float64)
+        self.bounds = dict(DEFAULT_BOUNDS if bounds is None else bounds)
+        self.names = list(self.bounds)
+        unknown = set(self.names) - set(DEFAULT_BOUNDS)
+        if unknown:
+            raise ValueError(f"Unknown sensitivity parameters: {sorted(unknown)}")
+        self.cache_dir = cache_dir
+        self.n_jobs = n_jobs
+        self.settings = {"network": network_hash(self.W), "n_initial": n_initial, "seed": seed,
+                         "time_steps": time_steps, "method": method, "steady_tol": steady_tol}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def to_params(self, unit):
+        """Map unit-cube points (..., n_params) to parameter values."""
+        low = np.array([self.bounds[n][0] for n in self.names])
+        high = np.array([self.bounds[n][1] for n in self.names])
+        return low + np.asarray(unit) * (high - low)
+
+    def _key(self, point):
+        payload = dict(self.settings, point={n: float(v) for n, v in zip(self.names, np.round(point, 12))})
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def evaluate(self, points):
+        """Per-gene outputs (n_points x genes) for parameter points (n_points x n_params)."""
+        points = np.atleast_2d(points)
+        keys = [self._key(p) for p in points]
+        out = np.empty((len(points), self.W.shape[0]))
+        todo = []
+        for k, key in enumerate(keys):
+            path = os.path.join(self.cache_dir, key + ".npy") if self.cache_dir else None
+            if path and os.path.exists(path):
+                out[k] = np.load(path)
+            else:
+                todo.append(k)
+        if not todo:
+            return out
+
+        tasks = [dict(zip(self.names, points[k])) for k in todo]
+        n_jobs = self.n_jobs or default_workers(len(tasks))
+        if n_jobs == 1:
+            _init_gsa_worker(self.W, self.settings, single_thread=False)
+            results = map(_evaluate_point, tasks)
+        else:
+            pool = process_pool(n_jobs, _init_gsa_worker, (self.W, self.settings))
+            results = pool.map(_evaluate_point, tasks, chunksize=max(1, len(tasks) // (4 * n_jobs)))
+        try:
+            for k, y in zip(todo, results):
+                out[k] = y
+                count("gsa_points_evaluated")
+                if self.cache_dir:
+                    np.save(os.path.join(self.cache_dir, keys[k] + ".npy"), y)
+        finally:
+            if n_jobs != 1:
+                pool.shutdown()
+        return out
+
+    def morris(self, n_trajectories=20, levels=4, seed=42):
+        """
+        Morris elementary effects. Returns {"mu_star", "mu", "sigma"}, each
+        n_params x genes (effects per unit of the scaled [0, 1] parameter range).
+        """
+        design, delta = morris_design(len(self.names), n_trajectories, levels, seed)
+        r, k1, k = design.shape
+        Y = self.evaluate(self.to_params(design.reshape(-1, k))).reshape(r, k1, -1)
+        effects = np.empty((r, k, Y.shape[-1]))
+        for t in range(r):
+            for step in range(k):
+                diff = design[t, step + 1] - design[t, step]
+                i = int(np.flatnonzero(diff)[0])
+                effects[t, i] = (Y[t, step + 1] - Y[t, step]) / diff[i]
+        return {"mu_star": np.abs(effects).mean(axis=0), "mu": effects.mean(axis=0),
+                "sigma": effects.std(axis=0, ddof=1) if r > 1 else np.zeros(effects.shape[1:])}
+
+    def sobol(self, n_base=256, seed=42):
+        """
+        Sobol indices from a Saltelli design (first order: Saltelli 2010,
+        total order: Jansen). Returns {"S1", "ST"}, each n_params x genes.
+        """
+        A, B, AB = saltelli_design(len(self.names), n_base, seed)
+        n, k = A.shape
+        Y = self.evaluate(self.to_params(np.concatenate([A, B, AB.reshape(-1, k)])))
+        YA, YB, YAB = Y[:n], Y[n:2 * n], Y[2 * n:].reshape(k, n, -1)
+        var = np.concatenate([YA, YB]).var(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            S1 = np.mean(YB[None] * (YAB - YA[None]), axis=1) / var
+            ST = 0.5 * np.mean((YA[None] - YAB) ** 2, axis=1) / var
+        return {"S1": S1, "ST": ST}
+
+
+# Worker state for design-point evaluation
+_gsa_W = None
+_gsa_settings = None
+_gsa_X0 = None
+_gsa_noise = None
+
+
+def _init_gsa_worker(W, settings, single_thread=True):
+    global _gsa_W, _gsa_settings, _gsa_X0, _gsa_noise
+    if single_thread:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    _gsa_W = W
+    _gsa_settings = settings
+    rng = np.random.default_rng(settings["seed"])
+    _gsa_X0 = rng.random((W.shape[0], settings["n_initial"]))
+    nnz = W.nnz if sparse.issparse(W) else W.size
+    _gsa_noise = rng.standard_normal(nnz)   # fixed edge-noise field, scaled by edge_noise
+
+
+def _evaluate_point(params):
+    """Mean final state per gene for one parameter point."""
+    W = _gsa_W
+    noise = params.get("edge_noise", 0.0)
+    if noise:
+        factor = np.exp(noise * _gsa_noise)
+        if sparse.issparse(W):
+            W = sparse.csr_matrix((W.data * factor, W.indices, W.indptr), shape=W.shape)
+        else:
+            W = W * factor.reshape(W.shape)
+    W = prepare_network(W)
+    s = _gsa_settings
+    traj = simulate_batch(W, _gsa_X0, [()] * _gsa_X0.shape[1],
+                          decay_rate=params.get("decay_rate", DECAY_RATE), dt=params.get("dt", DT),
+                          time_steps=s["time_steps"], steps=record_steps(s["time_steps"], "final"),
+                          method=s["method"], steady_tol=s["steady_tol"])
+    return traj[:, -1, :].mean(axis=0)
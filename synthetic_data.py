@@ -0,0 +1,142 @@
+"""
+Synthetic Inputs for Benchmarks
+
+Generators for every input of the pipeline, so stages can be timed at any
+size without access to patient data:
+
+    count_matrix / write_htseq_files   HTSeq-count files (Code 1)
+    log2cpm                            log2CPM matrix (Code 2, 10)
+    sparse_network                     Lasso-like interaction network (Code 3, 4)
+    gsva_table                         GSVA pathway x sample scores (Code 6, 7)
+    exhaustion_table                   lipid scores, exhaustion markers and
+                                       confounders (Code 8, 9)
+
+Expression has low-rank structure (a few latent factors shared by all genes)
+so that Lasso, correlation screening and LightGBM see realistic, correlated
+features rather than white noise. All generators take an explicit seed.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from pathway_scores import load_score_definitions
+
+EXHAUSTION_MARKERS = ["TOX", "TIGIT", "PRDM1", "PDCD1", "NR4A1", "LAG3", "HAVCR2", "EOMES", "ENTPD1",
+                      "CTLA4", "BATF"]
+HTSEQ_SPECIAL = ["__no_feature", "__ambiguous", "__too_low_aQual", "__not_aligned", "__alignment_not_unique"]
+
+
+def gene_ids(n_genes):
+    """Versioned Ensembl-style gene IDs."""
+    return [f"ENSG{i:011d}.1" for i in range(1, n_genes + 1)]
+
+
+def count_matrix(n_genes, n_samples, n_factors=10, dispersion=0.2, seed=0):
+    """
+    genes x samples negative-binomial read counts.
+
+    Gene means are log-normal, library sizes vary by sample and `n_factors`
+    latent factors shift the log means, which correlates the genes.
+    """
+    rng = np.random.default_rng(seed)
+    base = rng.normal(3.0, 2.0, size=(n_genes, 1))
+    loadings = rng.normal(0.0, 0.5, size=(n_genes, n_factors))
+    factors = rng.normal(size=(n_factors, n_samples))
+    library = rng.lognormal(0.0, 0.3, size=(1, n_samples))
+    mean = np.exp(base + loadings @ factors / np.sqrt(n_factors)) * library
+    # Negative binomial as a gamma-Poisson mixture
+    return rng.poisson(rng.gamma(1.0 / dispersion, mean * dispersion)).astype(np.float64)
+
+
+def log2cpm(counts):
+    """log2(CPM + 1) of a genes x samples count matrix."""
+    totals = counts.sum(axis=0, keepdims=True)
+    return np.log2(counts / np.where(totals > 0, totals, 1.0) * 1e6 + 1.0)
+
+
+def expression_matrix(n_genes, n_samples, seed=0):
+    """genes x samples log2CPM matrix (see count_matrix)."""
+    return log2cpm(count_matrix(n_genes, n_samples, seed=seed))
+
+
+def write_htseq_files(out_dir, counts, genes=None):
+    """
+    Write one HTSeq-count file per sample column of `counts` (gene ID, tab,
+    count, followed by the HTSeq summary lines). Returns the file paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    genes = gene_ids(counts.shape[0]) if genes is None else list(genes)
+    paths = []
+    for s in range(counts.shape[1]):
+        path = os.path.join(out_dir, f"sample_{s:05d}.txt")
+        with open(path, "w") as f:
+            f.writelines(f"{g}\t{int(c)}\n" for g, c in zip(genes, counts[:, s]))
+            f.writelines(f"{name}\t0\n" for name in HTSEQ_SPECIAL)
+        paths.append(path)
+    return paths
+
+
+def sparse_network(n_genes, density=0.01, scale=0.3, seed=0):
+    """
+    genes x genes CSR interaction matrix with about density x genes^2 nonzero
+    off-diagonal weights (Laplace-distributed, like Lasso coefficients).
+    """
+    rng = np.random.default_rng(seed)
+    nnz = int(round(density * n_genes * (n_genes - 1)))
+    rows = rng.integers(0, n_genes, nnz)
+    cols = rng.integers(0, n_genes, nnz)
+    keep = rows != cols
+    W = sparse.csr_matrix((rng.laplace(0.0, scale, int(keep.sum())), (rows[keep], cols[keep])),
+                          shape=(n_genes, n_genes))
+    W.sum_duplicates()
+    W.sort_indices()
+    return W
+
+
+def gsva_table(n_samples, n_pathways=None, definitions=None, seed=0):
+    """
+    pathways x samples DataFrame of GSVA-like scores in [-1, 1].
+
+    Contains every pathway used by the score definitions (default:
+    lipid_scores.json), padded with filler pathways up to n_pathways.
+    """
+    definitions = load_score_definitions() if definitions is None else definitions
+    pathways = list(dict.fromkeys(p for weights in definitions.values() for p in weights))
+    n_pathways = len(pathways) if n_pathways is None else max(n_pathways, len(pathways))
+    pathways += [f"GOBP_SYNTHETIC_PATHWAY_{i}" for i in range(n_pathways - len(pathways))]
+    rng = np.random.default_rng(seed)
+    values = np.tanh(rng.normal(0.0, 0.5, size=(n_pathways, n_samples)))
+    samples = [f"SAMPLE_{s}" for s in range(n_samples)]
+    return pd.DataFrame(values, index=pd.Index(pathways, name="Pathway"), columns=samples)
+
+
+def exhaustion_table(n_samples, n_markers=None, effect=0.5, seed=0):
+    """
+    samples x variables DataFrame for the causal analyses: age and sex
+    (confounders), the lipid accumulation and catabolic scores, the exhaustion
+    markers (EXHAUSTION_MARKERS, padded with synthetic markers up to n_markers)
+    and their mean, the exhaustion score.
+
+    Each marker depends linearly on the accumulation score (coefficient
+    `effect`) and on the confounders, so the true backdoor effect is known.
+    """
+    rng = np.random.default_rng(seed)
+    n_markers = len(EXHAUSTION_MARKERS) if n_markers is None else n_markers
+    markers = (EXHAUSTION_MARKERS + [f"MARKER_{i}" for i in range(max(0, n_markers - len(EXHAUSTION_MARKERS)))])
+    markers = markers[:n_markers]
+    age = rng.normal(60.0, 10.0, n_samples)
+    sex = rng.integers(0, 2, n_samples).astype(np.float64)
+    accumulation = 0.02 * (age - 60.0) + 0.3 * sex + rng.normal(size=n_samples)
+    catabolic = -0.5 * accumulation + rng.normal(size=n_samples)
+    expression = (effect * accumulation[:, None] + 0.01 * (age - 60.0)[:, None] - 0.2 * sex[:, None]
+                  + rng.normal(size=(n_samples, len(markers))))
+    table = pd.DataFrame(expression, columns=markers, index=[f"SAMPLE_{s}" for s in range(n_samples)])
+    table.insert(0, "Lipid_Catabolic_Score", catabolic)
+    table.insert(0, "Lipid_Accumulation_Score", accumulation)
+    table.insert(0, "sex", sex)
+    table.insert(0, "age", age)
+    table["exhaustion"] = table[markers].mean(axis=1)
+    return table
@@ -0,0 +1,42 @@
+import numpy as np
+from scipy import stats
+
+from causal_batch import adjusted_slopes, backdoor_effects
+from synthetic_data import exhaustion_table
+
+
+def test_adjusted_slopes_drop_collinear_confounders():
+    rng = np.random.default_rng(0)
+    age = rng.normal(60.0, 10.0, 50)
+    T = rng.normal(size=(50, 2)) + 0.05 * age[:, None]
+    Y = 0.5 * T[:, :1] + 0.02 * age[:, None] + rng.normal(size=(50, 1))
+    Z = np.column_stack([np.ones(50), age])
+    # A bootstrap resample in which a binary confounder (sex) happens to be constant
+    Z_constant_sex = np.column_stack([Z, np.ones(50)])
+    np.testing.assert_allclose(adjusted_slopes(Z_constant_sex, T, Y), adjusted_slopes(Z, T, Y), rtol=1e-10)
+
+
+
+def ols(y, X):
+    # Plain OLS: coefficients, standard errors and two-sided p-values
+    beta, *_ = np.linalg.lstsq(X, y, rcond=None)
+    dof = X.shape[0] - X.shape[1]
+    sigma2 = np.sum((y - X @ beta) ** 2) / dof
+    se = np.sqrt(sigma2 * np.diag(np.linalg.inv(X.T @ X)))
+    return beta, se, 2 * stats.t.sf(np.abs(beta / se), dof)
+
+
+def test_effects_match_ols_per_pair():
+    data = exhaustion_table(80, seed=3)
+    treatments = ["Lipid_Accumulation_Score", "Lipid_Catabolic_Score"]
+    outcomes = ["TOX", "PDCD1", "HAVCR2", "exhaustion", "Lipid_Catabolic_Score"]
+    table = backdoor_effects(data, treatments, outcomes, ["age", "sex"])
+
+    assert len(table) == len(treatments) * len(outcomes) - 1
+    assert not (table["treatment"] == table["outcome"]).any()
+    for row in table.itertuples(index=False):
+        X = np.column_stack([np.ones(len(data)), data[row.treatment], data["age"], data["sex"]])
+        beta, se, p_value = ols(data[row.outcome].to_numpy(), X)
+        np.testing.assert_allclose([row.estimate, row.std_error, row.p_value], [beta[1], se[1], p_value[1]],
+                                   rtol=1e-8)
+        assert row.n == len(data)
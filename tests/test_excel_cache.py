@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+import instrumentation
+from excel_cache import INDEX_FILE, file_hash, read_excel_cached
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    recorder = instrumentation.Recorder(str(tmp_path / "reports"))
+    monkeypatch.setattr(instrumentation, "_recorder", recorder)
+    return recorder
+
+
+def workbook(path, seed=0, n_rows=30):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame(rng.normal(size=(n_rows, 4)), columns=list("ABCD"),
+                         index=pd.Index([f"GENE{i}" for i in range(n_rows)], name="gene"))
+    frame.to_excel(path)
+    return path
+
+
+def entries(cache_dir):
+    with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+        return json.load(f)["entries"]
+
+
+def test_hit_equals_parse(tmp_path, recorder):
+    path = workbook(tmp_path / "data.xlsx")
+    cache = str(tmp_path / "cache")
+    parsed = read_excel_cached(path, cache_dir=cache, index_col=0)
+    cached = read_excel_cached(path, cache_dir=cache, index_col=0)
+    pdt.assert_frame_equal(parsed, pd.read_excel(path, index_col=0))
+    pdt.assert_frame_equal(cached, pd.read_excel(path, index_col=0))
+    assert recorder.counters == {"excel_files_parsed": 1, "excel_cache_hits": 1}
+    assert not [p for p in os.listdir(cache) if p.endswith(".tmp")]
+
+
+def test_changed_workbook_invalidates(tmp_path, recorder):
+    path = workbook(tmp_path / "data.xlsx", seed=0)
+    cache = str(tmp_path / "cache")
+    read_excel_cached(path, cache_dir=cache, index_col=0)
+    st = os.stat(path)
+    workbook(path, seed=1)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    pdt.assert_frame_equal(read_excel_cached(path, cache_dir=cache, index_col=0), pd.read_excel(path, index_col=0))
+    assert recorder.counters == {"excel_files_parsed": 2}
+
+
+def test_read_options_key_separate_entries(tmp_path, recorder):
+    path = workbook(tmp_path / "data.xlsx")
+    cache = str(tmp_path / "cache")
+    indexed = read_excel_cached(path, cache_dir=cache, index_col=0)
+    plain = read_excel_cached(path, cache_dir=cache)
+    pdt.assert_frame_equal(plain, pd.read_excel(path))
+    assert "gene" in plain.columns and "gene" not in indexed.columns
+    assert len(entries(cache)) == 2
+    assert recorder.counters == {"excel_files_parsed": 2}
+
+
+def test_lru_eviction_under_size_bound(tmp_path):
+    cache = str(tmp_path / "cache")
+    paths = [workbook(tmp_path / f"data{i}.xlsx", seed=i) for i in range(3)]
+    read_excel_cached(paths[0], cache_dir=cache, index_col=0)
+    entry_bytes = next(iter(entries(cache).values()))["bytes"]
+    bound = 2 * entry_bytes
+    read_excel_cached(paths[1], cache_dir=cache, max_bytes=bound, index_col=0)
+    read_excel_cached(paths[0], cache_dir=cache, max_bytes=bound, index_col=0)      # data0 is now most recent
+    read_excel_cached(paths[2], cache_dir=cache, max_bytes=bound, index_col=0)
+
+    kept = entries(cache)
+    assert len(kept) == 2
+    assert sum(e["bytes"] for e in kept.values()) <= bound
+    files = set(os.listdir(cache)) - {INDEX_FILE, "index.lock"}
+    assert files == {e["file"] for e in kept.values()}
+    evicted_digest = file_hash(paths[1])
+    assert not any(key.startswith(evicted_digest) for key in kept)
+
+
+def test_unreadable_cached_frame_is_a_miss(tmp_path, recorder):
+    path = workbook(tmp_path / "data.xlsx")
+    cache = str(tmp_path / "cache")
+    read_excel_cached(path, cache_dir=cache, index_col=0)
+    (entry,) = entries(cache).values()
+    with open(os.path.join(cache, entry["file"]), "r+b") as f:
+        f.truncate(16)
+    pdt.assert_frame_equal(read_excel_cached(path, cache_dir=cache, index_col=0), pd.read_excel(path, index_col=0))
+    pdt.assert_frame_equal(read_excel_cached(path, cache_dir=cache, index_col=0), pd.read_excel(path, index_col=0))
+    assert recorder.counters == {"excel_files_parsed": 2, "excel_cache_hits": 1}
+
+
+def test_multi_sheet_reads_bypass_the_cache(tmp_path):
+    path = workbook(tmp_path / "data.xlsx")
+    cache = str(tmp_path / "cache")
+    sheets = read_excel_cached(path, cache_dir=cache, sheet_name=None, index_col=0)
+    assert list(sheets) == ["Sheet1"]
+    pdt.assert_frame_equal(sheets["Sheet1"], pd.read_excel(path, index_col=0))
+    assert not os.path.exists(os.path.join(cache, INDEX_FILE))
+
+
+def test_concurrent_readers_keep_every_entry(tmp_path):
+    cache = str(tmp_path / "cache")
+    paths = [str(workbook(tmp_path / f"data{i}.xlsx", seed=i)) for i in range(6)]
+    with multiprocessing.get_context("fork").Pool(3) as pool:
+        frames = pool.starmap(read_excel_cached, [(p, cache) for p in paths * 2])
+    for path, frame in zip(paths * 2, frames):
+        pdt.assert_frame_equal(frame, pd.read_excel(path))
+    assert len(entries(cache)) == len(paths)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from feature_screen import screen_features
+from synthetic_data import expression_matrix
+
+
+def reference_screen(X, max_corr):
+    """Greedy deduplication on the full np.corrcoef matrix, genes visited by decreasing variance."""
+    corr = np.abs(np.corrcoef(X))
+    order = np.argsort(-X.var(axis=1, ddof=1), kind="stable")
+    kept, representative = [], {}
+    for gene in order:
+        if kept:
+            r = corr[gene, kept]
+            j = int(r.argmax())
+            if r[j] >= max_corr:
+                representative[gene] = (kept[j], r[j])
+                continue
+        kept.append(gene)
+    return sorted(kept), representative
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    rng = np.random.default_rng(4)
+    X = expression_matrix(60, 30, seed=4)
+    # Near-copies of some genes, so that a share of the genes is redundant
+    copies = X[rng.choice(60, 25, replace=False)] + rng.normal(0.0, 0.05, size=(25, 30))
+    return np.vstack([X, copies])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 7, 32, 1024])
+def test_chunked_screen_matches_full_correlation_matrix(matrix, chunk_size, tmp_path):
+    genes = [f"G{i}" for i in range(len(matrix))]
+    expected_kept, expected_rep = reference_screen(matrix, max_corr=0.9)
+    assert 0 < len(expected_rep) < len(matrix)
+
+    path = str(tmp_path / "X.npy")
+    np.save(path, matrix)
+    for X in (matrix, path):
+        kept, dropped = screen_features(X, genes, max_corr=0.9, chunk_size=chunk_size)
+        assert kept == [genes[i] for i in expected_kept]
+        assert set(dropped["reason"]) == {"correlated"}
+        assert dict(dropped["representative"]) == {genes[g]: genes[rep] for g, (rep, _) in expected_rep.items()}
+        np.testing.assert_allclose([dropped.loc[genes[g], "correlation"] for g in expected_rep],
+                                   [r for _, r in expected_rep.values()], rtol=1e-10)
+
+
+def test_variance_and_detection_filters():
+    X = expression_matrix(10, 20, seed=5)
+    X[2] = 1.0                                     # constant
+    X[5, :18] = 0.0                                # expressed in 2 of 20 samples
+    kept, dropped = screen_features(X, [f"G{i}" for i in range(10)], min_detection=0.2, max_corr=None)
+    assert dropped["reason"].to_dict() == {"G2": "low_variance", "G5": "low_detection"}
+    assert kept == [f"G{i}" for i in range(10) if i not in (2, 5)]
@@ -0,0 +1,109 @@
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+
+from go_annotation import AnnotationClient, GOAnnotationStore
+
+
+def hit(gene, *terms):
+    return {"query": gene, "go": {"BP": [{"term": t} for t in terms]}}
+
+
+def write_dump(path, hits):
+    with open(path, "w") as f:
+        f.writelines(json.dumps(h) + "\n" for h in hits)
+
+
+def test_refresh_keeps_store_unchanged_when_dump_is_unreadable(tmp_path):
+    good, bad = str(tmp_path / "v1.jsonl"), str(tmp_path / "v2.jsonl")
+    write_dump(good, [hit("ENSG1", "lipid storage"), hit("ENSG2", "cell cycle")])
+    with open(bad, "w") as f:
+        f.write(json.dumps(hit("ENSG3", "lipid transport")) + "\n{truncated\n")
+    with GOAnnotationStore(str(tmp_path / "go.sqlite")) as store:
+        store.refresh(good, "v1")
+        with pytest.raises(json.JSONDecodeError):
+            store.refresh(bad, "v2")
+        assert store.version == "v1"
+        assert store.genes_with_keyword("lipid") == {"ENSG1"}
+        assert store.missing(["ENSG1", "ENSG2", "ENSG3"]) == ["ENSG3"]
+
+
+def test_refresh_switches_version_and_evicts(tmp_path):
+    v1, v2 = str(tmp_path / "v1.jsonl"), str(tmp_path / "v2.jsonl")
+    write_dump(v1, [hit("ENSG1", "lipid storage"), hit("ENSG2", "lipid transport")])
+    write_dump(v2, [hit("ENSG2", "cell cycle"), hit("ENSG3", "lipid transport")])
+    with GOAnnotationStore(str(tmp_path / "go.sqlite")) as store:
+        store.refresh(v1, "v1")
+        assert store.refresh(v2, "v2") == 2
+        assert store.version == "v2"
+        assert store.genes_with_keyword("lipid") == {"ENSG3"}
+        assert store.missing(["ENSG1", "ENSG2"]) == ["ENSG1"]
+
+
+class FakeMyGene(http.server.BaseHTTPRequestHandler):
+    """mygene.info /query stand-in; replays the server's scripted failures before answering."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        ids = urllib.parse.parse_qs(body.decode())["q"][0].split(",")
+        self.server.requests.append(ids)
+        mode = self.server.script.pop(0) if self.server.script else "ok"
+        if mode == "error":
+            self.send_error(503)
+            return
+        payload = json.dumps([hit(g, "lipid metabolic process") for g in ids]).encode()
+        if mode == "malformed":
+            payload = b"<html>Service Unavailable</html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if mode == "truncated":
+            self.wfile.write(payload[:len(payload) // 2])     # fewer bytes than Content-Length
+            self.close_connection = True
+            return
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_mygene():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeMyGene)
+    server.script, server.requests = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def client(store, server, **kwargs):
+    return AnnotationClient(store, base_url=f"http://127.0.0.1:{server.server_address[1]}",
+                            max_workers=1, backoff=0.0, timeout=5, **kwargs)
+
+
+def test_annotate_retries_error_malformed_and_truncated_responses(tmp_path, fake_mygene):
+    fake_mygene.script = ["error", "malformed", "truncated"]
+    genes = [f"ENSG{i}.1" for i in range(40)]
+    with GOAnnotationStore(str(tmp_path / "go.sqlite")) as store:
+        failed = client(store, fake_mygene, batch_size=100, min_batch_size=10).annotate(genes)
+        assert failed == []
+        assert store.missing(genes) == []
+        assert len(store.genes_with_keyword("lipid")) == 40
+    # The first three requests fail; the retries (split as the batch size shrinks) cover every ID once
+    retried = [g for r in fake_mygene.requests[3:] for g in r]
+    assert sorted(retried) == sorted(g.split(".")[0] for g in genes)
+
+
+def test_annotate_reports_ids_that_keep_failing(tmp_path, fake_mygene):
+    fake_mygene.script = ["truncated"] * 3
+    with GOAnnotationStore(str(tmp_path / "go.sqlite")) as store:
+        failed = client(store, fake_mygene, max_retries=3).annotate(["ENSG1", "ENSG2"])
+        assert failed == ["ENSG1", "ENSG2"]
+        assert store.missing(["ENSG1", "ENSG2"]) == ["ENSG1", "ENSG2"]
+    assert len(fake_mygene.requests) == 3
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+import instrumentation
+
+REPO_DIR = os.path.dirname(os.path.abspath(instrumentation.__file__))
+
+
+def test_import_without_resource_module():
+    # As on Windows: no resource module (and no psutil)
+    code = ("import sys; sys.modules['resource'] = None; sys.modules['psutil'] = None; "
+            "import instrumentation; print(instrumentation.peak_rss_mb())")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_DIR)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "None"
+
+
+def test_report_without_peak_rss(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "peak_rss_mb", lambda: None)
+    recorder = instrumentation.Recorder(str(tmp_path))
+    monkeypatch.setattr(instrumentation, "_recorder", recorder)
+    instrumentation.step("1. Load")
+    with instrumentation.section("inner"):
+        instrumentation.count("rows", 3)
+    with open(recorder.report(str(tmp_path / "run.json"))) as f:
+        steps = json.load(f)["steps"]
+    assert [s["step"] for s in steps] == ["(startup)", "1. Load / inner", "1. Load"]
+    assert steps[1]["counters"] == {"rows": 3}
+    assert all(s["peak_rss_mb"] is None and s["peak_rss_growth_mb"] is None for s in steps)
+    assert os.path.exists(tmp_path / "run.csv")
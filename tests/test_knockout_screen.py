@@ -0,0 +1,23 @@
+import sqlite3
+
+import numpy as np
+
+from knockout_screen import QUERY_CHUNK, KnockoutScreen
+from synthetic_data import sparse_network
+
+
+def test_single_deltas_beyond_sqlite_variable_limit(tmp_path):
+    n_genes = 2 * QUERY_CHUNK + 50
+    with KnockoutScreen(sparse_network(n_genes, density=0.001, seed=0), str(tmp_path / "ko.sqlite"),
+                        time_steps=5) as screen:
+        # Stand-in deltas: the query, not the simulation, is under test
+        with screen.conn:
+            screen.conn.executemany("INSERT INTO singles (gene, effect, delta) VALUES (?, ?, ?)",
+                                    [(g, float(g), np.full(3, g, dtype=np.float64).tobytes())
+                                     for g in range(n_genes)])
+        screen.conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)   # the limit of older SQLite builds
+        genes = list(range(n_genes))
+        deltas = screen._single_deltas(genes)
+    assert sorted(deltas) == genes
+    assert all(np.array_equal(deltas[g], np.full(3, g)) for g in genes)
+
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LassoCV
+
+import instrumentation
+import lasso_network
+from lasso_network import (_FoldGram, all_nodes_lasso, compare_networks, infer_network, lassocv_network,
+                           stability_selection)
+from synthetic_data import expression_matrix
+
+
+def reference_network(X):
+    """The per-gene loop of the original Code 2."""
+    n_genes = X.shape[0]
+    interaction_matrix = np.zeros((n_genes, n_genes))
+    for i in range(n_genes):
+        y = X[i, :]
+        X_other = np.delete(X, i, axis=0).T
+        model = LassoCV(cv=5, random_state=42, max_iter=5000)
+        model.fit(X_other, y)
+        coefs = model.coef_
+        interaction_matrix[i, :i] = coefs[:i]
+        interaction_matrix[i, i + 1:] = coefs[i:]
+    return interaction_matrix
+
+
+X = expression_matrix(12, 40, seed=3)
+
+
+def test_network_inference_matches_serial_loop_bit_for_bit(tmp_path):
+    expected = reference_network(X)
+    assert np.count_nonzero(expected) > 0
+    assert np.array_equal(lassocv_network(X), expected)
+    assert np.array_equal(infer_network(X, str(tmp_path / "serial"), n_jobs=1), expected)
+    assert np.array_equal(infer_network(X, str(tmp_path / "parallel"), n_jobs=2), expected)
+
+
+def test_network_inference_resumes_from_completed_rows(tmp_path):
+    work_dir = str(tmp_path / "run")
+    expected = infer_network(X, work_dir, n_jobs=1)
+    done = np.load(f"{work_dir}/done.npy", mmap_mode="r+")
+    done[5:] = False                                 # as if interrupted after five genes
+    done.flush()
+    interaction = np.load(f"{work_dir}/interaction.npy", mmap_mode="r+")
+    interaction[5:] = 0.0
+    interaction.flush()
+    assert np.array_equal(infer_network(X, work_dir, n_jobs=2), expected)
+
+
+def test_interrupted_block_keeps_flushed_rows(tmp_path, monkeypatch):
+    work_dir = str(tmp_path / "run")
+    expected = reference_network(X)
+    fit_gene = lasso_network.fit_gene
+    calls = []
+
+    def interrupted_fit(design, y, lasso_params):
+        if len(calls) == 10:
+            raise KeyboardInterrupt
+        calls.append(1)
+        return fit_gene(design, y, lasso_params)
+
+    monkeypatch.setattr(lasso_network, "FLUSH_EVERY", 4)
+    monkeypatch.setattr(lasso_network, "fit_gene", interrupted_fit)
+    with pytest.raises(KeyboardInterrupt):
+        infer_network(X, work_dir, n_jobs=1)
+    # Ten genes were fitted; only the two flushed groups of four count as done
+    assert np.flatnonzero(np.load(f"{work_dir}/done.npy")).tolist() == list(range(8))
+
+    monkeypatch.setattr(lasso_network, "fit_gene", fit_gene)
+    assert np.array_equal(infer_network(X, work_dir, n_jobs=1), expected)
+
+
+def test_all_nodes_lasso_matches_per_gene_lassocv():
+    expected = reference_network(X)
+    expected_alpha = [LassoCV(cv=5, random_state=42, max_iter=5000).fit(np.delete(X, i, axis=0).T, X[i]).alpha_
+                      for i in range(X.shape[0])]
+    serial, alpha = all_nodes_lasso(X, gram=True)
+    np.testing.assert_allclose(alpha, expected_alpha, rtol=1e-12)
+    np.testing.assert_array_equal(serial != 0, expected != 0)
+    np.testing.assert_allclose(serial, expected, atol=1e-3)
+    for gram, n_jobs in ((False, 1), (True, 2), (False, 2)):
+        W, _ = all_nodes_lasso(X, gram=gram, n_jobs=n_jobs)
+        np.testing.assert_allclose(W, serial, rtol=1e-10, atol=1e-12)
+
+    # More genes than samples: same edges up to coefficients at the solver tolerance
+    X_wide = expression_matrix(30, 20, seed=3)
+    agreement = compare_networks(all_nodes_lasso(X_wide)[0], reference_network(X_wide))
+    assert agreement["edge_jaccard"] > 0.98 and agreement["max_abs_diff"] < 1e-2
+
+
+def test_fold_path_leaves_shared_arrays_untouched():
+    XT = X.T.copy()
+    for gram in (True, False):
+        fold = _FoldGram(XT, gram)
+        for a in (fold.Xc, fold.G):
+            if a is not None:
+                a.flags.writeable = False       # as pages shared with forked workers must stay
+        buffers = {}
+        coefs = fold.path(3, np.geomspace(1.0, 1e-3, 5), 5000, 1e-4, buffers=buffers)
+        assert np.all(coefs[3] == 0) and len(buffers) == 1
+
+
+def test_stability_resamples_do_not_count_as_fitted_genes(tmp_path, monkeypatch):
+    recorder = instrumentation.Recorder(str(tmp_path))
+    monkeypatch.setattr(instrumentation, "_recorder", recorder)
+    stability_selection(X, n_resamples=3, solver="gram", n_jobs=1)
+    stability_selection(X, n_resamples=2, solver="lassocv", n_jobs=1)
+    assert recorder.counters == {"stability_resamples": 5}
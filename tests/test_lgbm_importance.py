@@ -0,0 +1,54 @@
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from lgbm_importance import ImportanceEngine
+
+PARAMS = {"n_estimators": 30, "learning_rate": 0.1, "num_leaves": 7, "min_child_samples": 5,
+          "subsample": 0.8, "subsample_freq": 1, "colsample_bytree": 0.8}
+
+
+def stable_problem(n_samples=200, n_genes=20, seed=0):
+    """Three strong features, the rest noise: the top-3 ranking is the same for every seed."""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_samples, n_genes)), columns=[f"G{i}" for i in range(n_genes)])
+    y = 3.0 * X["G0"] + 2.0 * X["G1"] + 1.0 * X["G2"] + 0.1 * rng.normal(size=n_samples)
+    return X, y
+
+
+def test_run_adaptive_stops_early_on_stable_problem(tmp_path):
+    X, y = stable_problem()
+    with ImportanceEngine(str(tmp_path), n_jobs=1, num_threads=1) as engine:
+        engine.add_target("t", X, y, PARAMS)
+        runs = engine.run_adaptive("t", max_runs=30, top_k=3, tol=1.0, patience=2)
+    assert runs["converged"]
+    # The first batch sets the reference, two stable batches follow: 3 batches of the default size 4
+    assert len(runs["seeds"]) == 12 < 30
+    assert runs["history"] == [1.0, 1.0]
+    assert set(np.argsort(-runs["split"].mean(axis=0))[:3]) == {0, 1, 2}
+
+
+
+def test_split_importances_match_per_seed_regressor_loop(tmp_path):
+    X, y = stable_problem(n_samples=120, n_genes=15, seed=1)
+    params = dict(PARAMS, reg_alpha=0.05, reg_lambda=1.0, objective="regression", metric="rmse")
+    # The loop of the original Code 10
+    expected = np.array([lgb.LGBMRegressor(**params, random_state=42 + i, verbose=-1).fit(X, y)
+                         .feature_importances_ for i in range(5)])
+    with ImportanceEngine(str(tmp_path), n_jobs=1, num_threads=1) as engine:
+        engine.add_target("t", X, y, params)
+        runs = engine.run("t", range(42, 47))
+    np.testing.assert_array_equal(runs["split"], expected)
+
+
+def test_reregistered_target_uses_its_new_data(tmp_path):
+    X, y = stable_problem(seed=0)
+    X_new = X[X.columns[::-1]].set_axis(X.columns, axis=1)     # same shape, features reversed
+    with ImportanceEngine(str(tmp_path / "fresh"), n_jobs=1, num_threads=1) as engine:
+        engine.add_target("t", X_new, y, PARAMS)
+        expected = engine.run("t", [1, 2])["split"]
+    with ImportanceEngine(str(tmp_path / "reused"), n_jobs=1, num_threads=1) as engine:
+        engine.add_target("t", X, y, PARAMS)
+        engine.run("t", [1, 2])
+        engine.add_target("t", X_new, y, PARAMS)
+        np.testing.assert_array_equal(engine.run("t", [1, 2])["split"], expected)
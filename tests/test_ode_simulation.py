@@ -0,0 +1,92 @@
+from functools import partial
+
+import numpy as np
+from scipy import sparse
+
+import ode_simulation
+from ode_simulation import (DECAY_RATE, DT, TIME_STEPS, prepare_network, sigmoid, simulate_batch,
+                            simulate_knockouts, steady_state)
+from synthetic_data import sparse_network
+
+
+def reference_simulate_ode(W, inhibited_idx):
+    """simulate_ode of the original Code 3 (one mat-vec per time step)."""
+    x = np.random.rand(W.shape[0])
+    x[inhibited_idx] = 0.0
+    traj = np.zeros((TIME_STEPS, W.shape[0]))
+    for t in range(TIME_STEPS):
+        dxdt = -DECAY_RATE * x + sigmoid(W @ x)
+        x = x + dxdt * DT
+        x[inhibited_idx] = 0.0
+        traj[t] = x
+    return traj
+
+
+W_DENSE = sparse_network(30, density=0.2, seed=1).toarray()
+
+
+def batched(W, chunk_size, seed=None):
+    return np.concatenate([traj for _, traj in simulate_knockouts(W, range(W.shape[0]), seed=seed,
+                                                                   chunk_size=chunk_size)])
+
+
+def test_batched_knockouts_match_per_gene_loop():
+    np.random.seed(0)
+    expected = np.array([reference_simulate_ode(W_DENSE, i) for i in range(W_DENSE.shape[0])])
+    for chunk_size in (256, 7):
+        np.random.seed(0)                 # the global RNG is drawn in the same order as the loop
+        np.testing.assert_allclose(batched(W_DENSE, chunk_size), expected, rtol=1e-12, atol=1e-14)
+
+
+def test_seeded_runs_do_not_depend_on_chunking():
+    # Same initial state per gene; the mat-mat width only changes BLAS rounding
+    np.testing.assert_allclose(batched(W_DENSE, 256, seed=7), batched(W_DENSE, 4, seed=7),
+                               rtol=1e-12, atol=1e-14)
+
+
+def test_csr_kernel_matches_dense_simulation():
+    W = sparse_network(60, density=0.02, seed=2)
+    assert (W != 0).sum() > 0
+    W_csr = prepare_network(W.toarray())
+    assert sparse.isspmatrix_csr(W_csr)
+    assert isinstance(prepare_network(W.toarray(), density_threshold=0.0), np.ndarray)
+    dense = batched(W.toarray(), 256, seed=3)
+    np.testing.assert_allclose(batched(W_csr, 256, seed=3), dense, rtol=1e-12, atol=1e-14)
+    np.random.seed(1)
+    expected = np.array([reference_simulate_ode(W.toarray(), i) for i in range(W.shape[0])])
+    np.random.seed(1)
+    np.testing.assert_allclose(batched(W_csr, 16), expected, rtol=1e-12, atol=1e-14)
+
+
+def test_sparse_newton_matches_dense_newton():
+    W = sparse_network(80, density=0.03, scale=1.0, seed=4)
+    sets = [(i,) for i in range(0, 80, 8)] + [()]
+    X0 = np.random.default_rng(5).random((80, len(sets)))
+    # max_iter=0 skips the fixed-point phase, so every column is solved by Newton's method
+    X_sparse, ok_sparse = steady_state(prepare_network(W), X0, sets, max_iter=0)
+    X_dense, ok_dense = steady_state(W.toarray(), X0, sets, max_iter=0)
+    assert ok_sparse.all() and ok_dense.all()
+    np.testing.assert_allclose(X_sparse, X_dense, atol=1e-10)
+    residual = -DECAY_RATE * X_sparse + sigmoid(W @ X_sparse)
+    for b, ko in enumerate(sets):
+        residual[list(ko), b] = 0.0
+    assert np.abs(residual).max() < 1e-8
+
+
+def test_simulate_batch_reports_convergence_flags(capsys, monkeypatch):
+    W = prepare_network(sparse_network(40, density=0.05, seed=6))
+    sets = [(i,) for i in range(5)]
+    X0 = np.random.default_rng(7).random((40, 5))
+    _, converged = simulate_batch(W, X0, sets, steps=[TIME_STEPS - 1], method="steady", return_converged=True)
+    assert converged.all()
+    _, converged = simulate_batch(W, X0, sets, time_steps=400, steady_tol=1e-6, return_converged=True)
+    assert converged.all()
+    _, converged = simulate_batch(W, X0, sets, time_steps=3, steady_tol=1e-6, return_converged=True)
+    assert not converged.any()
+
+    # Without any iterations nothing converges; the unsolved runs are reported
+    monkeypatch.setattr(ode_simulation, "steady_state",
+                        partial(ode_simulation.steady_state, max_iter=0, newton_iter=0))
+    traj, converged = simulate_batch(W, X0, sets, steps=[TIME_STEPS - 1], method="steady", return_converged=True)
+    assert traj.shape == (5, 1, 40) and not converged.any()
+    assert "did not converge for 5 of 5 runs" in capsys.readouterr().out
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import excel_cache
+from pathway_scores import DEFAULT_CONFIG, load_score_definitions, load_score_table
+from synthetic_data import gsva_table
+
+
+@pytest.fixture
+def gsva_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(excel_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    gsva = gsva_table(40, n_pathways=60, seed=1)
+    gsva = gsva.drop(index="REACTOME_SPHINGOLIPID_CATABOLISM")      # a pathway missing from the results
+    path = tmp_path / "gsva_results.xlsx"
+    gsva.to_excel(path)
+    return path
+
+
+def baseline_scores(gsva_scores, pathway_weights):
+    # Steps 3-5 of the original Code 6 / Code 7
+    valid_pathways = [p for p in pathway_weights if p in gsva_scores.index]
+    weights = pd.Series(pathway_weights).loc[valid_pathways]
+    selected_scores = gsva_scores.loc[valid_pathways]
+    scores = (selected_scores.T * weights).T.sum()
+    z_scores = (scores - scores.mean()) / scores.std()
+    return scores, z_scores
+
+
+def test_score_table_matches_original_scripts(gsva_file, tmp_path):
+    scores, z = load_score_table(gsva_file, tmp_path / "pathway_scores.csv")
+    reread_scores, reread_z = load_score_table(gsva_file, tmp_path / "pathway_scores.csv")
+    gsva_scores = pd.read_excel(gsva_file, index_col=0)
+    for name, weights in load_score_definitions(DEFAULT_CONFIG).items():
+        expected, expected_z = baseline_scores(gsva_scores, weights)
+        for got, got_z in ((scores, z), (reread_scores, reread_z)):
+            np.testing.assert_allclose(got[name].loc[expected.index], expected, rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(got_z[name].loc[expected.index], expected_z, rtol=1e-12, atol=1e-12)
+
+
+def test_score_table_reused_when_fresh_and_rewritten_when_stale(gsva_file, tmp_path):
+    table = tmp_path / "pathway_scores.csv"
+    first, _ = load_score_table(gsva_file, table)
+    written = os.path.getmtime(table)
+
+    os.utime(table, (written + 10, written + 10))
+    load_score_table(gsva_file, table)
+    assert os.path.getmtime(table) == written + 10                   # fresh: read, not rewritten
+
+    gsva = pd.read_excel(gsva_file, index_col=0) * 2
+    gsva.to_excel(gsva_file)
+    os.utime(gsva_file, (written + 20, written + 20))
+    load_score_table(gsva_file, table)
+    rewritten, _ = load_score_table(gsva_file, table, refresh=False)
+    np.testing.assert_allclose(rewritten, 2 * first, rtol=1e-12)     # stale: rewritten from the new GSVA
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".tmp")]
+
+
+def test_read_only_load_does_not_write(gsva_file, tmp_path):
+    table = tmp_path / "pathway_scores.csv"
+    with pytest.raises(FileNotFoundError):
+        load_score_table(gsva_file, table, refresh=False)
+    assert not table.exists()
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+# Stub stage: upper-cases its input file into its output file
+STUB = """import os
+with open(os.environ["STUB_SRC"]) as f:
+    text = f.read()
+with open(os.environ["STUB_DST"], "w") as f:
+    f.write(text.upper())
+"""
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    script = tmp_path / "stub.py"
+    script.write_text(STUB)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "raw.txt").write_text("lipid")
+    (data_dir / "other.txt").write_text("exhaustion")
+
+    def stage(name, src, dst):
+        return Stage(name, str(script), inputs=[src], outputs=[dst], env={"STUB_SRC": src, "STUB_DST": dst})
+
+    def make():
+        # A new runner per run, as for separate invocations of pipeline.py
+        return Pipeline([stage("first", "raw.txt", "first.txt"), stage("second", "first.txt", "second.txt"),
+                         stage("other", "other.txt", "other_out.txt")], data_dir=str(data_dir), jobs=2)
+    return make, data_dir
+
+
+def test_unchanged_inputs_skip(pipeline):
+    make, data_dir = pipeline
+    assert make().run() == {"first": "ran", "second": "ran", "other": "ran"}
+    assert (data_dir / "second.txt").read_text() == "LIPID"
+    assert make().run() == {"first": "cached", "second": "cached", "other": "cached"}
+
+
+def test_input_edit_reruns_downstream_only(pipeline):
+    make, data_dir = pipeline
+    make().run()
+    (data_dir / "raw.txt").write_text("fatty acid")
+    assert make().run() == {"first": "ran", "second": "ran", "other": "cached"}
+    assert (data_dir / "second.txt").read_text() == "FATTY ACID"
+
+    # An edit that leaves the intermediate output unchanged stops at that stage
+    (data_dir / "raw.txt").write_text("FATTY ACID")
+    assert make().run() == {"first": "ran", "second": "cached", "other": "cached"}
+
+
+def test_outputs_restored_from_store(pipeline):
+    make, data_dir = pipeline
+    make().run()
+    (data_dir / "second.txt").unlink()
+    (data_dir / "first.txt").write_text("edited by hand")
+    assert make().run(["second"]) == {"first": "cached", "second": "cached"}
+    assert (data_dir / "first.txt").read_text() == "LIPID"
+    assert (data_dir / "second.txt").read_text() == "LIPID"
+
+
+def test_force_and_dry_run(pipeline):
+    make, data_dir = pipeline
+    make().run()
+    (data_dir / "other.txt").write_text("tox")
+    assert make().run(dry_run=True) == {"first": "cached", "second": "cached", "other": "pending"}
+    assert (data_dir / "other_out.txt").read_text() == "EXHAUSTION"
+    assert make().run(force={"first"}) == {"first": "ran", "second": "cached", "other": "ran"}
+    assert sorted(os.listdir(data_dir / ".pipeline" / "logs")) == ["first.log", "other.log", "second.log"]
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import instrumentation
+import sensitivity
+from ode_simulation import record_steps, simulate_batch
+from sensitivity import RunningStats, SensitivityStudy, morris_design, run_ensemble
+from synthetic_data import sparse_network
+
+W = sparse_network(25, density=0.2, seed=2).toarray()
+
+
+def test_running_stats_merge_matches_numpy_over_uneven_chunks():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(3.0, 1.0, size=(257, 4)) + 1e6       # large offset: naive sums would lose digits
+    bounds = [0, 1, 1, 8, 50, 51, 130, 257]                      # uneven, including an empty chunk
+    accumulators = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        acc = RunningStats(4)
+        for part in np.array_split(values[start:stop], 3):       # several updates per accumulator
+            acc.update(part)
+        accumulators.append(acc)
+    merged = accumulators[0]
+    for acc in accumulators[1:]:
+        merged.merge(acc)
+
+    assert merged.n == len(values)
+    np.testing.assert_allclose(merged.mean, values.mean(axis=0), rtol=1e-14)
+    np.testing.assert_allclose(merged.variance(ddof=1), values.var(axis=0, ddof=1), rtol=1e-9)
+    np.testing.assert_allclose(merged.std(), values.std(axis=0), rtol=1e-9)
+
+
+def test_ensemble_statistics_match_all_replicates():
+    n_replicates, block_size = 23, 5                             # last block is shorter
+    finals = []
+    for size, seed in zip([5, 5, 5, 5, 3], np.random.SeedSequence(7).spawn(5)):
+        X0 = np.random.default_rng(seed).random((W.shape[0], size))
+        finals.append(simulate_batch(W, X0, [()] * size, steps=record_steps(100, "final"))[:, -1, :])
+    finals = np.concatenate(finals)
+
+    for n_jobs in (1, 2):
+        final = run_ensemble(W, n_replicates, block_size=block_size, n_jobs=n_jobs, seed=7)["final"]
+        assert final.n == n_replicates
+        np.testing.assert_allclose(final.mean, finals.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(final.variance(ddof=1), finals.var(axis=0, ddof=1), rtol=1e-8, atol=1e-20)
+
+
+LINEAR = np.array([1.0, 2.0, 3.0])
+
+
+def analytic_outputs(params):
+    """Ishigami function (a = 7, b = 0.1) and a linear function of the three parameters."""
+    x = np.array([params["decay_rate"], params["dt"], params["edge_noise"]])
+    ishigami = np.sin(x[0]) + 7.0 * np.sin(x[1]) ** 2 + 0.1 * x[2] ** 4 * np.sin(x[0])
+    return np.array([ishigami, LINEAR @ x])
+
+
+@pytest.fixture
+def analytic_study(monkeypatch):
+    monkeypatch.setattr(sensitivity, "_evaluate_point", analytic_outputs)
+    bounds = {name: (-np.pi, np.pi) for name in ("decay_rate", "dt", "edge_noise")}
+    return SensitivityStudy(np.zeros((2, 2)), bounds=bounds, n_jobs=1)
+
+
+def test_sobol_indices_of_analytic_functions(analytic_study):
+    indices = analytic_study.sobol(n_base=2 ** 13)
+    # Known Ishigami indices; a linear function with equal ranges has S1 = ST = a_i^2 / sum(a^2)
+    np.testing.assert_allclose(indices["S1"][:, 0], [0.3139, 0.4424, 0.0], atol=0.02)
+    np.testing.assert_allclose(indices["ST"][:, 0], [0.5576, 0.4424, 0.2437], atol=0.02)
+    np.testing.assert_allclose(indices["S1"][:, 1], LINEAR ** 2 / np.sum(LINEAR ** 2), atol=0.01)
+    np.testing.assert_allclose(indices["ST"][:, 1], LINEAR ** 2 / np.sum(LINEAR ** 2), atol=0.01)
+
+
+def test_morris_elementary_effects_of_linear_function(analytic_study):
+    indices = analytic_study.morris(n_trajectories=10)
+    # Effects per unit of the scaled range: a_i x (high - low), the same along every trajectory
+    np.testing.assert_allclose(indices["mu_star"][:, 1], LINEAR * 2 * np.pi, rtol=1e-12)
+    np.testing.assert_allclose(indices["mu"][:, 1], LINEAR * 2 * np.pi, rtol=1e-12)
+    np.testing.assert_allclose(indices["sigma"][:, 1], 0.0, atol=1e-12)
+
+
+def test_design_points_cached_across_calls(tmp_path, monkeypatch):
+    recorder = instrumentation.Recorder(str(tmp_path / "reports"))
+    monkeypatch.setattr(instrumentation, "_recorder", recorder)
+    study = SensitivityStudy(W, cache_dir=str(tmp_path / "gsa"), n_initial=8, time_steps=20, n_jobs=1)
+
+    first = study.morris(n_trajectories=4)
+    assert recorder.counters["gsa_points_evaluated"] == 4 * 4
+    second = study.morris(n_trajectories=4)
+    assert recorder.counters["gsa_points_evaluated"] == 4 * 4
+    for name in first:
+        np.testing.assert_array_equal(second[name], first[name])
+
+    # Two more trajectories: only their points that are not cached yet are simulated
+    design, _ = morris_design(3, 6)
+    cached = {tuple(p) for p in design[:4].reshape(-1, 3)}
+    new_points = [p for p in design[4:].reshape(-1, 3) if tuple(p) not in cached]
+    study.morris(n_trajectories=6)
+    assert 0 < len(new_points) and recorder.counters["gsa_points_evaluated"] == 4 * 4 + len(new_points)
+    fresh = SensitivityStudy(W, cache_dir=str(tmp_path / "gsa"), n_initial=8, time_steps=20, n_jobs=1)
+    fresh.sobol(n_base=4)
+    fresh.sobol(n_base=4)
+    assert recorder.counters["gsa_points_evaluated"] == 4 * 4 + len(new_points) + 4 * 5
@@ -0,0 +1,47 @@
+import numpy as np
+
+from ode_simulation import record_steps, simulate_knockouts
+from synthetic_data import sparse_network
+from trajectory_store import TrajectoryStore, TrajectoryWriter, unique_sheet_names
+
+
+def test_write_read_round_trip(tmp_path):
+    W = sparse_network(12, density=0.3, seed=6).toarray()
+    genes = [f"GENE{i}" for i in range(12)]
+    knockouts = [(i,) for i in range(12)] + [(0, 1), ()]
+    steps = record_steps(100, every=10)
+    params = {"decay_rate": 1.0, "dt": 0.1}
+
+    expected = {}
+    with TrajectoryWriter(str(tmp_path), genes, knockouts, steps, params=params) as writer:
+        chunks = list(simulate_knockouts(W, knockouts, seed=0, chunk_size=4, steps=steps))
+        for ko_sets, traj in chunks[::-1] + [(chunks[0][0][::-1], chunks[0][1][::-1])]:
+            writer.write(ko_sets, traj)                    # out of order, and non-contiguous rows
+            expected.update(zip(map(tuple, ko_sets), traj))
+
+    store = TrajectoryStore(str(tmp_path))
+    assert len(store) == len(knockouts)
+    assert store.genes == genes and store.knockouts == knockouts and store.params == params
+    np.testing.assert_array_equal(store.steps, steps)
+    assert store.labels[0] == "GENE0" and store.labels[12] == "GENE0+GENE1" and store.labels[13] == "none"
+
+    tensor = np.array([expected[ko] for ko in knockouts])
+    assert tensor.shape == (len(knockouts), len(steps), len(genes))
+    np.testing.assert_array_equal(store.data, tensor)
+    np.testing.assert_array_equal(store.knockout("GENE0+GENE1"), tensor[12])
+    np.testing.assert_array_equal(store.knockout(3), tensor[3])
+    np.testing.assert_array_equal(store.gene("GENE5"), tensor[:, :, 5])
+    np.testing.assert_array_equal(store.gene(5), tensor[:, :, 5])
+    np.testing.assert_array_equal(store.final_states(), tensor[:, -1, :])
+
+
+def test_unique_sheet_names_truncate_and_resolve_collisions():
+    long_name = "GOBP_POSITIVE_REGULATION_OF_LIPID_CATABOLIC_PROCESS"
+    names = ["TOX", long_name, long_name + "_2", long_name[:29] + "~1", "TOX", 42]
+    out = unique_sheet_names(names)
+    assert out[0] == "TOX" and out[5] == "42"
+    assert out[1] == long_name[:31]
+    assert out[2] == long_name[:29] + "~1"                # same first 31 characters
+    assert out[3] == long_name[:29] + "~2"                # collides with the suffixed name above
+    assert out[4] == "TOX~1"
+    assert len(set(out)) == len(out) and all(len(n) <= 31 for n in out)
@@ -0,0 +1,126 @@
+"""
+Chunked Binary Trajectory Store
+
+Knockout x time x gene tensor of simulated trajectories, written chunk by chunk
+while the simulation runs and read back by memory mapping, so neither side has
+to hold more than one chunk in memory.
+
+Directory layout:
+    trajectories.npy   knockouts x recorded time steps x genes (memmap)
+    genes.txt          one gene name per line (last axis)
+    meta.json          knockout labels and gene sets, recorded time steps and
+                       simulation parameters
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class TrajectoryWriter:
+    """
+    Pre-allocates the tensor for `knockouts` and fills it as chunks arrive.
+
+    Parameters:
+        path: output directory
+        genes: gene names (last axis)
+        knockouts: list of knockout gene-index tuples, in storage order
+        labels: display name of each knockout (default: joined gene names)
+        steps: recorded time-step indices (see ode_simulation.record_steps)
+        params: simulation parameters stored with the tensor
+    """
+
+    def __init__(self, path, genes, knockouts, steps, labels=None, params=None, dtype=np.float64):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.knockouts = [tuple(int(i) for i in ko) for ko in knockouts]
+        if labels is None:
+            labels = ["+".join(genes[i] for i in ko) or "none" for ko in self.knockouts]
+        self.row = {ko: r for r, ko in enumerate(self.knockouts)}
+        self.data = np.lib.format.open_memmap(
+            os.path.join(path, "trajectories.npy"), mode="w+", dtype=dtype,
+            shape=(len(self.knockouts), len(steps), len(genes)))
+        with open(os.path.join(path, "genes.txt"), "w") as f:
+            f.write("\n".join(genes) + "\n")
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({
+                "labels": list(labels),
+                "knockouts": [list(ko) for ko in self.knockouts],
+                "steps": [int(t) for t in steps],
+                "params": params or {},
+            }, f)
+
+    def write(self, knockout_sets, trajectories):
+        """Store a chunk (as yielded by ode_simulation.simulate_knockouts)."""
+        rows = [self.row[tuple(ko)] for ko in knockout_sets]
+        if rows == list(range(rows[0], rows[0] + len(rows))):
+            self.data[rows[0]:rows[0] + len(rows)] = trajectories
+        else:
+            self.data[rows] = trajectories
+
+    def close(self):
+        self.data.flush()
+        del self.data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryStore:
+    """Memory-mapped reader for a trajectory directory."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.load(os.path.join(path, "trajectories.npy"), mmap_mode="r")
+        with open(os.path.join(path, "genes.txt")) as f:
+            self.genes = f.read().splitlines()
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.labels = meta["labels"]
+        self.knockouts = [tuple(ko) for ko in meta["knockouts"]]
+        self.steps = np.asarray(meta["steps"])
+        self.params = meta["params"]
+        self._gene_pos = {g: i for i, g in enumerate(self.genes)}
+        self._label_pos = {l: i for i, l in enumerate(self.labels)}
+
+    def _knockout_pos(self, knockout):
+        if isinstance(knockout, str):
+            return self._label_pos[knockout]
+        return int(knockout)
+
+    def knockout(self, knockout):
+        """recorded steps x genes trajectory of one knockout (label or row index)."""
+        return np.asarray(self.data[self._knockout_pos(knockout)])
+
+    def gene(self, gene):
+        """knockouts x recorded steps trajectory of one gene (name or column index)."""
+        col = self._gene_pos[gene] if isinstance(gene, str) else int(gene)
+        return np.asarray(self.data[:, :, col])
+
+    def final_states(self):
+        """knockouts x genes matrix of the last recorded state."""
+        return np.asarray(self.data[:, -1, :])
+
+    def __len__(self):
+        return len(self.knockouts)
+
+
+def unique_sheet_names(names, limit=31):
+    """Excel-safe sheet names: truncated to `limit` characters without collisions."""
+    used = set()
+    out = []
+    for name in names:
+        base = str(name)[:limit]
+        candidate = base
+        k = 1
+        while candidate in used:
+            suffix = f"~{k}"
+            candidate = base[:limit - len(suffix)] + suffix
+            k += 1
+        used.add(candidate)
+        out.append(candidate)
+    return out